@@ -26,14 +26,16 @@ import openai
 import tempfile
 import time
 import re
+import uuid
 import markdown
 from pathlib import Path
 from dotenv import load_dotenv
 import utils
 from utils import (
     transcribe_audio_whisper, audio_info,
-    format_text, split_markdown_text, process_documents,
-    num_tokens_from_string, split_text, process_text_chunks,
+    format_text, split_markdown_text, process_documents_stream,
+    num_tokens_from_string, split_text_by_tokens, process_text_chunks_stream,
+    TEXT_CHUNK_MAX_TOKENS, HANDBOOK_TREE_MIN_TOKENS, ChunkProcessingError, summarize_documents_tree, section_text,
     save_text_to_docx, markdown_to_docx, setup_ffmpeg_path
 )
 from youtube_service import YouTubeDownloader
@@ -41,11 +43,20 @@ from gdrive_service import GoogleDriveDownloader
 from instagram_service import InstagramDownloader
 from yandex_disk_service import YandexDiskDownloader
 from vk_video_service import VKVideoDownloader
+from rate_limiter import current_session_id
+from llm_cache import llm_cache_bypass
+from pipeline import run_pipeline
+from bulk_jobs import run_bulk_jobs
 import platform
 
 # Загрузка переменных окружения из файла .env
 load_dotenv()
 
+# Идентификатор сессии для справедливой очереди запросов к OpenAI между сессиями
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+current_session_id.set(st.session_state.session_id)
+
 # Получаем API ключ из Streamlit Secrets
 if 'OPENAI_API_KEY' in st.secrets:
     openai.api_key = st.secrets['OPENAI_API_KEY']
@@ -175,6 +186,63 @@ def create_download_buttons(file_dir):
     except Exception as e:
         st.error(f"Ошибка при создании ZIP-архива: {str(e)}")
 
+# Функция для потокового вывода ответа модели на страницу
+def render_stream(text_stream):
+    """
+    Выводит фрагменты ответа по мере генерации и возвращает итоговый текст,
+    который сохраняется в файлы (TextStream.text)
+    """
+    st.write_stream(text_stream)
+    return text_stream.text
+
+# Функция транскрибации с разбивкой на абзацы; в конвейерном режиме одновременно выполняется перевод
+def transcribe_with_paragraphs(audio_path, file_name, target_language, pipelined=False):
+    """
+    Возвращает транскрипцию, разбитую на абзацы, язык оригинала и перевод.
+    В конвейерном режиме (pipeline.run_pipeline) готовые фрагменты разбиваются на абзацы
+    и переводятся, пока следующие фрагменты ещё транскрибируются; иначе перевод - None
+    и выполняется отдельным шагом.
+    """
+    if pipelined:
+        result = run_pipeline(audio_path, file_name, TEMP_FILES_DIR, target_language)
+        return result.paragraphs, result.language, result.translation
+    transcription, original_language = transcribe_audio_whisper(
+        audio_path=audio_path,
+        file_title=file_name,
+        save_folder_path=TEMP_FILES_DIR  # Сохраняем рабочий файл во временную директорию
+    )
+    return utils.format_transcription_paragraphs(transcription), original_language, None
+
+# Функция, возвращающая промпты для создания конспекта
+def handbook_prompts(target_language):
+    """
+    Возвращает системный и пользовательский промпты формирования конспекта из раздела
+    """
+    # Получаем языковые инструкции для более строгого указания языка
+    lang_instruction = get_language_instruction(target_language)
+
+    # Системный промпт для формирования конспекта
+    system_prompt_handbook = f"""Ты гений копирайтинга. Ты получаешь раздел необработанного текста по определенной теме.
+Нужно из этого текста выделить самую суть, только самое важное, сохранив все нужные подробности и детали,
+но убрав всю "воду" и слова (предложения), не несущие смысловой нагрузки.
+ОЧЕНЬ ВАЖНО: {lang_instruction}
+Ты ДОЛЖЕН писать ВЕСЬ текст ТОЛЬКО на {target_language} языке. НЕ ИСПОЛЬЗУЙ другие языки вообще."""
+
+    # Пользовательский промпт для формирования конспекта
+    user_prompt_handbook = f"""Из данного текста выдели только ключевую и ценную с точки зрения темы раздела информацию.
+Удали всю "воду". В итоге у тебя должен получится раздел для конспекта по указанной теме. Опирайся
+только на данный тебе текст, не придумывай ничего от себя. Ответ нужен в формате:
+## Название раздела, и далее выделенная тобой ценная информация из текста. Используй маркдаун-разметку для выделения важных моментов:
+**жирный текст** для важных фактов, *курсив* для определений, списки для перечислений и т.д.
+
+ОЧЕНЬ ВАЖНО: {lang_instruction}
+Ты ДОЛЖЕН писать ВЕСЬ текст ТОЛЬКО на {target_language} языке.
+НЕ ИСПОЛЬЗУЙ русский или любой другой язык, кроме {target_language}.
+
+Весь твой ответ должен быть на {target_language} языке, включая все заголовки, выделения и пояснения."""
+
+    return system_prompt_handbook, user_prompt_handbook
+
 # Функция для создания конспекта из текста транскрибации с уникальными именами файлов
 def create_handbook(text, save_path, original_filename, target_language="русский", save_txt=True, save_docx=True):
     st.write("### Создаем конспект из транскрибации...")
@@ -195,34 +263,13 @@ def create_handbook(text, save_path, original_filename, target_language="рус
     tokens = num_tokens_from_string(text)
     st.write(f"Количество токенов в тексте: {tokens}")
 
-    # Получаем языковые инструкции для более строгого указания языка
-    lang_instruction = get_language_instruction(target_language)
-
-    # Системный промпт для разделения текста на разделы
-    system_prompt = f"""Вы гений текста, копирайтинга, писательства. Ваша задача распознать разделы в тексте
-и разбить его на эти разделы сохраняя весь текст на 100%. {lang_instruction}"""
-
-    # Пользовательский промпт для разделения текста
-    user_prompt = f"""Пожалуйста, давайте подумаем шаг за шагом: Подумайте, какие разделы в тексте вы можете
-распознать и какое название по смыслу можно дать каждому разделу. Далее напишите ответ по всему
-предыдущему ответу и оформи в порядке:
-## Название раздела, после чего весь текст, относящийся к этому разделу. {lang_instruction} Текст:"""
-
-    # В зависимости от размера текста либо обрабатываем текст целиком, либо делим на чанки
-    md_processed_text = ""
+    # Промпты формирования конспекта
+    system_prompt_handbook, user_prompt_handbook = handbook_prompts(target_language)
 
+    # Модель возвращает только названия разделов и номера предложений, с которых они начинаются;
+    # текст с разделами собирается локально, поэтому весь текст сохраняется без изменений
     with st.spinner("Обрабатываем текст, разбивая на разделы..."):
-        # Если текст небольшой (менее 16к токенов для безопасности), обрабатываем целиком
-        if tokens < 16000:
-            md_processed_text = utils.generate_answer(system_prompt, user_prompt, text)
-        # Иначе разбиваем на чанки и обрабатываем по частям
-        else:
-            st.write("Текст слишком большой, разбиваем на части...")
-            # Разбиваем текст на чанки
-            text_chunks = split_text(text, chunk_size=30000, chunk_overlap=1000)
-            st.write(f"Текст разбит на {len(text_chunks)} частей")
-            # Обрабатываем каждый чанк отдельно
-            md_processed_text = process_text_chunks(text_chunks, system_prompt, user_prompt)
+        md_processed_text = section_text(text, target_language)
 
     # Сохраняем промежуточный текст с разделами в txt файл в папке для временных файлов
     with open(md_text_path, "w", encoding="utf-8") as f:
@@ -243,36 +290,33 @@ def create_handbook(text, save_path, original_filename, target_language="рус
         except:
             pass
 
-    # Системный промпт для формирования конспекта
-    system_prompt_handbook = f"""Ты гений копирайтинга. Ты получаешь раздел необработанного текста по определенной теме.
-Нужно из этого текста выделить самую суть, только самое важное, сохранив все нужные подробности и детали,
-но убрав всю "воду" и слова (предложения), не несущие смысловой нагрузки.
-ОЧЕНЬ ВАЖНО: {lang_instruction}
-Ты ДОЛЖЕН писать ВЕСЬ текст ТОЛЬКО на {target_language} языке. НЕ ИСПОЛЬЗУЙ другие языки вообще."""
-
-    # Пользовательский промпт для формирования конспекта
-    user_prompt_handbook = f"""Из данного текста выдели только ключевую и ценную с точки зрения темы раздела информацию.
-Удали всю "воду". В итоге у тебя должен получится раздел для конспекта по указанной теме. Опирайся
-только на данный тебе текст, не придумывай ничего от себя. Ответ нужен в формате:
-## Название раздела, и далее выделенная тобой ценная информация из текста. Используй маркдаун-разметку для выделения важных моментов:
-**жирный текст** для важных фактов, *курсив* для определений, списки для перечислений и т.д.
-
-ОЧЕНЬ ВАЖНО: {lang_instruction}
-Ты ДОЛЖЕН писать ВЕСЬ текст ТОЛЬКО на {target_language} языке.
-НЕ ИСПОЛЬЗУЙ русский или любой другой язык, кроме {target_language}.
-
-Весь твой ответ должен быть на {target_language} языке, включая все заголовки, выделения и пояснения."""
-
-    with st.spinner("Формируем конспект из разделов..."):
-        # Обработка каждого документа (раздела) для формирования конспекта
-        handbook_md_text = process_documents(
-            TEMP_FILES_DIR,
-            chunks_md_splits,
-            system_prompt_handbook,
-            user_prompt_handbook,
-            original_filename,
-            target_language
-        )
+    handbook_expander = st.expander("Просмотр конспекта", expanded=True)
+    with handbook_expander:
+        handbook_placeholder = st.empty()
+    if tokens > HANDBOOK_TREE_MIN_TOKENS:
+        # Длинный текст: конспекты разделов сворачиваются по уровням, чтобы конспект остался ограниченного размера
+        with st.spinner("Формируем конспект из разделов и сжимаем его по уровням..."):
+            handbook_md_text = summarize_documents_tree(
+                TEMP_FILES_DIR,
+                chunks_md_splits,
+                system_prompt_handbook,
+                user_prompt_handbook,
+                original_filename,
+                target_language
+            )
+    else:
+        # Конспект выводится по мере генерации разделов
+        with st.spinner("Формируем конспект из разделов..."):
+            with handbook_placeholder.container():
+                # Обработка каждого документа (раздела) для формирования конспекта
+                handbook_md_text = render_stream(process_documents_stream(
+                    TEMP_FILES_DIR,
+                    chunks_md_splits,
+                    system_prompt_handbook,
+                    user_prompt_handbook,
+                    original_filename,
+                    target_language
+                ))
 
     # Сохраняем черновик конспекта в файл для временных данных
     with open(handbook_path, "w", encoding="utf-8") as f:
@@ -289,10 +333,10 @@ def create_handbook(text, save_path, original_filename, target_language="рус
         markdown_to_docx(handbook_md_text, handbook_export_docx_path)
         st.success(f"Конспект успешно создан и сохранен в DOCX: {handbook_export_docx_path}")
 
-    # Создаем текстовую область с конспектом для просмотра и копирования
-    with st.expander("Просмотр конспекта", expanded=False):
+    # Заменяем потоковый вывод итоговым конспектом для просмотра и копирования
+    with handbook_expander:
         handbook_html = markdown.markdown(handbook_md_text)
-        st.markdown(handbook_html, unsafe_allow_html=True)
+        handbook_placeholder.markdown(handbook_html, unsafe_allow_html=True)
         st.info("Для копирования выделите текст выше и нажмите Ctrl+C")
 
     # Добавляем возможность скачивания файлов конспекта
@@ -300,8 +344,111 @@ def create_handbook(text, save_path, original_filename, target_language="рус
 
     return handbook_md_text, md_processed_text
 
+# Функция пакетной обработки файлов папки через Batch API
+def process_files_in_bulk(downloaded_files, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False):
+    """
+    Транскрибирует все файлы (Batch API не принимает аудио, поэтому транскрибация
+    выполняется обычными запросами), затем отправляет разбивку на абзацы, перевод
+    и конспект всех файлов через Batch API (bulk_jobs.run_bulk_jobs) и сохраняет
+    результаты в папки файлов под теми же именами, что и при обычной обработке.
+
+    Returns:
+        Кортеж из списков транскрипций (имя, оригинал, перевод), конспектов
+        (имя, конспект, текст с разделами) и папок обработанных файлов
+    """
+    all_transcriptions = []
+    all_handbooks = []
+    all_processed_dirs = []
+
+    transcripts = []
+    for file_path in downloaded_files:
+        if file_path is None or not os.path.exists(file_path):
+            st.warning(f"Пропускаем некорректный файл")
+            continue
+
+        file_name = Path(file_path).stem
+        with st.spinner(f"Выполняем транскрибацию файла {file_name}..."):
+            try:
+                transcription, original_language = transcribe_audio_whisper(
+                    audio_path=file_path,
+                    file_title=file_name,
+                    save_folder_path=TEMP_FILES_DIR
+                )
+            except Exception as e:
+                st.error(f"Ошибка при транскрибации файла {file_name}: {str(e)}")
+                continue
+        transcripts.append((file_name, transcription, original_language))
+    if not transcripts:
+        return all_transcriptions, all_handbooks, all_processed_dirs
+    st.success(f"Транскрибировано файлов: {len(transcripts)}")
+
+    summary_prompts = handbook_prompts(target_language) if create_handbook_option else None
+
+    # Состояние текущего пакета обновляется при каждой проверке
+    batch_status_text = st.empty()
+
+    def show_batch_status(status):
+        batch_status_text.text(
+            f"Пакет {status['id']}: {status['status']}, выполнено запросов {status['completed']} из "
+            f"{status['requests']} (ошибок {status['failed']}), прошло {status['elapsed'] / 60:.1f} мин."
+        )
+
+    st.info("Запросы к модели для всех файлов отправлены через Batch API. Выполнение пакета может занять до 24 часов.")
+    with st.spinner("Ожидаем выполнения пакетов..."):
+        results = run_bulk_jobs(
+            transcripts,
+            target_language,
+            TEMP_FILES_DIR,
+            os.path.join(TEMP_FILES_DIR, "batches"),
+            summary_prompts,
+            on_status=show_batch_status
+        )
+
+    for result in results:
+        file_name = result.file_name
+        st.subheader(f"Результаты файла: {file_name}")
+        if result.error:
+            st.error(f"Ошибка при пакетной обработке файла {file_name}: {result.error}")
+
+        # Создаем отдельную папку для файла в директории экспорта
+        file_dir = os.path.join(save_path, file_name)
+        os.makedirs(file_dir, exist_ok=True)
+        all_processed_dirs.append(file_dir)
+        st.session_state.last_processed_dir = file_dir
+        st.session_state.processed_dirs.append(file_dir)
+
+        transcription = result.transcription
+        translated_text = result.translation if result.translation is not None else transcription
+        all_transcriptions.append((file_name, transcription, translated_text))
+
+        # Сохраняем оригинал и перевод (или оригинал, если перевод не нужен)
+        for prefix, text in (("Original", transcription), (target_language.capitalize(), translated_text)):
+            if save_txt:
+                with open(os.path.join(file_dir, f"{prefix}_{file_name}.txt"), "w", encoding="utf-8") as f:
+                    f.write(text)
+            if save_docx:
+                save_text_to_docx(text, os.path.join(file_dir, f"{prefix}_{file_name}.docx"))
+
+        # Сохраняем конспект и текст с разделами
+        if result.handbook is not None:
+            with open(os.path.join(MARKDOWN_DIR, f"{file_name}_processed_md_text.txt"), "w", encoding="utf-8") as f:
+                f.write(result.md_processed_text)
+            if save_txt:
+                with open(os.path.join(file_dir, f"Summary_{file_name}.txt"), "w", encoding="utf-8") as f:
+                    f.write(result.handbook)
+            if save_docx:
+                markdown_to_docx(result.handbook, os.path.join(file_dir, f"Summary_{file_name}.docx"))
+            all_handbooks.append((file_name, result.handbook, result.md_processed_text))
+            with st.expander("Просмотр конспекта"):
+                st.markdown(markdown.markdown(result.handbook), unsafe_allow_html=True)
+
+        st.text_area("Транскрибация", translated_text, height=200, key=f"bulk_text_{file_name}")
+        create_download_buttons(file_dir)
+
+    return all_transcriptions, all_handbooks, all_processed_dirs
+
 # Функция для обработки загруженных локальных файлов
-def process_uploaded_file(uploaded_file, save_dir, file_name, target_language, save_txt=True, save_docx=True, create_handbook_option=False):
+def process_uploaded_file(uploaded_file, save_dir, file_name, target_language, save_txt=True, save_docx=True, create_handbook_option=False, pipelined=False):
     # Инициализируем переменную transcription как None
     transcription = None
 
@@ -321,13 +468,34 @@ def process_uploaded_file(uploaded_file, save_dir, file_name, target_language, s
         st.write(f"Частота дискретизации: {audio_data.frame_rate} Гц")
         st.write(f"Количество каналов: {audio_data.channels}")
 
+        # Получаем языковые инструкции для более строгого указания языка
+        lang_instruction = get_language_instruction(target_language)
+        system_prompt = f"""Вы профессиональный переводчик. {lang_instruction}"""
+        user_prompt = f"""Переведите следующий текст на {target_language} язык,
+                        сохраняя оригинальный смысл, стиль и форматирование. Не добавляйте замечаний от переводчика.
+                        Не добавляйте вступлений или заключений. {lang_instruction}"""
+
+        # Перевод одного фрагмента в конвейерном режиме (тот же выбор, что и для всего текста)
+        async def translate_fragment(text):
+            if num_tokens_from_string(text) <= TEXT_CHUNK_MAX_TOKENS:
+                return await utils.generate_answer_async(system_prompt, user_prompt, text)
+            return await utils.process_text_chunks_async(split_text_by_tokens(text), system_prompt, user_prompt)
+
         # Транскрибация аудио с помощью Whisper API
         with st.spinner("Транскрибация аудио..."):
-            transcription, original_language = transcribe_audio_whisper(
-                audio_path=tmp_file_path,
-                file_title=file_name,
-                save_folder_path=TEMP_FILES_DIR
-            )
+            pipelined_translation = None
+            if pipelined:
+                # Фрагменты переводятся, пока следующие фрагменты ещё транскрибируются
+                result = run_pipeline(tmp_file_path, file_name, TEMP_FILES_DIR, target_language,
+                                      format_paragraphs=False, translator=translate_fragment, force_translation=True)
+                transcription, original_language = result.transcription, result.language
+                pipelined_translation = result.translation
+            else:
+                transcription, original_language = transcribe_audio_whisper(
+                    audio_path=tmp_file_path,
+                    file_title=file_name,
+                    save_folder_path=TEMP_FILES_DIR
+                )
 
             if transcription:
                 formatted_text = format_text(transcription)
@@ -352,32 +520,35 @@ def process_uploaded_file(uploaded_file, save_dir, file_name, target_language, s
 
                 # Переводим транскрибацию на заданный язык, если транскрибация не на этом языке
                 if target_language:
-                    # Получаем языковые инструкции для более строгого указания языка
-                    lang_instruction = get_language_instruction(target_language)
-
                     st.write(f"Переводим текст на {target_language}...")
                     with st.spinner(f"Переводим на {target_language}..."):
-                        system_prompt = f"""Вы профессиональный переводчик. {lang_instruction}"""
-                        user_prompt = f"""Переведите следующий текст на {target_language} язык,
-                        сохраняя оригинальный смысл, стиль и форматирование. Не добавляйте замечаний от переводчика.
-                        Не добавляйте вступлений или заключений. {lang_instruction}"""
-
                         # Определяем размер текста в токенах
                         tokens = num_tokens_from_string(formatted_text)
                         st.write(f"Количество токенов в тексте: {tokens}")
 
                         translated_text = ""
-
+                        # Перевод выводится по мере генерации, в файлы сохраняется итоговый текст
+                        translation_expander = st.expander(f"Просмотреть текст на {target_language}", expanded=True)
+
+                        # В конвейерном режиме перевод уже выполнен во время транскрибации
+                        if pipelined_translation is not None:
+                            translated_text = pipelined_translation
+                            with translation_expander:
+                                st.write(translated_text)
                         # В зависимости от размера текста либо обрабатываем текст целиком, либо делим на чанки
-                        if tokens < 16000:
-                            translated_text = utils.generate_answer(system_prompt, user_prompt, formatted_text)
+                        elif tokens <= TEXT_CHUNK_MAX_TOKENS:
+                            with translation_expander:
+                                translated_text = render_stream(
+                                    utils.generate_answer_stream(system_prompt, user_prompt, formatted_text))
                         else:
                             st.write("Текст слишком большой, разбиваем на части для перевода...")
                             # Разбиваем текст на чанки
-                            text_chunks = split_text(formatted_text, chunk_size=30000, chunk_overlap=1000)
+                            text_chunks = split_text_by_tokens(formatted_text)
                             st.write(f"Текст разбит на {len(text_chunks)} частей")
                             # Обрабатываем каждый чанк отдельно
-                            translated_text = process_text_chunks(text_chunks, system_prompt, user_prompt)
+                            with translation_expander:
+                                translated_text = render_stream(
+                                    process_text_chunks_stream(text_chunks, system_prompt, user_prompt))
 
                     # Определяем пути сохранения для переведенного текста
                     translated_output_txt = os.path.join(file_dir, f"{target_language}_{file_name}.txt")
@@ -394,8 +565,6 @@ def process_uploaded_file(uploaded_file, save_dir, file_name, target_language, s
                         st.success(f"Перевод на {target_language} сохранен в DOCX: {translated_output_docx}")
 
                     st.success(f"Перевод на {target_language} завершен!")
-                    with st.expander(f"Просмотреть текст на {target_language}", expanded=False):
-                        st.write(translated_text)
 
                     # Создаем конспект, если эта опция выбрана
                     if create_handbook_option:
@@ -415,6 +584,10 @@ def process_uploaded_file(uploaded_file, save_dir, file_name, target_language, s
             else:
                 st.error("Не удалось получить транскрибацию от Whisper API")
 
+    except ChunkProcessingError as e:
+        # Необработанные части не попадают в результат: перевод не сохраняется
+        st.error(f"Модель не обработала части текста {', '.join(map(str, e.chunk_numbers))}, "
+                 f"перевод не сохранён: {e.reason}")
     except Exception as e:
         st.error(f"Ошибка при обработке файла: {str(e)}")
     finally:
@@ -424,7 +597,7 @@ def process_uploaded_file(uploaded_file, save_dir, file_name, target_language, s
     return transcription, file_dir
 
 # Функция для обработки YouTube видео
-def process_youtube_video(url, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False):
+def process_youtube_video(url, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False, pipelined=False):
     downloader = YouTubeDownloader(output_dir=AUDIO_FILES_DIR)
     if not downloader.is_youtube_url(url):
         st.error("Указанный URL не похож на ссылку YouTube видео.")
@@ -462,12 +635,8 @@ def process_youtube_video(url, save_path, target_language, save_txt=True, save_d
     # Транскрибация аудио
     with st.spinner("Выполняем транскрибацию..."):
         start_time = time.time()
-        transcription, original_language = transcribe_audio_whisper(
-            audio_path=audio_file,
-            file_title=file_name,
-            save_folder_path=TEMP_FILES_DIR  # Сохраняем рабочий файл во временную директорию
-        )
-        transcription = utils.format_transcription_paragraphs(transcription)
+        transcription, original_language, pipelined_translation = transcribe_with_paragraphs(
+            audio_file, file_name, target_language, pipelined)
         elapsed_time = time.time() - start_time
     st.success(f"Транскрибация завершена за {elapsed_time / 60:.2f} минут!")
 
@@ -510,7 +679,14 @@ def process_youtube_video(url, save_path, target_language, save_txt=True, save_d
 
     if need_translate:
         with st.spinner(f"Переводим транскрибацию с {orig_lang_name} на {target_language}..."):
-            translated_text = utils.translate_text_gpt(transcription, target_language)
+            # Перевод выводится по мере генерации, в файл сохраняется итоговый текст
+            with st.expander(f"Перевод на {target_language}", expanded=True):
+                # В конвейерном режиме перевод уже выполнен во время транскрибации
+                if pipelined_translation is not None:
+                    translated_text = pipelined_translation
+                    st.write(translated_text)
+                else:
+                    translated_text = render_stream(utils.translate_text_gpt_stream(transcription, target_language))
         st.success(f"Перевод завершён!")
     else:
         st.info(f"Язык оригинала ({orig_lang_name}) совпадает с целевым языком ({target_language}). Перевод не требуется.")
@@ -553,7 +729,7 @@ def process_youtube_video(url, save_path, target_language, save_txt=True, save_d
         return transcription, None, None
 
 # Функция для обработки Instagram видео
-def process_instagram_video(url, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False):
+def process_instagram_video(url, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False, pipelined=False):
     downloader = InstagramDownloader(output_dir=AUDIO_FILES_DIR)
     if not downloader.is_instagram_url(url):
         st.error("Указанный URL не похож на ссылку Instagram видео.")
@@ -591,12 +767,8 @@ def process_instagram_video(url, save_path, target_language, save_txt=True, save
     # Транскрибация аудио
     with st.spinner("Выполняем транскрибацию..."):
         start_time = time.time()
-        transcription, original_language = transcribe_audio_whisper(
-            audio_path=audio_file,
-            file_title=file_name,
-            save_folder_path=TEMP_FILES_DIR  # Сохраняем рабочий файл во временную директорию
-        )
-        transcription = utils.format_transcription_paragraphs(transcription)
+        transcription, original_language, pipelined_translation = transcribe_with_paragraphs(
+            audio_file, file_name, target_language, pipelined)
         elapsed_time = time.time() - start_time
     st.success(f"Транскрибация завершена за {elapsed_time / 60:.2f} минут!")
 
@@ -639,7 +811,14 @@ def process_instagram_video(url, save_path, target_language, save_txt=True, save
 
     if need_translate:
         with st.spinner(f"Переводим транскрибацию с {orig_lang_name} на {target_language}..."):
-            translated_text = utils.translate_text_gpt(transcription, target_language)
+            # Перевод выводится по мере генерации, в файл сохраняется итоговый текст
+            with st.expander(f"Перевод на {target_language}", expanded=True):
+                # В конвейерном режиме перевод уже выполнен во время транскрибации
+                if pipelined_translation is not None:
+                    translated_text = pipelined_translation
+                    st.write(translated_text)
+                else:
+                    translated_text = render_stream(utils.translate_text_gpt_stream(transcription, target_language))
         st.success(f"Перевод завершён!")
     else:
         st.info(f"Язык оригинала ({orig_lang_name}) совпадает с целевым языком ({target_language}). Перевод не требуется.")
@@ -682,7 +861,7 @@ def process_instagram_video(url, save_path, target_language, save_txt=True, save
         return transcription, None, None
 
 # Функция для обработки файлов с Яндекс Диска
-def process_yandex_disk_files(url, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False):
+def process_yandex_disk_files(url, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False, pipelined=False, bulk=False):
     """
     Скачивает и обрабатывает аудио и видео файлы с Яндекс Диска
 
@@ -693,6 +872,7 @@ def process_yandex_disk_files(url, save_path, target_language, save_txt=True, sa
         save_txt: Сохранять ли результат в TXT
         save_docx: Сохранять ли результат в DOCX
         create_handbook_option: Создавать ли конспект
+        bulk: Отправить запросы к модели для всех файлов через Batch API (process_files_in_bulk)
 
     Returns:
         Кортеж с результатами (транскрипция, конспект, обработанный текст)
@@ -725,131 +905,139 @@ def process_yandex_disk_files(url, save_path, target_language, save_txt=True, sa
     all_handbooks = []
     all_processed_dirs = []  # Список директорий для итогового скачивания
 
-    for file_path in downloaded_files:
-        if file_path is None or not os.path.exists(file_path):
-            st.warning(f"Пропускаем некорректный файл")
-            continue
-
-        file_name = Path(file_path).stem
-        st.subheader(f"Обработка файла: {file_name}")
+    # В пакетном режиме файлы обрабатываются вместе, а не в цикле по файлам
+    if bulk:
+        all_transcriptions, all_handbooks, all_processed_dirs = process_files_in_bulk(
+            downloaded_files, save_path, target_language, save_txt, save_docx, create_handbook_option)
+    else:
+        for file_path in downloaded_files:
+            if file_path is None or not os.path.exists(file_path):
+                st.warning(f"Пропускаем некорректный файл")
+                continue
 
-        # Создаем отдельную папку для файла в директории экспорта
-        file_dir = os.path.join(save_path, file_name)
-        os.makedirs(file_dir, exist_ok=True)
-        all_processed_dirs.append(file_dir)  # Добавляем директорию в список
+            file_name = Path(file_path).stem
+            st.subheader(f"Обработка файла: {file_name}")
 
-        # Сохраняем путь в состояние сессии
-        st.session_state.last_processed_dir = file_dir
-        st.session_state.processed_dirs.append(file_dir)
+            # Создаем отдельную папку для файла в директории экспорта
+            file_dir = os.path.join(save_path, file_name)
+            os.makedirs(file_dir, exist_ok=True)
+            all_processed_dirs.append(file_dir)  # Добавляем директорию в список
 
-        # Получаем информацию об аудио файле
-        try:
-            audio = audio_info(file_path)
-            st.write(f"Продолжительность: {audio.duration_seconds / 60:.2f} мин.")
-            st.write(f"Частота дискретизации: {audio.frame_rate} Гц")
-            st.write(f"Количество каналов: {audio.channels}")
-        except Exception as e:
-            st.error(f"Ошибка при анализе файла: {str(e)}")
-            continue
+            # Сохраняем путь в состояние сессии
+            st.session_state.last_processed_dir = file_dir
+            st.session_state.processed_dirs.append(file_dir)
 
-        # Транскрибация аудио
-        with st.spinner(f"Выполняем транскрибацию файла {file_name}..."):
-            start_time = time.time()
+            # Получаем информацию об аудио файле
             try:
-                transcription, original_language = transcribe_audio_whisper(
-                    audio_path=file_path,
-                    file_title=file_name,
-                    save_folder_path=TEMP_FILES_DIR  # Сохраняем рабочий файл во временную директорию
-                )
-                transcription = utils.format_transcription_paragraphs(transcription)
-                elapsed_time = time.time() - start_time
+                audio = audio_info(file_path)
+                st.write(f"Продолжительность: {audio.duration_seconds / 60:.2f} мин.")
+                st.write(f"Частота дискретизации: {audio.frame_rate} Гц")
+                st.write(f"Количество каналов: {audio.channels}")
             except Exception as e:
-                st.error(f"Ошибка при транскрибации: {str(e)}")
+                st.error(f"Ошибка при анализе файла: {str(e)}")
                 continue
 
-        st.success(f"Транскрибация завершена за {elapsed_time / 60:.2f} минут!")
-
-        # Сохраняем оригинал в папку файла
-        if save_txt:
-            original_txt_path = os.path.join(file_dir, f"Original_{file_name}.txt")
-            with open(original_txt_path, "w", encoding="utf-8") as f:
-                f.write(transcription)
-            st.success(f"Оригинал TXT сохранен: {original_txt_path}")
-
-        if save_docx:
-            original_docx_path = os.path.join(file_dir, f"Original_{file_name}.docx")
-            save_text_to_docx(transcription, original_docx_path)
-            st.success(f"Оригинал Word сохранен: {original_docx_path}")
-
-        # Добавляем в список всех транскрипций
-        all_transcriptions.append((file_name, transcription, transcription))  # Временно добавляем без перевода
-
-        # Определяем, нужен ли перевод
-        # Словари для маппинга названий языков в коды и наоборот
-        lang_map = {"русский": "ru", "казахский": "kk", "английский": "en"}
-        lang_code_to_name = {"ru": "русский", "kk": "казахский", "en": "английский", "ko": "корейский",
-                            "ja": "японский", "zh": "китайский", "es": "испанский", "fr": "французский",
-                            "de": "немецкий", "it": "итальянский", "pt": "португальский"}
-
-        # Получаем код оригинального языка
-        orig_lang_code = original_language.lower() if original_language else "unknown"
-
-        # Дополнительная проверка для корейского и других языков
-        if orig_lang_code == "unknown" or orig_lang_code not in ["ru", "kk", "en", "ko", "ja", "zh"]:
-            # Повторно определяем язык из текста
-            orig_lang_code = utils.detect_language(transcription)
-
-        # Получаем код целевого языка
-        target_lang_code = lang_map.get(target_language.lower(), "ru")
-
-        # Всегда переводим с языка, отличного от целевого
-        need_translate = orig_lang_code != target_lang_code
-        translated_text = transcription  # По умолчанию используем оригинальный текст
-
-        # Показываем информацию о языке оригинала для диагностики
-        orig_lang_name = lang_code_to_name.get(orig_lang_code, f"неизвестный ({orig_lang_code})")
-        st.info(f"Определен язык оригинала: {orig_lang_name}")
-
-        if need_translate:
-            with st.spinner(f"Переводим транскрибацию файла {file_name} с {orig_lang_name} на {target_language}..."):
-                translated_text = utils.translate_text_gpt(transcription, target_language)
-            st.success(f"Перевод файла {file_name} завершён!")
-            # Обновляем перевод в списке транскрипций
-            all_transcriptions[-1] = (file_name, transcription, translated_text)
-        else:
-            st.info(f"Язык оригинала ({orig_lang_name}) для файла {file_name} совпадает с целевым языком ({target_language}). Перевод не требуется.")
-
-        # Сохраняем переведённую транскрипцию или оригинал, если перевод не нужен
-        if save_txt:
-            trans_txt_path = os.path.join(file_dir, f"{target_language.capitalize()}_{file_name}.txt")
-            with open(trans_txt_path, "w", encoding="utf-8") as f:
-                f.write(translated_text)
-            st.success(f"Переведённый TXT сохранен: {trans_txt_path}")
-
-        if save_docx:
-            trans_docx_path = os.path.join(file_dir, f"{target_language.capitalize()}_{file_name}.docx")
-            save_text_to_docx(translated_text, trans_docx_path)
-            st.success(f"Переведённый Word сохранен: {trans_docx_path}")
-
-        # Выводим оба текста
-        st.subheader("Оригинальная транскрибация")
-        st.text_area("Оригинал", transcription, height=200)
-        st.subheader(f"Транскрибация на {target_language.capitalize()}")
-        st.text_area("Перевод", translated_text, height=200)
-
-        # Создаём конспект по переводу
-        handbook_text = None
-        if create_handbook_option:
-            # Используем оригинальное имя файла без префикса "Conspect_"
-            try:
-                handbook_text, md_processed_text = create_handbook(translated_text, file_dir, file_name, target_language, save_txt, save_docx)
-                all_handbooks.append((file_name, handbook_text, md_processed_text))
-                st.success(f"Конспект для файла {file_name} успешно создан")
-            except Exception as e:
-                st.error(f"Ошибка при создании конспекта: {str(e)}")
-        else:
-            # Добавляем возможность скачивания файлов для текущего файла
-            create_download_buttons(file_dir)
+            # Транскрибация аудио
+            with st.spinner(f"Выполняем транскрибацию файла {file_name}..."):
+                start_time = time.time()
+                try:
+                    transcription, original_language, pipelined_translation = transcribe_with_paragraphs(
+                        file_path, file_name, target_language, pipelined)
+                    elapsed_time = time.time() - start_time
+                except Exception as e:
+                    st.error(f"Ошибка при транскрибации: {str(e)}")
+                    continue
+
+            st.success(f"Транскрибация завершена за {elapsed_time / 60:.2f} минут!")
+
+            # Сохраняем оригинал в папку файла
+            if save_txt:
+                original_txt_path = os.path.join(file_dir, f"Original_{file_name}.txt")
+                with open(original_txt_path, "w", encoding="utf-8") as f:
+                    f.write(transcription)
+                st.success(f"Оригинал TXT сохранен: {original_txt_path}")
+
+            if save_docx:
+                original_docx_path = os.path.join(file_dir, f"Original_{file_name}.docx")
+                save_text_to_docx(transcription, original_docx_path)
+                st.success(f"Оригинал Word сохранен: {original_docx_path}")
+
+            # Добавляем в список всех транскрипций
+            all_transcriptions.append((file_name, transcription, transcription))  # Временно добавляем без перевода
+
+            # Определяем, нужен ли перевод
+            # Словари для маппинга названий языков в коды и наоборот
+            lang_map = {"русский": "ru", "казахский": "kk", "английский": "en"}
+            lang_code_to_name = {"ru": "русский", "kk": "казахский", "en": "английский", "ko": "корейский",
+                                "ja": "японский", "zh": "китайский", "es": "испанский", "fr": "французский",
+                                "de": "немецкий", "it": "итальянский", "pt": "португальский"}
+
+            # Получаем код оригинального языка
+            orig_lang_code = original_language.lower() if original_language else "unknown"
+
+            # Дополнительная проверка для корейского и других языков
+            if orig_lang_code == "unknown" or orig_lang_code not in ["ru", "kk", "en", "ko", "ja", "zh"]:
+                # Повторно определяем язык из текста
+                orig_lang_code = utils.detect_language(transcription)
+
+            # Получаем код целевого языка
+            target_lang_code = lang_map.get(target_language.lower(), "ru")
+
+            # Всегда переводим с языка, отличного от целевого
+            need_translate = orig_lang_code != target_lang_code
+            translated_text = transcription  # По умолчанию используем оригинальный текст
+
+            # Показываем информацию о языке оригинала для диагностики
+            orig_lang_name = lang_code_to_name.get(orig_lang_code, f"неизвестный ({orig_lang_code})")
+            st.info(f"Определен язык оригинала: {orig_lang_name}")
+
+            if need_translate:
+                with st.spinner(f"Переводим транскрибацию файла {file_name} с {orig_lang_name} на {target_language}..."):
+                    # Перевод выводится по мере генерации, в файл сохраняется итоговый текст
+                    with st.expander(f"Перевод на {target_language}", expanded=True):
+                        # В конвейерном режиме перевод уже выполнен во время транскрибации
+                        if pipelined_translation is not None:
+                            translated_text = pipelined_translation
+                            st.write(translated_text)
+                        else:
+                            translated_text = render_stream(utils.translate_text_gpt_stream(transcription, target_language))
+                st.success(f"Перевод файла {file_name} завершён!")
+                # Обновляем перевод в списке транскрипций
+                all_transcriptions[-1] = (file_name, transcription, translated_text)
+            else:
+                st.info(f"Язык оригинала ({orig_lang_name}) для файла {file_name} совпадает с целевым языком ({target_language}). Перевод не требуется.")
+
+            # Сохраняем переведённую транскрипцию или оригинал, если перевод не нужен
+            if save_txt:
+                trans_txt_path = os.path.join(file_dir, f"{target_language.capitalize()}_{file_name}.txt")
+                with open(trans_txt_path, "w", encoding="utf-8") as f:
+                    f.write(translated_text)
+                st.success(f"Переведённый TXT сохранен: {trans_txt_path}")
+
+            if save_docx:
+                trans_docx_path = os.path.join(file_dir, f"{target_language.capitalize()}_{file_name}.docx")
+                save_text_to_docx(translated_text, trans_docx_path)
+                st.success(f"Переведённый Word сохранен: {trans_docx_path}")
+
+            # Выводим оба текста
+            st.subheader("Оригинальная транскрибация")
+            st.text_area("Оригинал", transcription, height=200)
+            st.subheader(f"Транскрибация на {target_language.capitalize()}")
+            st.text_area("Перевод", translated_text, height=200)
+
+            # Создаём конспект по переводу
+            handbook_text = None
+            if create_handbook_option:
+                # Используем оригинальное имя файла без префикса "Conspect_"
+                try:
+                    handbook_text, md_processed_text = create_handbook(translated_text, file_dir, file_name, target_language, save_txt, save_docx)
+                    all_handbooks.append((file_name, handbook_text, md_processed_text))
+                    st.success(f"Конспект для файла {file_name} успешно создан")
+                except Exception as e:
+                    st.error(f"Ошибка при создании конспекта: {str(e)}")
+            else:
+                # Добавляем возможность скачивания файлов для текущего файла
+                create_download_buttons(file_dir)
 
     # Если обработано несколько файлов, предлагаем возможность скачать все результаты в одном ZIP-архиве
     if len(all_processed_dirs) > 1:
@@ -884,6 +1072,10 @@ def process_yandex_disk_files(url, save_path, target_language, save_txt=True, sa
         except Exception as e:
             st.error(f"Ошибка при создании общего ZIP-архива: {str(e)}")
 
+    if not all_transcriptions:
+        st.error("Не удалось обработать ни одного файла.")
+        return None, None, None
+
     # Возвращаем результаты для первого файла
     if len(all_transcriptions) > 0:
         st.session_state.last_processed_dir = all_processed_dirs[0]
@@ -897,7 +1089,7 @@ def process_yandex_disk_files(url, save_path, target_language, save_txt=True, sa
         return all_transcriptions[0][1], None, None
 
 # Функция для обработки Google Drive файлов
-def process_gdrive_files(url, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False):
+def process_gdrive_files(url, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False, pipelined=False, bulk=False):
     """
     Скачивает и обрабатывает аудио и видео файлы с Google Drive
 
@@ -908,6 +1100,7 @@ def process_gdrive_files(url, save_path, target_language, save_txt=True, save_do
         save_txt: Сохранять ли результат в TXT
         save_docx: Сохранять ли результат в DOCX
         create_handbook_option: Создавать ли конспект
+        bulk: Отправить запросы к модели для всех файлов через Batch API (process_files_in_bulk)
 
     Returns:
         Кортеж с результатами (транскрипция, конспект, обработанный текст)
@@ -940,125 +1133,133 @@ def process_gdrive_files(url, save_path, target_language, save_txt=True, save_do
     all_handbooks = []
     all_processed_dirs = []  # Список директорий для итогового скачивания
 
-    for file_path in downloaded_files:
-        file_name = Path(file_path).stem
-        st.subheader(f"Обработка файла: {file_name}")
+    # В пакетном режиме файлы обрабатываются вместе, а не в цикле по файлам
+    if bulk:
+        all_transcriptions, all_handbooks, all_processed_dirs = process_files_in_bulk(
+            downloaded_files, save_path, target_language, save_txt, save_docx, create_handbook_option)
+    else:
+        for file_path in downloaded_files:
+            file_name = Path(file_path).stem
+            st.subheader(f"Обработка файла: {file_name}")
 
-        # Создаем отдельную папку для файла в директории экспорта
-        file_dir = os.path.join(save_path, file_name)
-        os.makedirs(file_dir, exist_ok=True)
-        all_processed_dirs.append(file_dir)  # Добавляем в список обработанных директорий
+            # Создаем отдельную папку для файла в директории экспорта
+            file_dir = os.path.join(save_path, file_name)
+            os.makedirs(file_dir, exist_ok=True)
+            all_processed_dirs.append(file_dir)  # Добавляем в список обработанных директорий
 
-        # Сохраняем путь в состояние сессии
-        st.session_state.last_processed_dir = file_dir
-        st.session_state.processed_dirs.append(file_dir)
-
-        # Получаем информацию об аудио файле
-        try:
-            audio = audio_info(file_path)
-            st.write(f"Продолжительность: {audio.duration_seconds / 60:.2f} мин.")
-            st.write(f"Частота дискретизации: {audio.frame_rate} Гц")
-            st.write(f"Количество каналов: {audio.channels}")
-        except Exception as e:
-            st.error(f"Ошибка при анализе файла: {str(e)}")
-            continue
+            # Сохраняем путь в состояние сессии
+            st.session_state.last_processed_dir = file_dir
+            st.session_state.processed_dirs.append(file_dir)
 
-        # Транскрибация аудио
-        with st.spinner(f"Выполняем транскрибацию файла {file_name}..."):
-            start_time = time.time()
+            # Получаем информацию об аудио файле
             try:
-                transcription, original_language = transcribe_audio_whisper(
-                    audio_path=file_path,
-                    file_title=file_name,
-                    save_folder_path=TEMP_FILES_DIR  # Сохраняем рабочий файл во временную директорию
-                )
-                transcription = utils.format_transcription_paragraphs(transcription)
-                elapsed_time = time.time() - start_time
+                audio = audio_info(file_path)
+                st.write(f"Продолжительность: {audio.duration_seconds / 60:.2f} мин.")
+                st.write(f"Частота дискретизации: {audio.frame_rate} Гц")
+                st.write(f"Количество каналов: {audio.channels}")
             except Exception as e:
-                st.error(f"Ошибка при транскрибации: {str(e)}")
+                st.error(f"Ошибка при анализе файла: {str(e)}")
                 continue
 
-        st.success(f"Транскрибация завершена за {elapsed_time / 60:.2f} минут!")
-
-        # Сохраняем оригинал в папку файла
-        if save_txt:
-            original_txt_path = os.path.join(file_dir, f"Original_{file_name}.txt")
-            with open(original_txt_path, "w", encoding="utf-8") as f:
-                f.write(transcription)
-            st.success(f"Оригинал TXT сохранен: {original_txt_path}")
-
-        if save_docx:
-            original_docx_path = os.path.join(file_dir, f"Original_{file_name}.docx")
-            save_text_to_docx(transcription, original_docx_path)
-            st.success(f"Оригинал Word сохранен: {original_docx_path}")
-
-        # Добавляем транскрипцию в список
-        all_transcriptions.append((file_name, transcription))
-
-        # Определяем, нужен ли перевод
-        # Словари для маппинга названий языков в коды и наоборот
-        lang_map = {"русский": "ru", "казахский": "kk", "английский": "en"}
-        lang_code_to_name = {"ru": "русский", "kk": "казахский", "en": "английский", "ko": "корейский",
-                            "ja": "японский", "zh": "китайский", "es": "испанский", "fr": "французский",
-                            "de": "немецкий", "it": "итальянский", "pt": "португальский"}
-
-        # Получаем код оригинального языка
-        orig_lang_code = original_language.lower() if original_language else "unknown"
-
-        # Дополнительная проверка для корейского и других языков
-        if orig_lang_code == "unknown" or orig_lang_code not in ["ru", "kk", "en", "ko", "ja", "zh"]:
-            # Повторно определяем язык из текста
-            orig_lang_code = utils.detect_language(transcription)
-
-        # Получаем код целевого языка
-        target_lang_code = lang_map.get(target_language.lower(), "ru")
-
-        # Всегда переводим с языка, отличного от целевого
-        need_translate = orig_lang_code != target_lang_code
-        translated_text = transcription  # По умолчанию используем оригинальный текст
-
-        # Показываем информацию о языке оригинала для диагностики
-        orig_lang_name = lang_code_to_name.get(orig_lang_code, f"неизвестный ({orig_lang_code})")
-        st.info(f"Определен язык оригинала: {orig_lang_name}")
-
-        if need_translate:
-            with st.spinner(f"Переводим транскрибацию файла {file_name} с {orig_lang_name} на {target_language}..."):
-                translated_text = utils.translate_text_gpt(transcription, target_language)
-            st.success(f"Перевод файла {file_name} завершён!")
-        else:
-            st.info(f"Язык оригинала ({orig_lang_name}) для файла {file_name} совпадает с целевым языком ({target_language}). Перевод не требуется.")
-
-        # Сохраняем переведённую транскрипцию или оригинал, если перевод не нужен
-        if save_txt:
-            trans_txt_path = os.path.join(file_dir, f"{target_language.capitalize()}_{file_name}.txt")
-            with open(trans_txt_path, "w", encoding="utf-8") as f:
-                f.write(translated_text)
-            st.success(f"Переведённый TXT сохранен: {trans_txt_path}")
-
-        if save_docx:
-            trans_docx_path = os.path.join(file_dir, f"{target_language.capitalize()}_{file_name}.docx")
-            save_text_to_docx(translated_text, trans_docx_path)
-            st.success(f"Переведённый Word сохранен: {trans_docx_path}")
-
-        # Выводим оба текста
-        st.subheader("Оригинальная транскрибация")
-        st.text_area("Оригинал", transcription, height=200)
-        st.subheader(f"Транскрибация на {target_language.capitalize()}")
-        st.text_area("Перевод", translated_text, height=200)
-
-        # Создаём конспект по переводу
-        handbook_text = None
-        if create_handbook_option:
-            # Используем оригинальное имя файла без префикса "Conspect_"
-            try:
-                handbook_text, md_processed_text = create_handbook(translated_text, file_dir, file_name, target_language, save_txt, save_docx)
-                all_handbooks.append((file_name, handbook_text, md_processed_text))
-                st.success(f"Конспект для файла {file_name} успешно создан")
-            except Exception as e:
-                st.error(f"Ошибка при создании конспекта: {str(e)}")
-        else:
-            # Добавляем возможность скачивания файлов, если конспект не создается
-            create_download_buttons(file_dir)
+            # Транскрибация аудио
+            with st.spinner(f"Выполняем транскрибацию файла {file_name}..."):
+                start_time = time.time()
+                try:
+                    transcription, original_language, pipelined_translation = transcribe_with_paragraphs(
+                        file_path, file_name, target_language, pipelined)
+                    elapsed_time = time.time() - start_time
+                except Exception as e:
+                    st.error(f"Ошибка при транскрибации: {str(e)}")
+                    continue
+
+            st.success(f"Транскрибация завершена за {elapsed_time / 60:.2f} минут!")
+
+            # Сохраняем оригинал в папку файла
+            if save_txt:
+                original_txt_path = os.path.join(file_dir, f"Original_{file_name}.txt")
+                with open(original_txt_path, "w", encoding="utf-8") as f:
+                    f.write(transcription)
+                st.success(f"Оригинал TXT сохранен: {original_txt_path}")
+
+            if save_docx:
+                original_docx_path = os.path.join(file_dir, f"Original_{file_name}.docx")
+                save_text_to_docx(transcription, original_docx_path)
+                st.success(f"Оригинал Word сохранен: {original_docx_path}")
+
+            # Добавляем транскрипцию в список
+            all_transcriptions.append((file_name, transcription))
+
+            # Определяем, нужен ли перевод
+            # Словари для маппинга названий языков в коды и наоборот
+            lang_map = {"русский": "ru", "казахский": "kk", "английский": "en"}
+            lang_code_to_name = {"ru": "русский", "kk": "казахский", "en": "английский", "ko": "корейский",
+                                "ja": "японский", "zh": "китайский", "es": "испанский", "fr": "французский",
+                                "de": "немецкий", "it": "итальянский", "pt": "португальский"}
+
+            # Получаем код оригинального языка
+            orig_lang_code = original_language.lower() if original_language else "unknown"
+
+            # Дополнительная проверка для корейского и других языков
+            if orig_lang_code == "unknown" or orig_lang_code not in ["ru", "kk", "en", "ko", "ja", "zh"]:
+                # Повторно определяем язык из текста
+                orig_lang_code = utils.detect_language(transcription)
+
+            # Получаем код целевого языка
+            target_lang_code = lang_map.get(target_language.lower(), "ru")
+
+            # Всегда переводим с языка, отличного от целевого
+            need_translate = orig_lang_code != target_lang_code
+            translated_text = transcription  # По умолчанию используем оригинальный текст
+
+            # Показываем информацию о языке оригинала для диагностики
+            orig_lang_name = lang_code_to_name.get(orig_lang_code, f"неизвестный ({orig_lang_code})")
+            st.info(f"Определен язык оригинала: {orig_lang_name}")
+
+            if need_translate:
+                with st.spinner(f"Переводим транскрибацию файла {file_name} с {orig_lang_name} на {target_language}..."):
+                    # Перевод выводится по мере генерации, в файл сохраняется итоговый текст
+                    with st.expander(f"Перевод на {target_language}", expanded=True):
+                        # В конвейерном режиме перевод уже выполнен во время транскрибации
+                        if pipelined_translation is not None:
+                            translated_text = pipelined_translation
+                            st.write(translated_text)
+                        else:
+                            translated_text = render_stream(utils.translate_text_gpt_stream(transcription, target_language))
+                st.success(f"Перевод файла {file_name} завершён!")
+            else:
+                st.info(f"Язык оригинала ({orig_lang_name}) для файла {file_name} совпадает с целевым языком ({target_language}). Перевод не требуется.")
+
+            # Сохраняем переведённую транскрипцию или оригинал, если перевод не нужен
+            if save_txt:
+                trans_txt_path = os.path.join(file_dir, f"{target_language.capitalize()}_{file_name}.txt")
+                with open(trans_txt_path, "w", encoding="utf-8") as f:
+                    f.write(translated_text)
+                st.success(f"Переведённый TXT сохранен: {trans_txt_path}")
+
+            if save_docx:
+                trans_docx_path = os.path.join(file_dir, f"{target_language.capitalize()}_{file_name}.docx")
+                save_text_to_docx(translated_text, trans_docx_path)
+                st.success(f"Переведённый Word сохранен: {trans_docx_path}")
+
+            # Выводим оба текста
+            st.subheader("Оригинальная транскрибация")
+            st.text_area("Оригинал", transcription, height=200)
+            st.subheader(f"Транскрибация на {target_language.capitalize()}")
+            st.text_area("Перевод", translated_text, height=200)
+
+            # Создаём конспект по переводу
+            handbook_text = None
+            if create_handbook_option:
+                # Используем оригинальное имя файла без префикса "Conspect_"
+                try:
+                    handbook_text, md_processed_text = create_handbook(translated_text, file_dir, file_name, target_language, save_txt, save_docx)
+                    all_handbooks.append((file_name, handbook_text, md_processed_text))
+                    st.success(f"Конспект для файла {file_name} успешно создан")
+                except Exception as e:
+                    st.error(f"Ошибка при создании конспекта: {str(e)}")
+            else:
+                # Добавляем возможность скачивания файлов, если конспект не создается
+                create_download_buttons(file_dir)
 
     # Если обработано несколько файлов, предлагаем возможность скачать все результаты в одном ZIP-архиве
     if len(all_processed_dirs) > 1:
@@ -1099,6 +1300,10 @@ def process_gdrive_files(url, save_path, target_language, save_txt=True, save_do
         transcription = all_transcriptions[0][1] if len(all_transcriptions) > 0 else None
         return transcription, all_handbooks[0][1], all_handbooks[0][2]
 
+    if not all_transcriptions:
+        st.error("Не удалось обработать ни одного файла.")
+        return None, None, None
+
     # Возвращаем результаты для первого файла
     if len(all_transcriptions) > 0:
         st.session_state.last_processed_dir = all_processed_dirs[0]
@@ -1111,7 +1316,7 @@ def process_gdrive_files(url, save_path, target_language, save_txt=True, save_do
     else:
         return all_transcriptions[0][1], None, None
 
-def process_vk_video(url, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False):
+def process_vk_video(url, save_path, target_language, save_txt=True, save_docx=True, create_handbook_option=False, pipelined=False):
     """
     Скачивает и обрабатывает видео из ВКонтакте
 
@@ -1170,12 +1375,8 @@ def process_vk_video(url, save_path, target_language, save_txt=True, save_docx=T
     # Транскрибация аудио
     with st.spinner("Выполняем транскрибацию..."):
         start_time = time.time()
-        transcription, original_language = transcribe_audio_whisper(
-            audio_path=audio_file,
-            file_title=file_name,
-            save_folder_path=TEMP_FILES_DIR  # Сохраняем рабочий файл во временную директорию
-        )
-        transcription = utils.format_transcription_paragraphs(transcription)
+        transcription, original_language, pipelined_translation = transcribe_with_paragraphs(
+            audio_file, file_name, target_language, pipelined)
         elapsed_time = time.time() - start_time
 
     st.success(f"Транскрибация завершена за {elapsed_time / 60:.2f} минут!")
@@ -1220,7 +1421,14 @@ def process_vk_video(url, save_path, target_language, save_txt=True, save_docx=T
 
     if need_translate:
         with st.spinner(f"Переводим транскрибацию с {orig_lang_name} на {target_language}..."):
-            translated_text = utils.translate_text_gpt(transcription, target_language)
+            # Перевод выводится по мере генерации, в файл сохраняется итоговый текст
+            with st.expander(f"Перевод на {target_language}", expanded=True):
+                # В конвейерном режиме перевод уже выполнен во время транскрибации
+                if pipelined_translation is not None:
+                    translated_text = pipelined_translation
+                    st.write(translated_text)
+                else:
+                    translated_text = render_stream(utils.translate_text_gpt_stream(transcription, target_language))
         st.success(f"Перевод завершён!")
     else:
         st.info(f"Язык оригинала ({orig_lang_name}) совпадает с целевым языком ({target_language}). Перевод не требуется.")
@@ -1334,6 +1542,24 @@ def main():
         save_docx = True  # DOCX всегда сохраняется
         create_handbook = True  # Конспект всегда создается
 
+        # Конвейерный режим: абзацы и перевод готовых фрагментов выполняются во время транскрибации следующих
+        st.subheader("Режим обработки")
+        pipelined_mode = st.checkbox("Конвейерная обработка (перевод во время транскрибации)", value=False,
+                                     help="Ускоряет обработку длинных записей: стадии выполняются одновременно")
+        # Пакетный режим: запросы к модели для всех файлов папки отправляются через Batch API
+        bulk_mode = st.checkbox("Пакетный режим для папок (Batch API, до 24 ч)", value=False,
+                                help="Для папок Яндекс Диска и Google Drive: дешевле и без лимитов запросов, но результат придёт позже")
+
+        # Повторный запуск той же задачи берёт ответы модели из кэша; флажок заставляет запросить их заново
+        st.subheader("Кэш ответов модели")
+        bypass_llm_cache = st.checkbox("Не использовать кэш ответов модели", value=False)
+        llm_cache_bypass.set(bypass_llm_cache)
+        if st.button("📊 Статистика кэша"):
+            cache_stats = utils.LLM_CACHE.stats()
+            st.write(f"Попаданий: {cache_stats['hits']}, промахов: {cache_stats['misses']} "
+                     f"({cache_stats['hit_rate']:.0%}), записей: {cache_stats.get('entries', 0)}, "
+                     f"объём: {cache_stats.get('bytes', 0) / 1024 / 1024:.1f} МБ")
+
         # Добавляем возможность очистить результаты предыдущих транскрибаций
         if st.session_state.process_completed:
             if st.button("🗑️ Очистить предыдущие результаты"):
@@ -1398,7 +1624,8 @@ def main():
                             target_language,
                             save_txt=save_txt,
                             save_docx=True,
-                            create_handbook_option=True
+                            create_handbook_option=True,
+                            pipelined=pipelined_mode
                         )
 
                     st.success(f"Обработка всех файлов завершена! Всего обработано: {len(uploaded_files)}")
@@ -1418,7 +1645,8 @@ def main():
                         target_language,
                         save_txt=save_txt,
                         save_docx=True,
-                        create_handbook_option=True
+                        create_handbook_option=True,
+                        pipelined=pipelined_mode
                     )
 
     # Новая вкладка для VK видео
@@ -1443,7 +1671,8 @@ def main():
                         target_language,
                         save_txt=save_txt,
                         save_docx=True,
-                        create_handbook_option=True
+                        create_handbook_option=True,
+                        pipelined=pipelined_mode
                     )
 
     # Вкладка для Instagram
@@ -1462,7 +1691,8 @@ def main():
                         target_language,
                         save_txt=save_txt,
                         save_docx=True,
-                        create_handbook_option=True
+                        create_handbook_option=True,
+                        pipelined=pipelined_mode
                     )
 
     # Вкладка для Яндекс Диск
@@ -1481,7 +1711,9 @@ def main():
                         target_language,
                         save_txt=save_txt,
                         save_docx=True,
-                        create_handbook_option=True
+                        create_handbook_option=True,
+                        pipelined=pipelined_mode,
+                        bulk=bulk_mode
                     )
 
     # Вкладка для Google Диск
@@ -1508,7 +1740,9 @@ def main():
                         target_language,
                         save_txt=save_txt,
                         save_docx=True,
-                        create_handbook_option=True
+                        create_handbook_option=True,
+                        pipelined=pipelined_mode,
+                        bulk=bulk_mode
                     )
 
 if __name__ == "__main__":
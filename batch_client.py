@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from openai_client import acall_with_retry, get_async_client
+
+logger = logging.getLogger('batch_client')
+
+# Эндпоинт, запросы к которому собираются в пакеты
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Срок выполнения пакета (единственное значение, которое принимает Batch API)
+BATCH_COMPLETION_WINDOW = "24h"
+# Максимальное количество запросов в одном пакете (ограничение Batch API)
+BATCH_MAX_REQUESTS = 50000
+# Пауза между проверками состояния пакета (в секундах)
+BATCH_POLL_INTERVAL = float(os.environ.get("BATCH_POLL_INTERVAL", 30))
+# Конечные состояния пакета
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Сколько раз запрос, завершившийся ошибкой в пакете, отправляется повторно в следующем пакете
+BATCH_REQUEST_MAX_ATTEMPTS = 3
+# Максимальное количество раундов (зависимых стадий) в run_batched по умолчанию
+BATCH_MAX_ROUNDS = int(os.environ.get("BATCH_MAX_ROUNDS", 10))
+
+class BatchDeferred(Exception):
+    """
+    Запрос к модели отложен до выполнения пакета (режим сбора пакетных запросов)
+    """
+
+class BatchError(Exception):
+    """
+    Пакет не выполнен (failed, expired, cancelled) или запрос в пакете завершился ошибкой
+    """
+
+class BatchCollector:
+    """
+    Собирает запросы chat completions в пакет вместо их немедленной отправки.
+    Пока коллектор установлен в batch_collector, _chat_completion_async отдаёт ответ
+    из уже выполненных пакетов, а для нового запроса записывает его и вызывает
+    BatchDeferred. Задача, прерванная BatchDeferred, запускается заново после
+    выполнения пакета и доходит до следующей зависимой стадии.
+    """
+
+    def __init__(self):
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.answers: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self.failures: Dict[str, Tuple[int, str]] = {}
+
+    def resolve(self, key: str, body: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Возвращает ответ на запрос из выполненных пакетов или откладывает запрос
+
+        Args:
+            key: Ключ запроса (LLMResponseCache.make_key)
+            body: Тело запроса chat completions
+
+        Returns:
+            Кортеж из текста ответа и finish_reason
+        """
+        if key in self.answers:
+            return self.answers[key]
+        attempts, message = self.failures.get(key, (0, ""))
+        if attempts >= BATCH_REQUEST_MAX_ATTEMPTS:
+            raise BatchError(f"Запрос не выполнен в пакете: {message}")
+        self.pending[key] = body
+        raise BatchDeferred(key)
+
+    async def submit(self, work_dir: str, poll_interval: float = BATCH_POLL_INTERVAL,
+                     on_status: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        """
+        Отправляет накопленные запросы пакетами и дожидается результатов
+
+        Args:
+            work_dir: Папка для файлов пакета (JSONL)
+            poll_interval: Пауза между проверками состояния (в секундах)
+            on_status: Функция, получающая состояние пакета при каждой проверке
+        """
+        requests, self.pending = self.pending, {}
+        results, failures = await run_chat_batch(requests, work_dir, poll_interval, on_status)
+        self.answers.update(results)
+        for key, message in failures.items():
+            self.failures[key] = (self.failures.get(key, (0, ""))[0] + 1, message)
+
+# Коллектор пакетных запросов текущего контекста (None - запросы отправляются сразу)
+batch_collector: contextvars.ContextVar[Optional[BatchCollector]] = contextvars.ContextVar(
+    "batch_collector", default=None)
+
+# Запись запросов в файл пакета
+def write_batch_file(requests: Dict[str, Dict[str, Any]], path: str) -> None:
+    """
+    Записывает запросы в JSONL-файл в формате Batch API
+
+    Args:
+        requests: Словарь {custom_id: тело запроса chat completions}
+        path: Путь к файлу
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests.items():
+            f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body},
+                               ensure_ascii=False) + "\n")
+
+# Разбор файла результатов пакета
+def parse_batch_output(text: str) -> Tuple[Dict[str, Tuple[Optional[str], Optional[str]]], Dict[str, str]]:
+    """
+    Разбирает JSONL-файл результатов (или ошибок) пакета
+
+    Args:
+        text: Содержимое файла
+
+    Returns:
+        Кортеж из ответов {custom_id: (текст, finish_reason)} и ошибок {custom_id: сообщение}
+    """
+    results = {}
+    failures = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record["custom_id"]
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or response.get("body", {}).get("error") or {}
+            failures[custom_id] = error.get("message") or f"HTTP {response.get('status_code')}"
+            continue
+        choice = response["body"]["choices"][0]
+        results[custom_id] = (choice["message"].get("content"), choice.get("finish_reason"))
+    return results, failures
+
+# Выполнение одного пакета
+async def _run_single_batch(requests: Dict[str, Dict[str, Any]], path: str, poll_interval: float,
+                            on_status: Optional[Callable[[Dict[str, Any]], None]]
+                            ) -> Tuple[Dict[str, Tuple[Optional[str], Optional[str]]], Dict[str, str]]:
+    client = get_async_client()
+    await asyncio.to_thread(write_batch_file, requests, path)
+    with open(path, "rb") as f:
+        input_file = await acall_with_retry(
+            client.files.create, call_site="batch_upload", file=(os.path.basename(path), f.read()), purpose="batch")
+    batch = await acall_with_retry(
+        client.batches.create, call_site="batch_create", input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT, completion_window=BATCH_COMPLETION_WINDOW)
+    logger.info(f"Пакет {batch.id} создан: запросов {len(requests)}")
+
+    start_time = time.monotonic()
+    while batch.status not in BATCH_FINAL_STATUSES:
+        await asyncio.sleep(poll_interval)
+        batch = await acall_with_retry(client.batches.retrieve, batch.id, call_site="batch_retrieve")
+        if on_status:
+            on_status({"id": batch.id, "status": batch.status, "requests": len(requests),
+                       "completed": batch.request_counts.completed if batch.request_counts else 0,
+                       "failed": batch.request_counts.failed if batch.request_counts else 0,
+                       "elapsed": time.monotonic() - start_time})
+    if batch.status != "completed":
+        raise BatchError(f"Пакет {batch.id} завершён в состоянии {batch.status}")
+
+    results = {}
+    failures = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await acall_with_retry(client.files.content, file_id, call_site="batch_download")
+        file_results, file_failures = parse_batch_output(content.content.decode("utf-8"))
+        results.update(file_results)
+        failures.update(file_failures)
+    # Запросы, которых нет ни в результатах, ни в ошибках, считаются неудачными
+    for custom_id in requests:
+        if custom_id not in results and custom_id not in failures:
+            failures[custom_id] = "нет результата в пакете"
+    logger.info(f"Пакет {batch.id} выполнен: ответов {len(results)}, ошибок {len(failures)}")
+    return results, failures
+
+# Выполнение запросов chat completions через Batch API
+async def run_chat_batch(requests: Dict[str, Dict[str, Any]], work_dir: str,
+                         poll_interval: float = BATCH_POLL_INTERVAL,
+                         on_status: Optional[Callable[[Dict[str, Any]], None]] = None
+                         ) -> Tuple[Dict[str, Tuple[Optional[str], Optional[str]]], Dict[str, str]]:
+    """
+    Записывает запросы в JSONL-файл, загружает его, создаёт пакет, дожидается его
+    выполнения и возвращает ответы по custom_id. Больше BATCH_MAX_REQUESTS запросов
+    отправляется несколькими пакетами одновременно.
+
+    Args:
+        requests: Словарь {custom_id: тело запроса chat completions}
+        work_dir: Папка для файлов пакета
+        poll_interval: Пауза между проверками состояния (в секундах)
+        on_status: Функция, получающая состояние пакета при каждой проверке
+
+    Returns:
+        Кортеж из ответов {custom_id: (текст, finish_reason)} и ошибок {custom_id: сообщение}
+    """
+    if not requests:
+        return {}, {}
+    os.makedirs(work_dir, exist_ok=True)
+    items = list(requests.items())
+    parts = [dict(items[start:start + BATCH_MAX_REQUESTS]) for start in range(0, len(items), BATCH_MAX_REQUESTS)]
+    stamp = int(time.time() * 1000)
+    outcomes = await asyncio.gather(*(
+        _run_single_batch(part, os.path.join(work_dir, f"batch_{stamp}_{index}.jsonl"), poll_interval, on_status)
+        for index, part in enumerate(parts, start=1)))
+
+    results = {}
+    failures = {}
+    for part_results, part_failures in outcomes:
+        results.update(part_results)
+        failures.update(part_failures)
+    return results, failures
+
+# Выполнение задач с отправкой всех запросов к модели пакетами
+async def run_batched(jobs: List[Callable[[], Awaitable[Any]]], work_dir: str,
+                      poll_interval: float = BATCH_POLL_INTERVAL,
+                      on_status: Optional[Callable[[Dict[str, Any]], None]] = None,
+                      max_rounds: int = BATCH_MAX_ROUNDS) -> List[Any]:
+    """
+    Выполняет задачи так, что все их запросы chat completions отправляются через
+    Batch API. Задачи запускаются раундами: в каждом раунде запросы, на которые ещё
+    нет ответа, собираются в пакет (по одному пакету на зависимую стадию), после
+    его выполнения задачи запускаются заново и получают готовые ответы. Локальные
+    шаги задач должны быть детерминированы и не иметь побочных эффектов, кроме
+    перезаписи одних и тех же файлов.
+
+    Args:
+        jobs: Асинхронные функции без аргументов
+        work_dir: Папка для файлов пакетов
+        poll_interval: Пауза между проверками состояния пакета (в секундах)
+        on_status: Функция, получающая состояние пакета при каждой проверке
+        max_rounds: Максимальное количество раундов (не меньше числа зависимых стадий задачи)
+
+    Returns:
+        Результаты задач в исходном порядке; для неудачной задачи - исключение
+    """
+    collector = BatchCollector()
+    token = batch_collector.set(collector)
+    outcomes: List[Any] = [BatchDeferred("не выполнено")] * len(jobs)
+    remaining = list(range(len(jobs)))
+    try:
+        for round_index in range(1, max_rounds + 1):
+            round_outcomes = await asyncio.gather(*(jobs[index]() for index in remaining), return_exceptions=True)
+            for index, outcome in zip(remaining, round_outcomes):
+                outcomes[index] = outcome
+            remaining = [index for index in remaining if isinstance(outcomes[index], BatchDeferred)]
+            if not remaining:
+                break
+            if not collector.pending:
+                raise BatchError("Задачи ожидают пакет, но новых запросов нет")
+            logger.info(f"Раунд {round_index}: задач в ожидании {len(remaining)}, "
+                        f"запросов в пакете {len(collector.pending)}")
+            await collector.submit(work_dir, poll_interval, on_status)
+        else:
+            logger.error(f"Задач не завершилось за {max_rounds} раундов: {len(remaining)}")
+            for index in remaining:
+                outcomes[index] = BatchError(
+                    f"Задача не завершилась за {max_rounds} раундов пакетов: зависимых стадий больше, "
+                    f"чем max_rounds в run_batched (по умолчанию BATCH_MAX_ROUNDS)")
+    finally:
+        batch_collector.reset(token)
+    return outcomes
@@ -0,0 +1,187 @@
+import time
+import argparse
+from typing import Callable, Dict, List, Tuple
+
+from language_detector import detect_language
+
+# Тексты для замера: (ожидаемый язык, текст). Смесь ru/kk/en, которая встречается в транскрипциях
+SAMPLES: List[Tuple[str, str]] = [
+    ("ru", "Всем привет, сегодня разберём уровни Фибоначчи и посмотрим, как тренд продолжается на паре USD."),
+    ("ru", "Итак, давайте посмотрим на график. Здесь цена дошла до уровня и развернулась вниз, это важно."),
+    ("ru", "Спасибо, что досмотрели до конца, подписывайтесь на канал и пишите вопросы в комментариях."),
+    ("ru", "Да. Нет. Хорошо, понятно."),
+    ("kk", "Сәлеметсіздер ме, бүгін біз нарықтағы трендті талдаймыз. Бұл өте қарапайым әдіс."),
+    ("kk", "Құрметті әріптестер, жиналысымызды бастаймыз. Күн тәртібінде үш мәселе бар."),
+    ("kk", "Мен сізге осы бағдарламаны қалай орнату керектігін көрсетемін, бәрі оңай."),
+    ("kk", "Рахмет, келесі бейнеде кездескенше, сау болыңыздар."),
+    ("en", "Hello everyone, today we will look at the Fibonacci levels and see whether the uptrend continues."),
+    ("en", "So let's open the chart. The price reached this level and bounced, which is exactly what we expected."),
+    ("en", "Thanks for watching, subscribe to the channel and leave your questions in the comments."),
+    ("en", "Yes. No. Okay, got it."),
+    ("ru", "Сегодня мы обсудим market making и risk management, это ключевые понятия для трейдера."),
+    ("mk", "Здраво на сите, денеска ќе ги разгледаме нивоата и трендот на пазарот."),
+    ("ko", "안녕하세요 여러분, 오늘은 시장 추세를 살펴보겠습니다."),
+    ("ja", "こんにちは、今日は市場の動向を見ていきます。"),
+    ("zh", "大家好，今天我们来看看市场趋势。"),
+]
+
+# Короткие реплики из реальных записей: обращения, команды, служебные строки
+SHORT_SAMPLES: List[Tuple[str, str]] = [
+    ("ru", "Добрый вечер, коллеги! Начинаем вебинар."),
+    ("ru", "Товарищи студенты, откройте учебники на странице сорок два."),
+    ("ru", "Фрагмент 1 транскрипции, отрезок 3."),
+    ("ru", "Ну что, поехали дальше."),
+    ("ru", "Коротко о главном: рынок растёт, но осторожно."),
+    ("ru", "Вопрос из чата: где взять презентацию?"),
+    ("ru", "Сейчас покажу на примере."),
+    ("kk", "Рахмет!"),
+    ("kk", "Рахмет, келесі кездескенше."),
+    ("kk", "Сәлеметсіз бе, достар!"),
+    ("kk", "Жарайды, бастайық."),
+    ("kk", "Бүгінгі сабақтың тақырыбы - нарықтағы тренд."),
+    ("en", "Good evening, everyone. Let's get started."),
+    ("en", "Open your books at page forty-two."),
+    ("en", "Any questions so far?"),
+    ("en", "Right, so where were we?"),
+    ("en", "We have a question from the chat about the slides."),
+    ("uk", "Добрий вечір, колеги! Починаємо вебінар."),
+    ("bg", "Добър вечер, колеги! Започваме уебинара."),
+]
+
+# Языки вне n-граммной модели: не должны определяться как ru/kk/en
+OTHER_LANGUAGE_SAMPLES: List[Tuple[str, str]] = [
+    ("pl", "Dzień dobry wszystkim, zaczynamy dzisiejszy wykład o rynkach finansowych."),
+    ("pl", "Proszę otworzyć podręczniki na stronie czterdziestej drugiej."),
+    ("nl", "Goedemiddag allemaal, vandaag gaan we het hebben over de financiële markten en hoe ze werken."),
+    ("nl", "Dank je wel voor het kijken en vergeet niet je te abonneren op het kanaal."),
+    ("tr", "Herkese merhaba, bugün finansal piyasalar hakkında konuşacağız."),
+    ("tr", "İzlediğiniz için teşekkürler, kanala abone olmayı unutmayın."),
+    ("sv", "Hej allihopa, idag ska vi prata om de finansiella marknaderna och hur de fungerar."),
+    ("id", "Selamat pagi semuanya, hari ini kita akan membahas pasar keuangan dan cara kerjanya."),
+    ("uz", "Ассалому алайкум, бугун биз молиявий бозорлар ҳақида гаплашамиз."),
+]
+
+# Целевые языки перевода в приложении
+TARGET_LANGUAGES = ("ru", "kk", "en")
+
+# Прежний определитель языка (для сравнения)
+def legacy_detect_language(text: str) -> str:
+    """
+    Прежняя версия utils.detect_language (langdetect и поправки), оставлена для сравнения.
+
+    Args:
+        text: Текст для анализа
+
+    Returns:
+        Код языка ("ru", "en", "kk", "ko" и др.)
+    """
+    from langdetect import detect, LangDetectException
+
+    # Проверка на пустой текст
+    if not text or text.strip() == "":
+        return "unknown"
+
+    # Использовать первые 1000 символов для более точного определения
+    sample_text = text[:1000] if len(text) > 1000 else text
+
+    try:
+        # Пробуем определить язык с помощью langdetect
+        lang_code = detect(sample_text)
+
+        # Проверяем язык на некоторые известные проблемы определения
+        if lang_code == "ru" and any(eng_word in sample_text.lower() for eng_word in [
+            "the", "and", "you", "is", "are", "this", "that", "what", "where", "when", "how",
+            "fibonacci", "trend", "level", "market", "usd", "uptrend", "continue", "profit"]):
+            # Если обнаружены очевидные английские слова, но язык определился как русский
+            return "en"
+
+        # Определение корейского языка (проверка на наличие корейских символов)
+        if any('\uAC00' <= c <= '\uD7A3' for c in sample_text):
+            return "ko"
+
+        # Определение японского языка (проверка на наличие японских символов)
+        if any('\u3040' <= c <= '\u30FF' for c in sample_text):
+            return "ja"
+
+        # Другие корректировки при необходимости
+        if lang_code == "mk" and any(rus_word in sample_text.lower() for rus_word in [
+            "это", "привет", "спасибо", "пожалуйста", "да", "нет", "говорить", "русский"]):
+            # Македонский иногда путается с русским
+            return "ru"
+
+        return lang_code
+    except LangDetectException:
+        # В случае ошибки проверяем наличие символов определенных языков
+        if any('\uAC00' <= c <= '\uD7A3' for c in sample_text):  # Корейский
+            return "ko"
+        elif any('\u3040' <= c <= '\u30FF' for c in sample_text):  # Японский
+            return "ja"
+        elif any('\u4E00' <= c <= '\u9FFF' for c in sample_text):  # Китайский
+            return "zh"
+
+        # Если не удалось определить, возвращаем unknown
+        return "unknown"
+
+
+# Замер одной функции определения языка
+def benchmark(detector: Callable[[str], str], samples: List[Tuple[str, str]], repeats: int) -> Dict[str, float]:
+    """
+    Замеряет точность, стабильность и скорость функции определения языка
+
+    Args:
+        detector: Функция определения языка
+        samples: Тексты для замера
+        repeats: Количество прогонов всех текстов
+
+    Returns:
+        Словарь с долей верных ответов, долей верных решений о переводе (для целевых
+        языков ru/kk/en), долей нестабильных ответов и временем на текст
+    """
+    answers = {index: set() for index in range(len(samples))}
+    correct = 0
+    # Решение о переводе, как в приложении: переводить, если язык оригинала отличается от целевого
+    decisions = 0
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        for index, (expected, text) in enumerate(samples):
+            language = detector(text)
+            answers[index].add(language)
+            correct += language == expected
+            decisions += sum((language == target) == (expected == target) for target in TARGET_LANGUAGES)
+    elapsed = time.perf_counter() - start_time
+    calls = repeats * len(samples)
+    return {
+        "accuracy": correct / calls,
+        "decisions": decisions / (calls * len(TARGET_LANGUAGES)),
+        "unstable": sum(len(found) > 1 for found in answers.values()) / len(samples),
+        "ms_per_call": elapsed / calls * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение определителей языка: прежний (langdetect) и новый")
+    parser.add_argument("--repeats", type=int, default=20, help="Количество прогонов всех текстов")
+    parser.add_argument("--long", action="store_true", help="Повторить тексты до 1000 символов")
+    args = parser.parse_args()
+
+    sample_sets = (("основные", SAMPLES), ("короткие", SHORT_SAMPLES), ("другие языки", OTHER_LANGUAGE_SAMPLES))
+    if args.long:
+        sample_sets = tuple(
+            (name, [(expected, (text + " ") * (1000 // len(text) + 1)) for expected, text in samples])
+            for name, samples in sample_sets)
+
+    print(f"{'тексты':<14} {'определитель':<14} {'точность':>9} {'перевод':>9} {'нестабильных':>13} {'мс на текст':>12}")
+    for set_name, samples in sample_sets:
+        for name, detector in (("langdetect", legacy_detect_language), ("новый", detect_language)):
+            result = benchmark(detector, samples, args.repeats)
+            print(f"{set_name:<14} {name:<14} {result['accuracy']:>9.1%} {result['decisions']:>9.1%} "
+                  f"{result['unstable']:>13.1%} {result['ms_per_call']:>12.3f}")
+
+    print("\nОшибки нового определителя:")
+    for _, samples in sample_sets:
+        for expected, text in samples:
+            language = detect_language(text)
+            if language != expected:
+                print(f"  ожидался {expected}, получен {language}: {text[:60]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, Any
+
+from mock_openai_server import MockOpenAIServer
+from benchmark_upload_profiles import make_synthetic_audio
+
+# Сообщения обработки раздела конспекта (нагрузка та же, что у промптов приложения)
+HANDBOOK_PROMPTS = ("Ты составляешь конспект лекции.", "Составь конспект раздела:")
+
+# Одна задача конвейера: транскрибация, разбивка на абзацы, перевод, конспект
+async def run_job(utils, audio_path: str, job_index: int, save_dir: str, target_language: str) -> Dict[str, Any]:
+    """
+    Выполняет конвейер для одного файла и замеряет время стадий
+
+    Args:
+        utils: Модуль utils (импортируется после настройки адреса API)
+        audio_path: Путь к аудио файлу
+        job_index: Номер задачи
+        save_dir: Папка для результатов
+        target_language: Язык перевода
+
+    Returns:
+        Словарь с длительностями стадий (в секундах)
+    """
+    timings = {}
+    start_time = time.perf_counter()
+    text, _ = await utils.transcribe_audio_whisper_async(
+        audio_path, f"job_{job_index}", save_dir, use_cache=False, resume=False)
+    timings["transcribe"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    text = await utils.format_transcription_paragraphs_async(text)
+    timings["paragraphs"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    text = await utils.translate_text_gpt_async(text, target_language)
+    timings["translate"] = time.perf_counter() - start_time
+
+    # Конспект, как в create_handbook: разделы, затем обработка разделов (длинный текст - иерархически)
+    start_time = time.perf_counter()
+    md_text = await utils.section_text_async(text, target_language)
+    summarize = (utils.summarize_documents_tree_async
+                 if utils.num_tokens_from_string(text) > utils.HANDBOOK_TREE_MIN_TOKENS
+                 else utils.process_documents_async)
+    await summarize(save_dir, utils.split_markdown_text(md_text), *HANDBOOK_PROMPTS,
+                    f"job_{job_index}", target_language)
+    timings["handbook"] = time.perf_counter() - start_time
+    return timings
+
+# Та же задача в конвейерном режиме: стадии обрабатывают готовые фрагменты во время транскрибации
+async def run_pipelined_job(audio_path: str, job_index: int, save_dir: str, target_language: str) -> Dict[str, Any]:
+    """
+    Выполняет конвейер для одного файла через pipeline.run_pipeline_async
+
+    Args:
+        audio_path: Путь к аудио файлу
+        job_index: Номер задачи
+        save_dir: Папка для результатов
+        target_language: Язык перевода
+
+    Returns:
+        Словарь с общей длительностью задачи (в секундах)
+    """
+    from pipeline import run_pipeline_async
+
+    start_time = time.perf_counter()
+    await run_pipeline_async(audio_path, f"job_{job_index}", save_dir, target_language,
+                             force_translation=True, use_cache=False, resume=False)
+    return {"total": time.perf_counter() - start_time}
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный тест конвейера (транскрибация - абзацы - перевод - конспект) "
+                    "на локальной заглушке OpenAI API")
+    parser.add_argument("audio", nargs="*", help="Аудио или видео файлы (по умолчанию - синтетическая запись)")
+    parser.add_argument("--synthetic", type=float, default=15, help="Длительность синтетической записи (в минутах)")
+    parser.add_argument("--jobs", type=int, default=8, help="Количество одновременных задач")
+    parser.add_argument("--latency", type=float, default=0.5, help="Базовая задержка ответа заглушки (с)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Случайная добавка к задержке (с)")
+    parser.add_argument("--audio-speed", type=float, default=60.0,
+                        help="Скорость транскрибации заглушки, секунд звука за секунду")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Доля ответов 500/503")
+    parser.add_argument("--rpm", type=int, default=None, help="Лимит запросов в минуту")
+    parser.add_argument("--tpm", type=int, default=None, help="Лимит токенов в минуту")
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора ошибок и задержек")
+    parser.add_argument("--target-language", default="английский")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Конвейерный режим: абзацы и перевод фрагментов во время транскрибации")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(port=0, latency=args.latency, jitter=args.jitter, audio_speed=args.audio_speed,
+                              error_rate=args.error_rate, rpm=args.rpm, tpm=args.tpm, seed=args.seed)
+    os.environ["OPENAI_BASE_URL"] = server.start()
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    # Ответы модели не берутся из кэша LLM_CACHE: иначе повторный запуск не нагружает заглушку
+    os.environ["LLM_CACHE_DISABLED"] = "1"
+
+    # Импорт после настройки адреса: общий клиент создаётся уже для заглушки
+    import utils
+    from openai_client import get_retry_stats, run_sync
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        audio_files = list(args.audio) or [
+            make_synthetic_audio(os.path.join(work_dir, "synthetic.wav"), args.synthetic)]
+
+        async def run_all():
+            if args.pipelined:
+                jobs = [run_pipelined_job(audio_files[index % len(audio_files)], index, work_dir, args.target_language)
+                        for index in range(args.jobs)]
+            else:
+                jobs = [run_job(utils, audio_files[index % len(audio_files)], index, work_dir, args.target_language)
+                        for index in range(args.jobs)]
+            return await asyncio.gather(*jobs)
+
+        start_time = time.perf_counter()
+        results = run_sync(run_all())
+        total_seconds = time.perf_counter() - start_time
+
+        print(f"\nЗадач: {args.jobs}, общее время: {total_seconds:.2f} с, "
+              f"задач в минуту: {args.jobs / total_seconds * 60:.1f}")
+        for stage in (("total",) if args.pipelined else ("transcribe", "paragraphs", "translate", "handbook")):
+            durations = sorted(result[stage] for result in results)
+            print(f"{stage:<12} среднее {sum(durations) / len(durations):>7.2f} с, "
+                  f"максимум {durations[-1]:>7.2f} с")
+        print(f"Заглушка: {server.stats}")
+        for call_site, stats in get_retry_stats().items():
+            print(f"{call_site:<32} {stats}")
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from typing import Dict, Any, Optional
+
+import utils
+from benchmark_upload_profiles import make_synthetic_audio
+
+# Замер одного коэффициента ускорения
+def benchmark_tempo(audio_path: str,
+                    tempo: float,
+                    profile: str,
+                    max_duration: Optional[int],
+                    transcribe: bool = False) -> Dict[str, Any]:
+    """
+    Нарезает запись с ускорением tempo так же, как transcribe_audio_whisper,
+    и замеряет количество фрагментов, объём загрузки и время обработки.
+    С transcribe=True дополнительно замеряется полная транскрибация (запросы к API).
+
+    Args:
+        audio_path: Путь к аудио файлу
+        tempo: Коэффициент ускорения речи
+        profile: Название профиля из utils.UPLOAD_PROFILES
+        max_duration: Максимальная длительность фрагмента (в миллисекундах) или None
+        transcribe: Выполнить полную транскрибацию
+
+    Returns:
+        Словарь с результатами замера
+    """
+    settings = utils.UPLOAD_PROFILES[profile]
+    total_duration = int(utils.probe_audio(audio_path).duration_seconds * 1000)
+    chunk_duration = utils.max_chunk_duration_ms(settings["bitrate_kbps"])
+    if max_duration is not None:
+        chunk_duration = min(chunk_duration, max_duration)
+    spans = utils._fixed_chunk_spans(total_duration, int(chunk_duration * tempo))
+
+    temp_dir = tempfile.mkdtemp()
+    total_bytes = 0
+    start_time = time.perf_counter()
+    try:
+        for index, (start_ms, end_ms) in enumerate(spans, start=1):
+            chunk_path = os.path.join(temp_dir, f"chunk_{index}.{settings['extension']}")
+            utils.export_audio_chunk(audio_path, chunk_path, start_ms, end_ms - start_ms, profile, tempo)
+            total_bytes += os.path.getsize(chunk_path)
+            os.remove(chunk_path)
+        encode_seconds = time.perf_counter() - start_time
+
+        transcribe_seconds = None
+        if transcribe:
+            start_time = time.perf_counter()
+            utils.transcribe_audio_whisper(audio_path, f"tempo_{tempo}", temp_dir,
+                                           max_duration=max_duration, upload_profile=profile,
+                                           use_cache=False, resume=False, tempo=tempo)
+            transcribe_seconds = time.perf_counter() - start_time
+    finally:
+        shutil.rmtree(temp_dir)
+
+    return {
+        "tempo": tempo,
+        "chunks": len(spans),
+        "bytes": total_bytes,
+        "billed_minutes": total_duration / tempo / 60000,
+        "encode_seconds": encode_seconds,
+        "transcribe_seconds": transcribe_seconds
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер режима ускорения речи (atempo) для Whisper API")
+    parser.add_argument("audio", nargs="*", help="Аудио или видео файлы для замера")
+    parser.add_argument("--synthetic", type=float, default=0,
+                        help="Добавить синтетическую запись указанной длительности (в минутах)")
+    parser.add_argument("--tempos", nargs="+", type=float, default=[1.0, 1.25, 1.5, 2.0],
+                        help="Коэффициенты ускорения для сравнения")
+    parser.add_argument("--profile", default=utils.DEFAULT_UPLOAD_PROFILE, choices=list(utils.UPLOAD_PROFILES),
+                        help="Профиль кодирования фрагментов")
+    parser.add_argument("--max-duration-min", type=float, default=None,
+                        help="Ограничение длительности фрагмента в минутах (по умолчанию - только лимит размера API)")
+    parser.add_argument("--transcribe", action="store_true",
+                        help="Замерить и полную транскрибацию (запросы к API)")
+    args = parser.parse_args()
+
+    audio_files = list(args.audio)
+    synthetic_dir = None
+    if args.synthetic:
+        synthetic_dir = tempfile.mkdtemp()
+        audio_files.append(make_synthetic_audio(os.path.join(synthetic_dir, "synthetic.wav"), args.synthetic))
+    if not audio_files:
+        parser.error("Укажите хотя бы один файл или --synthetic")
+
+    max_duration = int(args.max_duration_min * 60 * 1000) if args.max_duration_min else None
+
+    try:
+        for audio_path in audio_files:
+            info = utils.probe_audio(audio_path)
+            print(f"\n{os.path.basename(audio_path)}: {info.duration_seconds / 60:.1f} мин., профиль {args.profile}")
+            print(f"{'ускорение':<10} {'фрагментов':>10} {'МБ':>9} {'минут к оплате':>15} "
+                  f"{'кодирование, с':>15} {'транскрибация, с':>17}")
+            for tempo in args.tempos:
+                result = benchmark_tempo(audio_path, tempo, args.profile, max_duration, args.transcribe)
+                transcribe_seconds = result["transcribe_seconds"]
+                print(f"{result['tempo']:<10.2f} {result['chunks']:>10} "
+                      f"{result['bytes'] / 1024 / 1024:>9.2f} {result['billed_minutes']:>15.1f} "
+                      f"{result['encode_seconds']:>15.2f} "
+                      f"{'-' if transcribe_seconds is None else f'{transcribe_seconds:.2f}':>17}")
+    finally:
+        if synthetic_dir:
+            shutil.rmtree(synthetic_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, Any, Optional
+
+import utils
+
+# Создание синтетической записи для замеров
+def make_synthetic_audio(path: str, minutes: float) -> str:
+    """
+    Генерирует стерео 44.1 кГц запись с тоном и паузами (имитация речи с паузами).
+
+    Args:
+        path: Путь для сохранения файла
+        minutes: Длительность записи в минутах
+
+    Returns:
+        Путь к созданному файлу
+    """
+    ffmpeg_bin = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+    subprocess.run([
+        ffmpeg_bin, "-v", "error", "-y",
+        "-f", "lavfi",
+        "-i", f"aevalsrc=0.5*sin(2*PI*220*t)*lt(mod(t\\,7)\\,6)+0.05*random(0):s=44100:d={minutes * 60}",
+        "-ac", "2",
+        path
+    ], check=True, capture_output=True)
+    return path
+
+# Замер одного профиля кодирования
+def benchmark_profile(audio_path: str, profile: str, max_duration: Optional[int]) -> Dict[str, Any]:
+    """
+    Нарезает запись на фрагменты по профилю так же, как transcribe_audio_whisper,
+    и замеряет объём загрузки, время кодирования и количество фрагментов.
+
+    Args:
+        audio_path: Путь к аудио файлу
+        profile: Название профиля из utils.UPLOAD_PROFILES
+        max_duration: Максимальная длительность фрагмента (в миллисекундах) или None
+
+    Returns:
+        Словарь с результатами замера
+    """
+    settings = utils.UPLOAD_PROFILES[profile]
+    total_duration = int(utils.probe_audio(audio_path).duration_seconds * 1000)
+    chunk_duration = utils.max_chunk_duration_ms(settings["bitrate_kbps"])
+    if max_duration is not None:
+        chunk_duration = min(chunk_duration, max_duration)
+    spans = utils._fixed_chunk_spans(total_duration, chunk_duration)
+
+    temp_dir = tempfile.mkdtemp()
+    total_bytes = 0
+    largest_chunk = 0
+    start_time = time.perf_counter()
+    try:
+        for index, (start_ms, end_ms) in enumerate(spans, start=1):
+            chunk_path = os.path.join(temp_dir, f"chunk_{index}.{settings['extension']}")
+            utils.export_audio_chunk(audio_path, chunk_path, start_ms, end_ms - start_ms, profile)
+            size = os.path.getsize(chunk_path)
+            total_bytes += size
+            largest_chunk = max(largest_chunk, size)
+            os.remove(chunk_path)
+    finally:
+        shutil.rmtree(temp_dir)
+
+    return {
+        "profile": profile,
+        "chunks": len(spans),
+        "bytes": total_bytes,
+        "largest_chunk": largest_chunk,
+        "encode_seconds": time.perf_counter() - start_time
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение профилей кодирования фрагментов для Whisper API")
+    parser.add_argument("audio", nargs="*", help="Аудио или видео файлы для замера")
+    parser.add_argument("--synthetic", type=float, default=0,
+                        help="Добавить синтетическую запись указанной длительности (в минутах)")
+    parser.add_argument("--profiles", nargs="+", default=list(utils.UPLOAD_PROFILES),
+                        help="Профили для сравнения")
+    parser.add_argument("--max-duration-min", type=float, default=None,
+                        help="Ограничение длительности фрагмента в минутах (по умолчанию - только лимит размера API)")
+    args = parser.parse_args()
+
+    audio_files = list(args.audio)
+    synthetic_dir = None
+    if args.synthetic:
+        synthetic_dir = tempfile.mkdtemp()
+        audio_files.append(make_synthetic_audio(os.path.join(synthetic_dir, "synthetic.wav"), args.synthetic))
+    if not audio_files:
+        parser.error("Укажите хотя бы один файл или --synthetic")
+
+    max_duration = int(args.max_duration_min * 60 * 1000) if args.max_duration_min else None
+
+    try:
+        for audio_path in audio_files:
+            info = utils.probe_audio(audio_path)
+            print(f"\n{os.path.basename(audio_path)}: {info.duration_seconds / 60:.1f} мин., "
+                  f"{info.frame_rate} Гц, каналов: {info.channels}")
+            print(f"{'профиль':<12} {'фрагментов':>10} {'МБ':>9} {'макс. МБ':>9} {'кодирование, с':>15}")
+            for profile in args.profiles:
+                result = benchmark_profile(audio_path, profile, max_duration)
+                print(f"{result['profile']:<12} {result['chunks']:>10} "
+                      f"{result['bytes'] / 1024 / 1024:>9.2f} {result['largest_chunk'] / 1024 / 1024:>9.2f} "
+                      f"{result['encode_seconds']:>15.2f}")
+    finally:
+        if synthetic_dir:
+            shutil.rmtree(synthetic_dir)
+
+if __name__ == "__main__":
+    main()
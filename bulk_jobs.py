@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from openai_client import iterate_sync
+from batch_client import BATCH_MAX_ROUNDS, BATCH_POLL_INTERVAL, BATCH_REQUEST_MAX_ATTEMPTS, run_batched
+from pipeline import TARGET_LANGUAGE_CODES, source_language_code
+from utils import (
+    HANDBOOK_TREE_MIN_TOKENS, SUMMARY_MAX_LEVELS, num_tokens_from_string, split_markdown_text,
+    format_transcription_paragraphs_async, translate_text_gpt_async, section_text_async,
+    process_documents_async, summarize_documents_tree_async
+)
+
+logger = logging.getLogger('bulk_jobs')
+
+# Зависимые стадии обработки файла (каждая - отдельный раунд пакетов): абзацы, перевод,
+# разделы, конспект разделов и до SUMMARY_MAX_LEVELS уровней иерархической свёртки
+BULK_STAGES = 4 + SUMMARY_MAX_LEVELS
+# Раундов хватает, даже если запросы каждой стадии повторяются в пакете до BATCH_REQUEST_MAX_ATTEMPTS раз
+BULK_MAX_ROUNDS = max(BATCH_MAX_ROUNDS, BULK_STAGES * BATCH_REQUEST_MAX_ATTEMPTS)
+
+class BulkFileResult:
+    """
+    Результат пакетной обработки одного файла
+    """
+
+    def __init__(self, file_name: str, transcription: str, language: Optional[str],
+                 translation: Optional[str] = None, handbook: Optional[str] = None,
+                 md_processed_text: Optional[str] = None, error: Optional[str] = None):
+        """
+        Args:
+            file_name: Имя файла без расширения
+            transcription: Транскрипция, разбитая на абзацы (исходная транскрипция, если обработка не удалась)
+            language: Код языка оригинала
+            translation: Перевод или None, если перевод не требовался
+            handbook: Текст конспекта или None
+            md_processed_text: Текст с разделами, по которому составлен конспект
+            error: Сообщение об ошибке, если обработка файла не удалась
+        """
+        self.file_name = file_name
+        self.transcription = transcription
+        self.language = language
+        self.translation = translation
+        self.handbook = handbook
+        self.md_processed_text = md_processed_text
+        self.error = error
+
+# Обработка транскрипции одного файла: абзацы, перевод, конспект
+async def process_transcript_async(file_name: str, transcription: str, language: Optional[str],
+                                   target_language: str, save_folder_path: str,
+                                   summary_prompts: Optional[Tuple[str, str]] = None) -> BulkFileResult:
+    """
+    Выполняет для транскрипции те же стадии, что и обработчики приложения:
+    разбивку на абзацы, перевод (если язык оригинала отличается от целевого)
+    и конспект (разделы, затем обработка каждого раздела).
+
+    Args:
+        file_name: Имя файла без расширения
+        transcription: Текст транскрипции
+        language: Язык, который вернула транскрибация
+        target_language: Целевой язык ("русский", "казахский", "английский")
+        save_folder_path: Папка для черновика конспекта
+        summary_prompts: Системное и пользовательское сообщения обработки раздела (None - без конспекта)
+
+    Returns:
+        Результат обработки файла
+    """
+    paragraphs = await format_transcription_paragraphs_async(transcription)
+    language_code = source_language_code(language, paragraphs)
+    translation = None
+    if language_code != TARGET_LANGUAGE_CODES.get(target_language.lower(), "ru"):
+        translation = await translate_text_gpt_async(paragraphs, target_language)
+    result = BulkFileResult(file_name, paragraphs, language_code, translation)
+    if not summary_prompts:
+        return result
+
+    # Разбивка на разделы и конспект, как в create_handbook
+    text = translation if translation is not None else paragraphs
+    md_processed_text = await section_text_async(text, target_language)
+    result.md_processed_text = md_processed_text
+    # Длинный текст конспектируется иерархически, как в create_handbook
+    summarize = (summarize_documents_tree_async if num_tokens_from_string(text) > HANDBOOK_TREE_MIN_TOKENS
+                 else process_documents_async)
+    result.handbook = await summarize(
+        save_folder_path, split_markdown_text(md_processed_text), *summary_prompts, file_name, target_language)
+    return result
+
+# Пакетная обработка транскрипций нескольких файлов, асинхронная версия
+async def run_bulk_jobs_async(transcripts: List[Tuple[str, str, Optional[str]]], target_language: str,
+                              save_folder_path: str, work_dir: str,
+                              summary_prompts: Optional[Tuple[str, str]] = None,
+                              poll_interval: float = BATCH_POLL_INTERVAL,
+                              on_status: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[BulkFileResult]:
+    """
+    Обрабатывает транскрипции всех файлов папки, отправляя все запросы к модели
+    через Batch API: по одному пакету на зависимую стадию (абзацы, перевод,
+    разделы, конспект) для всех файлов сразу. Лимиты запросов в минуту не
+    расходуются, стоимость ниже, но результат готов только после выполнения пакетов.
+
+    Args:
+        transcripts: Список (имя файла, транскрипция, язык транскрибации)
+        target_language: Целевой язык
+        save_folder_path: Папка для черновиков конспектов
+        work_dir: Папка для файлов пакетов (JSONL)
+        summary_prompts: Сообщения обработки раздела (None - без конспекта)
+        poll_interval: Пауза между проверками состояния пакета (в секундах)
+        on_status: Функция, получающая состояние пакета при каждой проверке
+
+    Returns:
+        Результаты в порядке файлов; при ошибке файла - результат с заполненным error
+    """
+    jobs = [
+        lambda file_name=file_name, transcription=transcription, language=language: process_transcript_async(
+            file_name, transcription, language, target_language, save_folder_path, summary_prompts)
+        for file_name, transcription, language in transcripts
+    ]
+    outcomes = await run_batched(jobs, work_dir, poll_interval, on_status, BULK_MAX_ROUNDS)
+
+    results = []
+    for (file_name, transcription, language), outcome in zip(transcripts, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error(f"Файл {file_name} не обработан: {outcome}")
+            outcome = BulkFileResult(file_name, transcription, language, error=str(outcome))
+        results.append(outcome)
+    return results
+
+# Пакетная обработка транскрипций нескольких файлов
+def run_bulk_jobs(transcripts: List[Tuple[str, str, Optional[str]]], target_language: str,
+                  save_folder_path: str, work_dir: str,
+                  summary_prompts: Optional[Tuple[str, str]] = None,
+                  poll_interval: float = BATCH_POLL_INTERVAL,
+                  on_status: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[BulkFileResult]:
+    """
+    Синхронная обёртка над run_bulk_jobs_async (аргументы и результат те же).
+    on_status вызывается в потоке вызывающего кода, поэтому может обновлять интерфейс.
+    """
+    async def events():
+        statuses: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(run_bulk_jobs_async(
+            transcripts, target_language, save_folder_path, work_dir, summary_prompts,
+            poll_interval, statuses.put_nowait))
+        try:
+            while not task.done() or not statuses.empty():
+                next_status = asyncio.create_task(statuses.get())
+                await asyncio.wait({next_status, task}, return_when=asyncio.FIRST_COMPLETED)
+                if next_status.done():
+                    yield "status", next_status.result()
+                else:
+                    next_status.cancel()
+            yield "result", await task
+        finally:
+            task.cancel()
+
+    results = []
+    for kind, value in iterate_sync(events()):
+        if kind == "status" and on_status:
+            on_status(value)
+        elif kind == "result":
+            results = value
+    return results
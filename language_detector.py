@@ -0,0 +1,397 @@
+import math
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Запасной определитель для языков вне модели (необязательная зависимость).
+# Зерно фиксируется один раз, чтобы результат был детерминирован.
+try:
+    from langdetect import DetectorFactory, LangDetectException, detect_langs
+    DetectorFactory.seed = 0
+except ImportError:
+    detect_langs = None
+
+# Размер анализируемого фрагмента текста (в символах)
+SAMPLE_CHARS = 1000
+
+# Диапазоны кодовых точек письменностей: (начало, конец не включительно, письменность).
+# Диапазоны не пересекаются и отсортированы по началу.
+_SCRIPT_RANGES = [
+    (0x0041, 0x005B, "latin"), (0x0061, 0x007B, "latin"),
+    (0x00C0, 0x0250, "latin"),
+    (0x0370, 0x0400, "greek"),
+    (0x0400, 0x0530, "cyrillic"),
+    (0x0530, 0x0590, "armenian"),
+    (0x0590, 0x0600, "hebrew"),
+    (0x0600, 0x0700, "arabic"),
+    (0x0900, 0x0980, "devanagari"),
+    (0x0E00, 0x0E80, "thai"),
+    (0x10A0, 0x1100, "georgian"),
+    (0x1100, 0x1200, "hangul"),
+    (0x1E00, 0x1F00, "latin"),
+    (0x3040, 0x3100, "kana"),
+    (0x3130, 0x3190, "hangul"),
+    (0x4E00, 0xA000, "han"),
+    (0xAC00, 0xD7A4, "hangul"),
+]
+_SCRIPTS = sorted({script for _, _, script in _SCRIPT_RANGES})
+
+# Языки, однозначно определяемые по письменности
+_SCRIPT_LANGUAGES = {
+    "greek": "el", "armenian": "hy", "hebrew": "he", "arabic": "ar", "devanagari": "hi",
+    "thai": "th", "georgian": "ka", "hangul": "ko"
+}
+
+# Границы диапазонов для np.searchsorted: чётные интервалы - письменности, нечётные - прочие символы
+_RANGE_BOUNDS = np.array([bound for start, end, _ in _SCRIPT_RANGES for bound in (start, end)], dtype=np.uint32)
+_RANGE_SCRIPT_INDEX = np.array([_SCRIPTS.index(script) for _, _, script in _SCRIPT_RANGES])
+
+# Обучающие тексты n-граммной модели для языков на кириллице и латинице
+_TRAINING_SAMPLES = {
+    "cyrillic": {
+        "ru": "Сегодня мы поговорим о том, как правильно организовать работу с данными. Это очень важная "
+              "тема, потому что каждый день мы получаем всё больше информации. Если вы хотите добиться "
+              "результата, нужно понимать, что происходит на рынке и почему цены меняются. В этом видео я "
+              "расскажу, какие инструменты помогут вам принимать решения быстрее. Давайте начнём с самого "
+              "простого примера и посмотрим, что получится. Спасибо, что смотрите наш канал, не забудьте "
+              "подписаться и поставить лайк. Здесь уже есть ответ на этот вопрос, а дальше будет ещё интереснее.",
+        "kk": "Бүгін біз деректермен жұмысты қалай дұрыс ұйымдастыру керектігі туралы сөйлесеміз. Бұл өте "
+              "маңызды тақырып, өйткені күн сайын біз көбірек ақпарат аламыз. Егер сіз нәтижеге жеткіңіз "
+              "келсе, нарықта не болып жатқанын және бағалардың неге өзгеретінін түсіну қажет. Осы бейнеде "
+              "мен сізге шешімдерді тезірек қабылдауға көмектесетін құралдар туралы айтып беремін. Ең "
+              "қарапайым мысалдан бастайық және не шығатынын көрейік. Біздің арнаны көргеніңіз үшін рахмет, "
+              "жазылуды ұмытпаңыз. Бұл сұрақтың жауабы осында, ал әрі қарай одан да қызықты болады.",
+        "mk": "Денес ќе зборуваме за тоа како правилно да се организира работата со податоците. Ова е многу "
+              "важна тема, бидејќи секој ден добиваме сè повеќе информации. Ако сакате да постигнете "
+              "резултат, треба да разберете што се случува на пазарот и зошто цените се менуваат. Во ова "
+              "видео ќе ви кажам кои алатки ќе ви помогнат побрзо да донесувате одлуки. Да почнеме со "
+              "наједноставниот пример и да видиме што ќе се случи. Ви благодариме што го гледате нашиот "
+              "канал, не заборавајте да се претплатите. Тука веќе има одговор на ова прашање, а понатаму ќе "
+              "биде уште поинтересно.",
+        "uk": "Сьогодні ми поговоримо про те, як правильно організувати роботу з даними. Це дуже важлива "
+              "тема, тому що щодня ми отримуємо все більше інформації. Якщо ви хочете досягти результату, "
+              "потрібно розуміти, що відбувається на ринку і чому ціни змінюються. У цьому відео я розповім, "
+              "які інструменти допоможуть вам ухвалювати рішення швидше. Почнімо з найпростішого прикладу і "
+              "подивимося, що вийде. Дякуємо, що дивитеся наш канал, не забудьте підписатися. Тут вже є "
+              "відповідь на це питання, а далі буде ще цікавіше.",
+        "bg": "Днес ще говорим за това как правилно да организираме работата с данните. Това е много важна "
+              "тема, защото всеки ден получаваме все повече информация. Ако искате да постигнете резултат, "
+              "трябва да разбирате какво се случва на пазара и защо цените се променят. В това видео ще ви "
+              "разкажа кои инструменти ще ви помогнат да вземате решения по-бързо. Нека започнем с "
+              "най-простия пример и да видим какво ще се получи. Благодарим ви, че гледате нашия канал, не "
+              "забравяйте да се абонирате. Тук вече има отговор на този въпрос, а нататък ще бъде още по-интересно.",
+    },
+    "latin": {
+        "en": "Today we are going to talk about how to organize your work with data properly. This is a very "
+              "important topic, because every day we receive more and more information. If you want to get "
+              "results, you need to understand what is happening in the market and why prices change. In this "
+              "video I will tell you which tools will help you make decisions faster. Let's start with the "
+              "simplest example and see what happens. Thank you for watching our channel, and don't forget to "
+              "subscribe. The answer to this question is already here, and then it gets even more interesting.",
+        "de": "Heute sprechen wir darüber, wie man die Arbeit mit Daten richtig organisiert. Das ist ein sehr "
+              "wichtiges Thema, weil wir jeden Tag mehr und mehr Informationen bekommen. Wenn Sie Ergebnisse "
+              "erzielen wollen, müssen Sie verstehen, was auf dem Markt passiert und warum sich die Preise "
+              "ändern. In diesem Video erkläre ich Ihnen, welche Werkzeuge Ihnen helfen, schneller "
+              "Entscheidungen zu treffen. Fangen wir mit dem einfachsten Beispiel an und schauen wir, was "
+              "passiert. Danke, dass Sie unseren Kanal ansehen, und vergessen Sie nicht zu abonnieren.",
+        "fr": "Aujourd'hui, nous allons parler de la manière d'organiser correctement le travail avec les "
+              "données. C'est un sujet très important, car chaque jour nous recevons de plus en plus "
+              "d'informations. Si vous voulez obtenir des résultats, vous devez comprendre ce qui se passe sur "
+              "le marché et pourquoi les prix changent. Dans cette vidéo, je vais vous expliquer quels outils "
+              "vous aideront à prendre des décisions plus rapidement. Commençons par l'exemple le plus simple "
+              "et voyons ce qui se passe. Merci de regarder notre chaîne et n'oubliez pas de vous abonner.",
+        "es": "Hoy vamos a hablar de cómo organizar correctamente el trabajo con los datos. Es un tema muy "
+              "importante, porque cada día recibimos más y más información. Si quieres obtener resultados, "
+              "necesitas entender lo que está pasando en el mercado y por qué cambian los precios. En este "
+              "vídeo te contaré qué herramientas te ayudarán a tomar decisiones más rápido. Empecemos con el "
+              "ejemplo más sencillo y veamos qué pasa. Gracias por ver nuestro canal y no olvides suscribirte "
+              "y darle me gusta al vídeo.",
+        "it": "Oggi parleremo di come organizzare correttamente il lavoro con i dati. È un argomento molto "
+              "importante, perché ogni giorno riceviamo sempre più informazioni. Se volete ottenere dei "
+              "risultati, dovete capire che cosa succede sul mercato e perché i prezzi cambiano. In questo "
+              "video vi spiegherò quali strumenti vi aiuteranno a prendere decisioni più velocemente. "
+              "Cominciamo con l'esempio più semplice e vediamo che cosa succede. Grazie per aver guardato il "
+              "nostro canale e non dimenticate di iscrivervi.",
+        "pt": "Hoje vamos falar sobre como organizar corretamente o trabalho com os dados. Este é um tema "
+              "muito importante, porque todos os dias recebemos cada vez mais informações. Se você quer obter "
+              "resultados, precisa entender o que está acontecendo no mercado e por que os preços mudam. "
+              "Neste vídeo vou explicar quais ferramentas vão ajudar você a tomar decisões mais rapidamente. "
+              "Vamos começar com o exemplo mais simples e ver o que acontece. Obrigado por assistir ao nosso "
+              "canal e não se esqueça de se inscrever.",
+    }
+}
+
+_RUSSIAN_ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+_LATIN_ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+
+# Алфавиты языков модели: буквы вне алфавита исключают язык (ы/э/ё исключают
+# болгарский, македонский и украинский, і/ї/є - русский и болгарский и т.д.)
+_ALPHABETS = {
+    "ru": set(_RUSSIAN_ALPHABET),
+    "kk": set(_RUSSIAN_ALPHABET + "әғқңөұүһі"),
+    "mk": set("абвгдѓежзѕијклљмнњопрстќуфхцчџш"),
+    "uk": set("абвгґдеєжзиіїйклмнопрстуфхцчшщьюя"),
+    "bg": set("абвгдежзийклмнопрстуфхцчшщъьюя"),
+    "en": set(_LATIN_ALPHABET),
+    "de": set(_LATIN_ALPHABET + "äöüß"),
+    "fr": set(_LATIN_ALPHABET + "àâæçéèêëîïôœùûüÿ"),
+    "es": set(_LATIN_ALPHABET + "áéíñóúü"),
+    "it": set(_LATIN_ALPHABET + "àèéìíîòóùú"),
+    "pt": set(_LATIN_ALPHABET + "áâãàçéêíóôõúü"),
+}
+# Доля букв вне алфавита, при которой язык исключается (единичные имена и заимствования
+# в длинном тексте язык не исключают, в короткой фразе достаточно одной буквы)
+_FOREIGN_LETTERS_SHARE = 0.01
+
+# Признаки, без которых текст не считается текстом на языке: характерные буквы или слова.
+# Короткие фразы без таких признаков иначе легко спутать с близким языком.
+_MARKERS = {
+    "kk": (set("әғқңөұүһі"),
+           {"рахмет", "керек", "емес", "болады", "жарайды", "деп", "осы", "мына", "мен", "сен",
+            "сау", "болсын", "жатыр"}),
+    "mk": (set("ѓќљњѕџј"), {"што"}),
+    "uk": (set("іїєґ"), set()),
+    "bg": (set("ъ"), {"това", "че", "ще", "са", "като", "какво", "тук", "днес", "няма", "трябва", "също",
+                      "който", "която", "които"})
+}
+
+# Частые слова языков на латинице. На латинице пишут многие языки вне модели
+# (нидерландский, шведский, индонезийский...), поэтому язык модели рассматривается,
+# только если заметная доля слов текста - его частые слова.
+_COMMON_WORDS = {
+    "en": {"the", "a", "an", "and", "or", "but", "of", "to", "in", "on", "at", "for", "with", "from", "by",
+           "about", "as", "is", "are", "was", "were", "be", "been", "it", "its", "this", "that", "these",
+           "there", "here", "we", "you", "i", "he", "she", "they", "me", "my", "our", "your", "their", "what",
+           "where", "when", "how", "why", "who", "which", "so", "if", "not", "no", "yes", "do", "does", "did",
+           "have", "has", "had", "will", "would", "can", "could", "just", "get", "got", "let", "okay", "ok",
+           "right", "thanks", "thank", "good", "all", "any", "some", "more", "very", "everyone", "now"},
+    "de": {"der", "die", "das", "den", "dem", "des", "ein", "eine", "einen", "und", "oder", "aber", "ist",
+           "sind", "war", "wir", "sie", "ich", "du", "es", "er", "nicht", "zu", "mit", "auf", "für", "von",
+           "im", "in", "wie", "was", "dass", "auch", "noch", "heute", "danke", "wenn", "sehr", "schon", "hier",
+           "guten", "über"},
+    "fr": {"le", "la", "les", "un", "une", "des", "et", "ou", "mais", "de", "du", "est", "sont", "nous",
+           "vous", "je", "il", "elle", "ils", "ce", "cette", "que", "qui", "pour", "dans", "sur", "avec",
+           "pas", "plus", "très", "aujourd", "merci", "bonjour", "au", "en"},
+    "es": {"el", "la", "los", "las", "un", "una", "y", "o", "pero", "de", "del", "que", "es", "son", "en",
+           "por", "para", "con", "no", "sí", "muy", "hoy", "gracias", "vamos", "este", "esta", "lo", "se",
+           "como", "más", "a", "al", "hola", "todos", "buenos", "días"},
+    "it": {"il", "lo", "la", "i", "gli", "le", "un", "una", "e", "o", "ma", "di", "del", "che", "è", "sono",
+           "in", "per", "con", "non", "sì", "molto", "oggi", "grazie", "questo", "questa", "come", "più",
+           "si", "a", "al"},
+    "pt": {"o", "a", "os", "as", "um", "uma", "e", "ou", "mas", "de", "do", "da", "que", "é", "são", "em",
+           "por", "para", "com", "não", "sim", "muito", "hoje", "obrigado", "este", "esta", "como", "mais",
+           "se", "vamos", "no", "na", "olá", "todos", "bom", "dia"},
+}
+# Минимальная доля частых слов выбранного языка в тексте на латинице
+_COMMON_WORDS_MIN_SHARE = 0.25
+
+# Минимальная вероятность ответа langdetect для языка вне модели. На текстах
+# на другом языке langdetect уверен (>0.99), а на смеси языков или наборе
+# терминов ("market trend profit") его ответ случаен.
+_FALLBACK_MIN_PROBABILITY = 0.99
+
+# Штраф (в натах) для языков, которые редко встречаются в записях пользователей:
+# в коротких фразах без характерных признаков предпочтение получают русский и английский
+_RARE_LANGUAGE_PENALTY = 3.0
+_COMMON_LANGUAGES = {"ru", "kk", "en"}
+
+# Длины n-грамм символов, используемых моделью
+_NGRAM_SIZES = (1, 2, 3)
+
+# Вычисление гистограммы письменностей
+def script_histogram(text: str) -> Dict[str, int]:
+    """
+    Считает буквы каждой письменности за один векторный проход по кодовым точкам
+
+    Args:
+        text: Текст для анализа
+
+    Returns:
+        Словарь {письменность: количество букв}
+    """
+    code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    positions = np.searchsorted(_RANGE_BOUNDS, code_points, side="right")
+    # Нечётная позиция - символ внутри одного из диапазонов
+    in_range = positions % 2 == 1
+    counts = np.bincount(_RANGE_SCRIPT_INDEX[positions[in_range] // 2], minlength=len(_SCRIPTS))
+    return {script: int(count) for script, count in zip(_SCRIPTS, counts) if count}
+
+def _words(text: str) -> List[str]:
+    # Слова в нижнем регистре (все небуквенные символы - разделители)
+    return "".join(char if char.isalpha() else " " for char in text.lower()).split()
+
+def _ngrams(text: str) -> Counter:
+    # Слова отделены пробелами, чтобы учитывались начала и концы слов
+    padded = f" {' '.join(_words(text))} "
+    counts = Counter()
+    for size in _NGRAM_SIZES:
+        counts.update(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return counts
+
+@lru_cache(maxsize=None)
+def _ngram_model(script: str) -> Dict[str, Tuple[Dict[str, float], float]]:
+    """
+    Строит (один раз на процесс) модель n-грамм для языков письменности:
+    логарифмы сглаженных частот и логарифм частоты для незнакомых n-грамм
+    """
+    model = {}
+    for language, sample in _TRAINING_SAMPLES[script].items():
+        counts = _ngrams(sample)
+        total = sum(counts.values()) + len(counts) + 1
+        model[language] = ({ngram: math.log((count + 1) / total) for ngram, count in counts.items()},
+                           math.log(1 / total))
+    return model
+
+# Подсчёт букв письменности
+def _script_letters(text: str, script: str) -> Dict[str, int]:
+    """
+    Считает буквы письменности в тексте (в нижнем регистре) за один векторный
+    проход, как script_histogram
+
+    Returns:
+        Словарь {буква: количество}
+    """
+    code_points = np.frombuffer(text.lower().encode("utf-32-le"), dtype=np.uint32)
+    positions = np.searchsorted(_RANGE_BOUNDS, code_points, side="right")
+    in_range = positions % 2 == 1
+    scripts = _RANGE_SCRIPT_INDEX[positions[in_range] // 2]
+    values, counts = np.unique(code_points[in_range][scripts == _SCRIPTS.index(script)], return_counts=True)
+    return {chr(value): int(count) for value, count in zip(values, counts)}
+
+# Языки модели, которые не исключены алфавитом
+def _allowed_languages(text: str, script: str) -> List[str]:
+    """
+    Возвращает языки модели письменности, в алфавите которых есть почти все буквы
+    текста этой письменности (буквы других письменностей, например английские
+    термины в русском тексте, не учитываются)
+    """
+    letters = _script_letters(text, script)
+    total = sum(letters.values())
+    allowed = []
+    for language in _TRAINING_SAMPLES[script]:
+        foreign = sum(count for char, count in letters.items() if char not in _ALPHABETS[language])
+        if foreign < max(1, _FOREIGN_LETTERS_SHARE * total):
+            allowed.append(language)
+    return allowed
+
+# Оценки языков по модели n-грамм
+def _ngram_scores(text: str, script: str, languages: List[str]) -> Dict[str, float]:
+    counts = _ngrams(text)
+    scores = {}
+    for language in languages:
+        log_probs, unseen = _ngram_model(script)[language]
+        scores[language] = sum(count * log_probs.get(ngram, unseen) for ngram, count in counts.items())
+        if language not in _COMMON_LANGUAGES:
+            scores[language] -= _RARE_LANGUAGE_PENALTY
+    return scores
+
+# Выбор языка по модели n-грамм
+def _classify_ngrams(text: str, script: str) -> Optional[str]:
+    """
+    Выбирает язык среди языков модели, не исключённых алфавитом и имеющих
+    в тексте характерные признаки. Для латиницы рассматриваются языки с заметной
+    долей частых слов, а из них - языки с наибольшим числом частых слов.
+
+    Returns:
+        Код языка или None, если ни один язык модели не подходит
+    """
+    words = _words(text)
+    letters = set(text.lower())
+    candidates = []
+    for language in _allowed_languages(text, script):
+        markers = _MARKERS.get(language)
+        if markers and not (markers[0] & letters or markers[1].intersection(words)):
+            continue
+        candidates.append(language)
+    if script == "latin":
+        common = {language: sum(word in _COMMON_WORDS[language] for word in words) for language in candidates}
+        best = max(common.values(), default=0)
+        candidates = [language for language in candidates
+                      if common[language] == best and best >= _COMMON_WORDS_MIN_SHARE * len(words)]
+    if not candidates:
+        return None
+    scores = _ngram_scores(text, script, candidates)
+    # При равенстве побеждает первый язык списка - результат детерминирован
+    return max(scores, key=scores.get)
+
+# Определение языка вне модели
+def _fallback_language(text: str, script: str) -> Optional[str]:
+    """
+    Определяет язык текста, который модель не смогла отнести ни к одному из своих
+    языков, с помощью langdetect. Принимается только уверенный ответ, не исключённый
+    алфавитом (например, "ru" для узбекского текста отбрасывается).
+
+    Returns:
+        Код языка, "unknown" для текста на языке, исключённом алфавитом, или None,
+        если langdetect недоступен или не уверен
+    """
+    if detect_langs is None:
+        return None
+    try:
+        best = detect_langs(text)[0]
+    except LangDetectException:
+        return None
+    if best.prob < _FALLBACK_MIN_PROBABILITY:
+        return None
+    if best.lang in _TRAINING_SAMPLES[script] and best.lang not in _allowed_languages(text, script):
+        return "unknown"
+    return best.lang
+
+# Язык письменности по умолчанию
+def _default_language(text: str, script: str) -> str:
+    """
+    Выбирает по модели n-грамм среди основных языков письменности (ru, kk, en),
+    не исключённых алфавитом, без проверки характерных признаков
+
+    Returns:
+        Код языка или "unknown"
+    """
+    languages = [language for language in _allowed_languages(text, script) if language in _COMMON_LANGUAGES]
+    if not languages:
+        return "unknown"
+    scores = _ngram_scores(text, script, languages)
+    return max(scores, key=scores.get)
+
+# Определение языка текста
+def detect_language(text: str) -> str:
+    """
+    Определяет язык текста: сначала письменность по гистограмме кодовых точек,
+    затем для кириллицы и латиницы - язык по модели n-грамм символов среди языков,
+    не исключённых алфавитом. Если ни один язык модели не подходит, используется
+    вторая письменность текста, затем уверенный ответ langdetect (язык вне модели),
+    затем основной язык письменности. Результат детерминирован.
+
+    Args:
+        text: Текст для анализа
+
+    Returns:
+        Код языка ("ru", "en", "kk", "ko" и др.) или "unknown"
+    """
+    if not text or not text.strip():
+        return "unknown"
+
+    sample_text = text[:SAMPLE_CHARS]
+    histogram = script_histogram(sample_text)
+    if not histogram:
+        return "unknown"
+
+    # Японский текст смешивает кану и иероглифы, китайский - только иероглифы
+    if histogram.get("kana", 0) + histogram.get("han", 0) >= max(histogram.values()):
+        return "ja" if histogram.get("kana") else "zh"
+
+    script = max(histogram, key=histogram.get)
+    if script in _SCRIPT_LANGUAGES:
+        return _SCRIPT_LANGUAGES[script]
+    language = _classify_ngrams(sample_text, script)
+    if language:
+        return language
+    # Смесь кириллицы и латиницы (русский текст с английскими терминами):
+    # язык определяется по второй письменности, если она проходит проверки модели
+    for other_script in _TRAINING_SAMPLES:
+        if other_script != script and histogram.get(other_script):
+            language = _classify_ngrams(sample_text, other_script)
+            if language:
+                return language
+    return _fallback_language(sample_text, script) or _default_language(sample_text, script)
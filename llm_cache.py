@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger('llm_cache')
+
+# Файл кэша по умолчанию (можно переопределить переменной окружения)
+DEFAULT_LLM_CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "transcriptor_cache", "llm_responses.sqlite3")
+)
+# Максимальный суммарный размер ответов в кэше по умолчанию (в байтах)
+DEFAULT_LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+
+# Обход кэша для текущего контекста (например, сессии Streamlit): ответы не читаются
+# и не сохраняются. Для всего процесса кэш отключается переменной LLM_CACHE_DISABLED=1.
+llm_cache_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+class LLMResponseCache:
+    """
+    Дисковый кэш ответов chat completions в SQLite.
+    Ключ - хэш полного запроса (модель, температура, сообщения), поэтому повторный
+    запуск задачи после сбоя или перезапуска интерфейса получает готовые ответы
+    без запросов к API. При превышении лимита размера удаляются давно не
+    использованные ответы (LRU по времени последнего обращения).
+    """
+
+    def __init__(self, db_path: str = DEFAULT_LLM_CACHE_PATH, max_bytes: int = DEFAULT_LLM_CACHE_MAX_BYTES):
+        """
+        Инициализирует кэш и при необходимости создаёт базу
+
+        Args:
+            db_path: Путь к файлу базы SQLite
+            max_bytes: Максимальный суммарный размер ответов (в байтах)
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._stats_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Отдельное соединение на операцию: кэш вызывается из разных потоков
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[counter] += amount
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: List[Dict[str, str]]) -> str:
+        """
+        Формирует ключ кэша из полного запроса
+
+        Args:
+            model: Модель
+            temperature: Температура генерации
+            messages: Сообщения запроса
+
+        Returns:
+            Ключ записи кэша
+        """
+        payload = json.dumps({"model": model, "temperature": temperature, "messages": messages},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def enabled() -> bool:
+        """
+        Проверяет, используется ли кэш в текущем контексте
+        """
+        return not llm_cache_bypass.get() and os.environ.get("LLM_CACHE_DISABLED", "") not in ("1", "true", "yes")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Возвращает сохранённый ответ и отмечает его как недавно использованный
+
+        Args:
+            key: Ключ записи
+
+        Returns:
+            Текст ответа или None, если записи нет
+        """
+        try:
+            with self._connect() as connection:
+                row = connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка чтения кэша ответов: {e}")
+            row = None
+        self._count("hits" if row is not None else "misses")
+        return row[0] if row is not None else None
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Сохраняет ответ и при необходимости вытесняет старые записи
+
+        Args:
+            key: Ключ записи
+            response: Текст ответа
+        """
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, response, len(response.encode("utf-8")), time.time())
+                )
+                self._evict(connection)
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка записи в кэш ответов: {e}")
+            return
+        self._count("writes")
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        """
+        Удаляет давно не использованные ответы, пока кэш не уложится в лимит размера
+        """
+        total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in connection.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if total_size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total_size -= size
+        connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self._count("evictions", len(evicted))
+        logger.info(f"Из кэша ответов удалено записей: {len(evicted)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику кэша: попадания, промахи, записи, вытеснения,
+        количество записей и их суммарный размер
+
+        Returns:
+            Словарь со статистикой
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        try:
+            with self._connect() as connection:
+                stats["entries"], stats["bytes"] = connection.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        except sqlite3.Error:
+            pass
+        return stats
+
+    def clear(self) -> None:
+        """
+        Удаляет все записи кэша
+        """
+        with self._connect() as connection:
+            connection.execute("DELETE FROM responses")
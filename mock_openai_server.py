@@ -0,0 +1,549 @@
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import logging
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict, Optional, Tuple
+
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger('mock_openai_server')
+
+# Пути эндпоинтов файлов и пакетов Batch API
+_FILE_PATH = re.compile(r"/files/(?P<file_id>[^/]+)(?P<content>/content)?$")
+_BATCH_PATH = re.compile(r"/batches/(?P<batch_id>[^/]+)(?P<cancel>/cancel)?$")
+
+class MockOpenAIServer:
+    """
+    Локальная заглушка OpenAI API для нагрузочных тестов и замеров без оплаты запросов.
+    Имитирует эндпоинты /v1/audio/transcriptions, /v1/chat/completions, а также /v1/files
+    и /v1/batches (пакетная обработка chat completions через Batch API) с настраиваемой
+    задержкой, долей ошибок и лимитами в минуту (ответ 429 с Retry-After и заголовками
+    x-ratelimit-*). Ответы детерминированы: транскрипция зависит только от байтов
+    фрагмента, а chat completions возвращает текст последнего сообщения пользователя
+    (при "stream": true - по словам, событиями server-sent events).
+    Приложение направляется на заглушку переменной окружения OPENAI_BASE_URL.
+    """
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 8765,
+                 latency: float = 0.2,
+                 jitter: float = 0.1,
+                 audio_speed: float = 0.0,
+                 error_rate: float = 0.0,
+                 rpm: Optional[int] = None,
+                 tpm: Optional[int] = None,
+                 audio_bitrate_kbps: int = 32,
+                 language: str = "russian",
+                 max_output_tokens: Optional[int] = None,
+                 token_delay: float = 0.0,
+                 batch_delay: float = 1.0,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            host: Адрес для прослушивания
+            port: Порт (0 - любой свободный)
+            latency: Базовая задержка ответа (в секундах)
+            jitter: Случайная добавка к задержке, от 0 до jitter (в секундах)
+            audio_speed: Скорость транскрибации в секундах звука за секунду (0 - без учёта длительности)
+            error_rate: Доля запросов, завершающихся ошибкой 500/503
+            rpm: Лимит запросов в минуту (None - без лимита)
+            tpm: Лимит токенов chat completions в минуту (None - без лимита)
+            audio_bitrate_kbps: Битрейт фрагментов для оценки их длительности по размеру
+            language: Язык, который возвращается в verbose_json
+            max_output_tokens: Лимит вывода chat completions; более длинный ответ обрезается
+                с finish_reason "length" (None - без лимита)
+            token_delay: Пауза между фрагментами потокового ответа (в секундах)
+            batch_delay: Время выполнения одного пакета Batch API (в секундах)
+            seed: Зерно генератора ошибок и задержек (для воспроизводимых замеров)
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.audio_speed = audio_speed
+        self.error_rate = error_rate
+        self.audio_bitrate_kbps = audio_bitrate_kbps
+        self.language = language
+        self.max_output_tokens = max_output_tokens
+        self.token_delay = token_delay
+        self.batch_delay = batch_delay
+        self.random = random.Random(seed)
+        self.buckets = {name: TokenBucket(limit) for name, limit in (("requests", rpm), ("tokens", tpm)) if limit}
+        self.stats: Dict[str, int] = {"requests": 0, "errors": 0, "rate_limited": 0}
+        # Загруженные файлы и пакеты Batch API
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _MockRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """
+        Адрес API для OPENAI_BASE_URL (например, http://127.0.0.1:8765/v1)
+        """
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        """
+        Запускает сервер в фоновом потоке
+
+        Returns:
+            Адрес API
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-openai-server", daemon=True)
+        self._thread.start()
+        logger.info(f"Заглушка OpenAI API запущена: {self.base_url}")
+        return self.base_url
+
+    def stop(self) -> None:
+        """
+        Останавливает сервер
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.stats[counter] = self.stats.get(counter, 0) + 1
+
+    def admit(self, tokens: float) -> Tuple[bool, float, Dict[str, str]]:
+        """
+        Проверяет лимиты и списывает стоимость запроса
+
+        Args:
+            tokens: Стоимость запроса в токенах
+
+        Returns:
+            Кортеж (запрос принят, рекомендуемая пауза в секундах, заголовки x-ratelimit-*)
+        """
+        cost = {"requests": 1, "tokens": tokens}
+        with self._lock:
+            wait = max((bucket.wait_time(cost[name]) for name, bucket in self.buckets.items()), default=0.0)
+            if wait == 0:
+                for name, bucket in self.buckets.items():
+                    bucket.consume(cost[name])
+            headers = {}
+            for name, bucket in self.buckets.items():
+                headers[f"x-ratelimit-limit-{name}"] = str(int(bucket.capacity))
+                headers[f"x-ratelimit-remaining-{name}"] = str(max(0, int(bucket.level)))
+        return wait == 0, wait, headers
+
+    def delay(self, audio_seconds: float = 0.0) -> float:
+        """
+        Задержка ответа: базовая, случайная добавка и время обработки звука
+
+        Args:
+            audio_seconds: Длительность фрагмента (в секундах)
+
+        Returns:
+            Задержка в секундах
+        """
+        with self._lock:
+            extra = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+        processing = audio_seconds / self.audio_speed if self.audio_speed else 0.0
+        return self.latency + extra + processing
+
+    def should_fail(self) -> bool:
+        """
+        Решает, завершить ли запрос имитацией ошибки сервера
+        """
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+    def transcription(self, audio_bytes: bytes, response_format: str) -> Dict[str, Any]:
+        """
+        Формирует ответ транскрибации, зависящий только от содержимого фрагмента
+
+        Args:
+            audio_bytes: Байты фрагмента
+            response_format: Формат ответа ("json" или "verbose_json")
+
+        Returns:
+            Тело ответа
+        """
+        duration = self.audio_seconds(audio_bytes)
+        digest = hashlib.sha256(audio_bytes).hexdigest()[:12]
+        sentences = [f"Фрагмент {digest}, отрезок {index + 1}." for index in range(max(1, int(duration // 10)))]
+        text = " ".join(sentences)
+        if response_format != "verbose_json":
+            return {"text": text}
+        step = duration / len(sentences)
+        return {
+            "task": "transcribe",
+            "language": self.language,
+            "duration": duration,
+            "text": text,
+            "segments": [
+                {"id": index, "start": index * step, "end": (index + 1) * step, "text": sentence}
+                for index, sentence in enumerate(sentences)
+            ]
+        }
+
+    def audio_seconds(self, audio_bytes: bytes) -> float:
+        """
+        Оценивает длительность фрагмента по размеру при постоянном битрейте
+        """
+        return len(audio_bytes) * 8 / (self.audio_bitrate_kbps * 1000)
+
+    def chat_completion(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Формирует ответ chat completions: текст последнего сообщения пользователя,
+        обрезанный по лимиту вывода (finish_reason "length")
+
+        Args:
+            request: Тело запроса
+
+        Returns:
+            Тело ответа (chat.completion)
+        """
+        messages = request.get("messages", [])
+        user_messages = [message["content"] for message in messages if message.get("role") == "user"]
+        content = user_messages[-1] if user_messages else ""
+        # Грубая оценка токенов без токенизатора: ~4 символа на токен
+        prompt_tokens = sum(len(message.get("content", "")) for message in messages) // 4
+        completion_tokens = len(content) // 4
+        # Лимит вывода: из запроса (max_tokens / max_completion_tokens) или из настроек заглушки
+        output_limits = [limit for limit in (request.get("max_completion_tokens"), request.get("max_tokens"),
+                                             self.max_output_tokens) if limit]
+        finish_reason = "stop"
+        if output_limits and completion_tokens > min(output_limits):
+            completion_tokens = min(output_limits)
+            content = content[:completion_tokens * 4]
+            finish_reason = "length"
+
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return {
+            "id": f"chatcmpl-mock-{hashlib.sha256(payload).hexdigest()[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": finish_reason,
+                "message": {"role": "assistant", "content": content}
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    def store_file(self, content: bytes, filename: str, purpose: str) -> Dict[str, Any]:
+        """
+        Сохраняет загруженный файл (в памяти)
+
+        Returns:
+            Объект файла
+        """
+        file_id = f"file-mock-{uuid.uuid4().hex[:16]}"
+        file_object = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                       "filename": filename, "purpose": purpose, "status": "processed"}
+        with self._lock:
+            self.files[file_id] = {"object": file_object, "content": content}
+        return file_object
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str,
+                     metadata: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Создаёт пакет и запускает его выполнение в фоновом потоке
+
+        Returns:
+            Объект пакета или None, если входной файл не найден
+        """
+        with self._lock:
+            if input_file_id not in self.files:
+                return None
+            batch_id = f"batch_mock_{uuid.uuid4().hex[:16]}"
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": endpoint, "errors": None,
+                "input_file_id": input_file_id, "completion_window": completion_window,
+                "status": "validating", "output_file_id": None, "error_file_id": None,
+                "created_at": int(time.time()), "in_progress_at": None, "completed_at": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0}, "metadata": metadata or {}
+            }
+            self.stats["batches"] = self.stats.get("batches", 0) + 1
+        threading.Thread(target=self._run_batch, args=(batch_id,), name="mock-batch", daemon=True).start()
+        return self.batch_object(batch_id)
+
+    def batch_object(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает копию объекта пакета или None, если пакет не найден
+        """
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            return json.loads(json.dumps(batch)) if batch is not None else None
+
+    def _run_batch(self, batch_id: str) -> None:
+        """
+        Выполняет пакет: каждая строка входного файла обрабатывается как запрос chat
+        completions (без лимитов в минуту), ошибки имитируются с долей error_rate
+        """
+        time.sleep(self.batch_delay / 2)
+        with self._lock:
+            batch = self.batches[batch_id]
+            if batch["status"] == "cancelled":
+                return
+            batch["status"] = "in_progress"
+            batch["in_progress_at"] = int(time.time())
+            lines = self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+
+        outputs = []
+        errors = []
+        for line in filter(None, (line.strip() for line in lines)):
+            item = json.loads(line)
+            request_id = f"batch_req_{uuid.uuid4().hex[:16]}"
+            if self.should_fail():
+                errors.append({"id": request_id, "custom_id": item["custom_id"], "response": None,
+                               "error": {"code": "server_error", "message": "Server error (mock)"}})
+                continue
+            outputs.append({"id": request_id, "custom_id": item["custom_id"], "error": None,
+                            "response": {"status_code": 200, "request_id": request_id,
+                                         "body": self.chat_completion(item["body"])}})
+        time.sleep(self.batch_delay / 2)
+
+        def to_jsonl(records) -> bytes:
+            return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+
+        output_file = self.store_file(to_jsonl(outputs), f"{batch_id}_output.jsonl", "batch_output") if outputs else None
+        error_file = self.store_file(to_jsonl(errors), f"{batch_id}_errors.jsonl", "batch_output") if errors else None
+        with self._lock:
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+            batch["output_file_id"] = output_file["id"] if output_file else None
+            batch["error_file_id"] = error_file["id"] if error_file else None
+            batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs),
+                                       "failed": len(errors)}
+            self.stats["batch_requests"] = self.stats.get("batch_requests", 0) + len(outputs) + len(errors)
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+    @property
+    def mock(self) -> MockOpenAIServer:
+        return self.server.mock
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status: int, message: str, error_type: str,
+                    headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": None}}, headers)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("content-length", 0)))
+
+    def _parse_multipart(self, body: bytes) -> Dict[str, Tuple[bytes, Optional[str]]]:
+        """
+        Разбирает multipart/form-data стандартным парсером писем
+
+        Returns:
+            Словарь {имя поля: (содержимое, имя файла)}
+        """
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"content-type: {self.headers.get('content-type')}\r\n\r\n".encode("utf-8") + body)
+        fields = {}
+        for part in message.iter_parts():
+            fields[part.get_param("name", header="content-disposition")] = (
+                part.get_payload(decode=True), part.get_filename())
+        return fields
+
+    def do_GET(self) -> None:
+        path = self.path.split("?")[0]
+        if path == "/mock/stats":
+            with self.mock._lock:
+                self._send_json(200, dict(self.mock.stats))
+            return
+        file_match = _FILE_PATH.search(path)
+        batch_match = _BATCH_PATH.search(path)
+        if file_match:
+            with self.mock._lock:
+                stored = self.mock.files.get(file_match.group("file_id"))
+            if stored is None:
+                self._send_error(404, "Файл не найден", "invalid_request_error")
+            elif file_match.group("content"):
+                self.send_response(200)
+                self.send_header("content-type", "application/octet-stream")
+                self.send_header("content-length", str(len(stored["content"])))
+                self.end_headers()
+                self.wfile.write(stored["content"])
+            else:
+                self._send_json(200, stored["object"])
+        elif batch_match and not batch_match.group("cancel"):
+            batch = self.mock.batch_object(batch_match.group("batch_id"))
+            if batch is None:
+                self._send_error(404, "Пакет не найден", "invalid_request_error")
+            else:
+                self._send_json(200, batch)
+        else:
+            self._send_error(404, f"Неизвестный путь: {self.path}", "invalid_request_error")
+
+    def do_POST(self) -> None:
+        body = self._read_body()
+        self.mock._count("requests")
+        path = self.path.split("?")[0]
+        batch_match = _BATCH_PATH.search(path)
+        if path.endswith("/audio/transcriptions"):
+            self._handle_transcription(body)
+        elif path.endswith("/chat/completions"):
+            self._handle_chat(body)
+        elif path.endswith("/files"):
+            fields = self._parse_multipart(body)
+            content, filename = fields.get("file", (b"", None))
+            purpose = (fields.get("purpose", (b"batch", None))[0] or b"batch").decode("utf-8")
+            self._send_json(200, self.mock.store_file(content or b"", filename or "upload.jsonl", purpose))
+        elif path.endswith("/batches"):
+            request = json.loads(body or b"{}")
+            batch = self.mock.create_batch(request.get("input_file_id", ""), request.get("endpoint", ""),
+                                           request.get("completion_window", "24h"), request.get("metadata"))
+            if batch is None:
+                self._send_error(404, "Входной файл не найден", "invalid_request_error")
+            else:
+                self._send_json(200, batch)
+        elif batch_match and batch_match.group("cancel"):
+            with self.mock._lock:
+                batch = self.mock.batches.get(batch_match.group("batch_id"))
+                if batch is not None and batch["status"] in ("validating", "in_progress"):
+                    batch["status"] = "cancelled"
+            batch = self.mock.batch_object(batch_match.group("batch_id"))
+            if batch is None:
+                self._send_error(404, "Пакет не найден", "invalid_request_error")
+            else:
+                self._send_json(200, batch)
+        else:
+            self._send_error(404, f"Неизвестный путь: {self.path}", "invalid_request_error")
+
+    def _precheck(self, tokens: float) -> Optional[Dict[str, str]]:
+        """
+        Общие проверки запроса: лимиты и имитация ошибок.
+        Возвращает заголовки x-ratelimit-* или None, если ответ уже отправлен.
+        """
+        admitted, wait, headers = self.mock.admit(tokens)
+        if not admitted:
+            self.mock._count("rate_limited")
+            headers["retry-after-ms"] = str(int(wait * 1000))
+            self._send_error(429, "Rate limit reached (mock)", "rate_limit_exceeded", headers)
+            return None
+        if self.mock.should_fail():
+            self.mock._count("errors")
+            time.sleep(self.mock.delay())
+            self._send_error(self.mock.random.choice([500, 503]), "Server error (mock)", "server_error")
+            return None
+        return headers
+
+    def _handle_transcription(self, body: bytes) -> None:
+        fields = self._parse_multipart(body)
+        audio_bytes = fields.get("file", (b"", None))[0] or b""
+        response_format = (fields.get("response_format", (b"json", None))[0] or b"json").decode("utf-8")
+
+        headers = self._precheck(0)
+        if headers is None:
+            return
+        time.sleep(self.mock.delay(self.mock.audio_seconds(audio_bytes)))
+        self._send_json(200, self.mock.transcription(audio_bytes, response_format), headers)
+
+    def _handle_chat(self, body: bytes) -> None:
+        request = json.loads(body or b"{}")
+        response = self.mock.chat_completion(request)
+        headers = self._precheck(response["usage"]["total_tokens"])
+        if headers is None:
+            return
+        time.sleep(self.mock.delay())
+        if request.get("stream"):
+            choice = response["choices"][0]
+            self._send_stream(response["id"], response["model"], choice["message"]["content"],
+                              choice["finish_reason"], headers)
+            return
+        self._send_json(200, response, headers)
+
+    def _send_stream(self, completion_id: str, model: str, content: str, finish_reason: str,
+                     headers: Dict[str, str]) -> None:
+        """
+        Отправляет ответ событиями server-sent events (chat.completion.chunk) по одному
+        слову, последнее событие содержит finish_reason, поток завершается [DONE].
+        """
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        def send_event(data: str) -> None:
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta: Dict[str, str], reason: Optional[str] = None) -> str:
+            return json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": reason}]
+            }, ensure_ascii=False)
+
+        send_event(chunk({"role": "assistant", "content": ""}))
+        for word in re.findall(r"\s*\S+\s*", content):
+            time.sleep(self.mock.token_delay)
+            send_event(chunk({"content": word}))
+        send_event(chunk({}, finish_reason))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка OpenAI API (audio, chat и batch) для нагрузочных тестов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Базовая задержка ответа (с)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Случайная добавка к задержке (с)")
+    parser.add_argument("--audio-speed", type=float, default=0.0,
+                        help="Скорость транскрибации, секунд звука за секунду (0 - без учёта длительности)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500/503")
+    parser.add_argument("--rpm", type=int, default=None, help="Лимит запросов в минуту")
+    parser.add_argument("--tpm", type=int, default=None, help="Лимит токенов в минуту")
+    parser.add_argument("--language", default="russian", help="Язык в ответах verbose_json")
+    parser.add_argument("--max-output-tokens", type=int, default=None,
+                        help="Лимит вывода chat completions (ответы длиннее обрезаются с finish_reason length)")
+    parser.add_argument("--token-delay", type=float, default=0.0,
+                        help="Пауза между фрагментами потокового ответа (с)")
+    parser.add_argument("--batch-delay", type=float, default=1.0, help="Время выполнения пакета Batch API (с)")
+    parser.add_argument("--seed", type=int, default=None, help="Зерно генератора ошибок и задержек")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = MockOpenAIServer(args.host, args.port, args.latency, args.jitter, args.audio_speed,
+                              args.error_rate, args.rpm, args.tpm, language=args.language,
+                              max_output_tokens=args.max_output_tokens, token_delay=args.token_delay,
+                              batch_delay=args.batch_delay, seed=args.seed)
+    server.start()
+    print(f"Заглушка запущена. Для приложения: OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=mock")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+import time
+import queue
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+
+import httpx
+import openai
+
+from rate_limiter import get_scheduler
+
+logger = logging.getLogger('openai_client')
+
+# Повторы выполняет call_with_retry, поэтому встроенные повторы клиента отключаются,
+# иначе они умножались бы на наши и не попадали в статистику
+openai.max_retries = 0
+
+# Количество попыток одного запроса (включая первую)
+DEFAULT_MAX_ATTEMPTS = 6
+# Базовая и максимальная задержка экспоненциальной паузы между попытками (в секундах)
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# Тайм-ауты одного запроса (в секундах)
+CHAT_TIMEOUT = 300.0
+TRANSCRIPTION_TIMEOUT = 600.0
+
+# Размер общего пула соединений асинхронного клиента
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 50
+
+# Коды HTTP, при которых запрос имеет смысл повторить
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Счётчики вызовов по местам вызова: {call_site: {"calls", "retries", "failures"}}
+_retry_stats: Dict[str, Dict[str, int]] = {}
+_retry_stats_lock = threading.Lock()
+
+def _count(call_site: str, counter: str) -> None:
+    with _retry_stats_lock:
+        stats = _retry_stats.setdefault(call_site, {"calls": 0, "retries": 0, "failures": 0})
+        stats[counter] += 1
+
+def get_retry_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Возвращает копию счётчиков вызовов, повторов и отказов по местам вызова
+
+    Returns:
+        Словарь {место вызова: {"calls", "retries", "failures"}}
+    """
+    with _retry_stats_lock:
+        return {call_site: dict(stats) for call_site, stats in _retry_stats.items()}
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Определяет, является ли ошибка временной (лимиты, 5xx, тайм-ауты, обрывы соединения)
+
+    Args:
+        error: Исключение, полученное от клиента OpenAI
+
+    Returns:
+        True, если запрос стоит повторить
+    """
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Извлекает рекомендованную паузу из заголовков Retry-After / retry-after-ms
+
+    Args:
+        error: Исключение с HTTP-ответом
+
+    Returns:
+        Пауза в секундах или None, если сервер её не указал
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    # Retry-After может быть указан как дата HTTP
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(attempt: int, error: Exception) -> float:
+    """
+    Вычисляет паузу перед следующей попыткой: экспоненциальная пауза со случайным
+    разбросом (full jitter), но не меньше значения Retry-After от сервера
+
+    Args:
+        attempt: Номер неудавшейся попытки (с 1)
+        error: Исключение, полученное при попытке
+
+    Returns:
+        Пауза в секундах
+    """
+    backoff = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+    retry_after = _retry_after_seconds(error)
+    if retry_after is not None:
+        return min(RETRY_MAX_DELAY, max(backoff, retry_after))
+    return backoff
+
+def call_with_retry(func: Callable[..., Any], *args,
+                    call_site: str,
+                    timeout: float = CHAT_TIMEOUT,
+                    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                    **kwargs) -> Any:
+    """
+    Выполняет запрос к OpenAI с повторами при временных ошибках.
+    Тайм-аут передаётся в func именованным аргументом timeout.
+
+    Args:
+        func: Функция запроса (например, openai.chat.completions.create)
+        *args: Позиционные аргументы func
+        call_site: Имя места вызова для статистики повторов
+        timeout: Тайм-аут одного запроса (в секундах)
+        max_attempts: Максимальное количество попыток
+        **kwargs: Именованные аргументы func
+
+    Returns:
+        Результат func
+    """
+    for attempt in range(1, max_attempts + 1):
+        _count(call_site, "calls")
+        try:
+            return func(*args, timeout=timeout, **kwargs)
+        except openai.OpenAIError as e:
+            if not is_retryable_error(e) or attempt == max_attempts:
+                _count(call_site, "failures")
+                raise
+            delay = retry_delay(attempt, e)
+            _count(call_site, "retries")
+            logger.warning(f"{call_site}: попытка {attempt} не удалась ({type(e).__name__}), "
+                           f"повтор через {delay:.1f} с")
+            time.sleep(delay)
+
+async def acall_with_retry(func: Callable[..., Awaitable[Any]], *args,
+                           call_site: str,
+                           timeout: float = CHAT_TIMEOUT,
+                           max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                           cost: Optional[Dict[str, float]] = None,
+                           **kwargs) -> Any:
+    """
+    Асинхронный вариант call_with_retry: пауза между попытками не занимает поток.
+    Каждая попытка проходит через общий планировщик лимитов модели (kwargs["model"]).
+    Если func - метод with_raw_response, лимиты уточняются по заголовкам x-ratelimit-*,
+    а возвращается уже разобранный ответ.
+
+    Args:
+        func: Асинхронная функция запроса (например, client.chat.completions.with_raw_response.create)
+        *args: Позиционные аргументы func
+        call_site: Имя места вызова для статистики повторов
+        timeout: Тайм-аут одного запроса (в секундах)
+        max_attempts: Максимальное количество попыток
+        cost: Оценка стоимости запроса для планировщика ({"tokens": ..., "audio_seconds": ...})
+        **kwargs: Именованные аргументы func
+
+    Returns:
+        Результат func
+    """
+    scheduler = get_scheduler(kwargs["model"]) if "model" in kwargs else None
+    for attempt in range(1, max_attempts + 1):
+        if scheduler:
+            await scheduler.acquire(cost or {})
+        _count(call_site, "calls")
+        try:
+            response = await func(*args, timeout=timeout, **kwargs)
+        except openai.OpenAIError as e:
+            error_response = getattr(e, "response", None)
+            if scheduler and error_response is not None:
+                scheduler.update_from_headers(error_response.headers)
+            if not is_retryable_error(e) or attempt == max_attempts:
+                _count(call_site, "failures")
+                raise
+            delay = retry_delay(attempt, e)
+            _count(call_site, "retries")
+            logger.warning(f"{call_site}: попытка {attempt} не удалась ({type(e).__name__}), "
+                           f"повтор через {delay:.1f} с")
+            await asyncio.sleep(delay)
+            continue
+
+        # Сырой ответ: уточняем лимиты по заголовкам и разбираем тело
+        if hasattr(response, "headers") and hasattr(response, "parse"):
+            if scheduler:
+                scheduler.update_from_headers(response.headers)
+            return response.parse()
+        return response
+
+# Общий для процесса цикл событий в фоновом потоке и асинхронный клиент.
+# Все сессии Streamlit отправляют запросы через один цикл и один пул соединений,
+# поэтому сотни одновременных запросов не требуют сотен потоков.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_async_client: Optional[openai.AsyncOpenAI] = None
+_init_lock = threading.Lock()
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Возвращает общий цикл событий, при первом вызове запуская его в фоновом потоке
+
+    Returns:
+        Цикл событий asyncio
+    """
+    global _loop, _loop_thread
+    with _init_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="openai-event-loop", daemon=True)
+            _loop_thread.start()
+    return _loop
+
+def get_async_client() -> openai.AsyncOpenAI:
+    """
+    Возвращает общий клиент AsyncOpenAI. Ключ и адрес API берутся из настроек
+    модуля openai (их задаёт приложение) или из переменных окружения.
+
+    Returns:
+        Клиент AsyncOpenAI с общим пулом соединений
+    """
+    global _async_client
+    with _init_lock:
+        if _async_client is None:
+            _async_client = openai.AsyncOpenAI(
+                api_key=openai.api_key,
+                base_url=openai.base_url,
+                max_retries=0,
+                http_client=openai.DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+                    )
+                )
+            )
+    return _async_client
+
+def run_sync(coro: Awaitable[Any]) -> Any:
+    """
+    Выполняет корутину в общем цикле событий и блокирует вызывающий поток до результата
+
+    Args:
+        coro: Корутина
+
+    Returns:
+        Результат корутины
+    """
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("run_sync нельзя вызывать из общего цикла событий - используйте await")
+
+    # Переносим контекстные переменные вызывающего потока (например, сессию) в задачу цикла
+    caller_context = contextvars.copy_context()
+
+    async def with_caller_context():
+        for variable, value in caller_context.items():
+            variable.set(value)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(with_caller_context(), loop).result()
+
+def iterate_sync(async_iterator: AsyncIterator[Any]) -> Iterator[Any]:
+    """
+    Итерирует асинхронный генератор в общем цикле событий из синхронного кода:
+    элементы передаются в вызывающий поток по мере появления. Если потребитель
+    прекращает итерацию досрочно, генератор в цикле событий отменяется.
+
+    Args:
+        async_iterator: Асинхронный генератор
+
+    Yields:
+        Элементы генератора
+    """
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("iterate_sync нельзя вызывать из общего цикла событий - используйте async for")
+
+    items: "queue.Queue" = queue.Queue()
+    finished = object()
+    caller_context = contextvars.copy_context()
+
+    async def pump():
+        for variable, value in caller_context.items():
+            variable.set(value)
+        try:
+            async for item in async_iterator:
+                items.put((item, None))
+        except BaseException as e:
+            items.put((finished, e))
+            raise
+        items.put((finished, None))
+
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        while True:
+            item, error = items.get()
+            if item is finished:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        future.cancel()
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+from openai_client import run_sync
+from utils import (
+    CHAT_MAX_CONCURRENCY, detect_language, transcribe_audio_whisper_async,
+    format_transcription_paragraphs_async, translate_text_gpt_async
+)
+
+logger = logging.getLogger('pipeline')
+
+# Коды целевых языков перевода
+TARGET_LANGUAGE_CODES = {"русский": "ru", "казахский": "kk", "английский": "en"}
+# Языки, которые Whisper определяет достаточно надёжно; для остальных язык уточняется по тексту
+RELIABLE_LANGUAGE_CODES = ("ru", "kk", "en", "ko", "ja", "zh")
+
+# Определение языка оригинала по ответу Whisper и тексту
+def source_language_code(language: Optional[str], text: str) -> str:
+    """
+    Возвращает код языка оригинала: язык транскрибации, если он надёжно определён,
+    иначе язык, определённый по тексту (та же логика, что и в обработчиках приложения).
+
+    Args:
+        language: Язык, который вернула транскрибация
+        text: Текст транскрипции
+
+    Returns:
+        Код языка (ISO 639-1) или "unknown"
+    """
+    code = language.lower() if language else "unknown"
+    if code == "unknown" or code not in RELIABLE_LANGUAGE_CODES:
+        code = detect_language(text)
+    return code
+
+class PipelineResult:
+    """
+    Результат конвейерной обработки: выходы стадий, собранные в порядке фрагментов
+    """
+
+    def __init__(self, transcription: str, paragraphs: str, translation: Optional[str], language: str):
+        """
+        Args:
+            transcription: Транскрипция (как её вернула transcribe_audio_whisper)
+            paragraphs: Транскрипция, разбитая на абзацы (или транскрипция, если стадия отключена)
+            translation: Перевод или None, если перевод не требовался
+            language: Код языка оригинала
+        """
+        self.transcription = transcription
+        self.paragraphs = paragraphs
+        self.translation = translation
+        self.language = language
+
+# Конвейерная обработка: абзацы и перевод готовых фрагментов во время транскрибации следующих
+async def run_pipeline_async(audio_path: str,
+                             file_title: str,
+                             save_folder_path: str,
+                             target_language: Optional[str],
+                             format_paragraphs: bool = True,
+                             translator: Optional[Callable[[str], Awaitable[str]]] = None,
+                             force_translation: bool = False,
+                             max_concurrency: int = CHAT_MAX_CONCURRENCY,
+                             **transcribe_options: Any) -> PipelineResult:
+    """
+    Транскрибирует файл и обрабатывает его по фрагментам: каждый готовый фрагмент
+    транскрипции сразу отправляется на разбивку на абзацы и перевод, пока следующие
+    фрагменты ещё транскрибируются. Выходы стадий собираются в порядке фрагментов
+    после завершения всех задач. На длинных записях общее время приближается
+    к времени самой долгой стадии, а не к сумме стадий.
+
+    Нужен ли перевод, решается по первому фрагменту с текстом (source_language_code).
+
+    Args:
+        audio_path: Путь к аудио файлу
+        file_title: Название файла для сохранения транскрипции
+        save_folder_path: Папка для сохранения транскрипции
+        target_language: Язык перевода ("русский", "казахский", "английский"); None - без перевода
+        format_paragraphs: Разбивать фрагменты на абзацы (format_transcription_paragraphs)
+        translator: Асинхронная функция перевода фрагмента (по умолчанию translate_text_gpt_async)
+        force_translation: Переводить независимо от языка оригинала
+        max_concurrency: Количество одновременно обрабатываемых фрагментов на каждой стадии
+        **transcribe_options: Дополнительные аргументы transcribe_audio_whisper_async
+
+    Returns:
+        Результат обработки (PipelineResult)
+    """
+    if translator is None:
+        translator = lambda text: translate_text_gpt_async(text, target_language)
+    paragraph_slots = asyncio.Semaphore(max(1, max_concurrency))
+    translation_slots = asyncio.Semaphore(max(1, max_concurrency))
+
+    tasks: List[asyncio.Task] = []
+    # Язык оригинала и необходимость перевода (решается по первому фрагменту с текстом)
+    decision = {}
+
+    # Обработка одного фрагмента всеми стадиями
+    async def process_chunk(text: str, translate: bool):
+        paragraphs = text
+        if format_paragraphs:
+            async with paragraph_slots:
+                paragraphs = await format_transcription_paragraphs_async(text)
+        translation = None
+        if translate:
+            async with translation_slots:
+                translation = await translator(paragraphs)
+        return paragraphs, translation
+
+    # Получение готового фрагмента транскрипции (вызывается в порядке фрагментов)
+    def on_chunk(text: str, language: Optional[str]):
+        if not text.strip():
+            return
+        if "translate" not in decision:
+            decision["language"] = source_language_code(language, text)
+            decision["translate"] = bool(target_language) and (
+                force_translation or decision["language"] != TARGET_LANGUAGE_CODES.get(target_language.lower(), "ru"))
+            logger.info(f"Язык оригинала: {decision['language']}, перевод: {decision['translate']}")
+        tasks.append(asyncio.create_task(process_chunk(text, decision["translate"])))
+
+    try:
+        transcription, language = await transcribe_audio_whisper_async(
+            audio_path, file_title, save_folder_path, on_chunk=on_chunk, **transcribe_options)
+        print(f"Транскрибация завершена, ожидаем обработку фрагментов: {sum(not task.done() for task in tasks)} "
+              f"из {len(tasks)}")
+        results = await asyncio.gather(*tasks)
+    finally:
+        # При ошибке отменяем обработку оставшихся фрагментов
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    translation = None
+    if decision.get("translate"):
+        translation = "\n\n".join(chunk_translation for _, chunk_translation in results)
+    return PipelineResult(
+        transcription,
+        "\n\n".join(paragraphs for paragraphs, _ in results),
+        translation,
+        decision.get("language") or source_language_code(language, transcription)
+    )
+
+# Конвейерная обработка
+def run_pipeline(audio_path: str,
+                 file_title: str,
+                 save_folder_path: str,
+                 target_language: Optional[str],
+                 format_paragraphs: bool = True,
+                 translator: Optional[Callable[[str], Awaitable[str]]] = None,
+                 force_translation: bool = False,
+                 max_concurrency: int = CHAT_MAX_CONCURRENCY,
+                 **transcribe_options: Any) -> PipelineResult:
+    """
+    Синхронная обёртка над run_pipeline_async (аргументы и результат те же).
+    """
+    return run_sync(run_pipeline_async(
+        audio_path, file_title, save_folder_path, target_language, format_paragraphs,
+        translator, force_translation, max_concurrency, **transcribe_options))
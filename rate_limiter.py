@@ -0,0 +1,229 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import contextvars
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Dict, List, Optional, Any
+
+import tiktoken
+
+logger = logging.getLogger('rate_limiter')
+
+# Идентификатор сессии, от имени которой отправляются запросы.
+# Приложение задаёт его в начале каждого запуска скрипта Streamlit.
+current_session_id: contextvars.ContextVar[str] = contextvars.ContextVar("current_session_id", default="default")
+
+# Лимиты по умолчанию для групп моделей (в минуту); уточняются по заголовкам x-ratelimit-*.
+# None - измерение не ограничивается.
+DEFAULT_RATE_LIMITS = {
+    "whisper-1": {
+        "requests": int(os.environ.get("OPENAI_WHISPER_RPM", 50)),
+        "tokens": None,
+        "audio_seconds": None
+    },
+    "default": {
+        "requests": int(os.environ.get("OPENAI_RPM", 500)),
+        "tokens": int(os.environ.get("OPENAI_TPM", 200000)),
+        "audio_seconds": None
+    }
+}
+
+class TokenBucket:
+    """
+    Корзина токенов: ёмкость capacity, равномерное пополнение до capacity за минуту.
+    """
+
+    def __init__(self, capacity: float):
+        """
+        Args:
+            capacity: Лимит в минуту
+        """
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.capacity / 60)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Сколько секунд ждать, пока в корзине наберётся amount
+
+        Args:
+            amount: Стоимость запроса (не больше ёмкости)
+
+        Returns:
+            Время ожидания в секундах (0 - можно отправлять сразу)
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.capacity
+
+    def consume(self, amount: float) -> None:
+        """
+        Списывает стоимость запроса
+
+        Args:
+            amount: Стоимость запроса
+        """
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def update(self, limit: Optional[float], remaining: Optional[float]) -> None:
+        """
+        Подстраивает корзину под фактические лимиты из ответа сервера
+
+        Args:
+            limit: Лимит в минуту (x-ratelimit-limit-*)
+            remaining: Остаток (x-ratelimit-remaining-*)
+        """
+        self._refill()
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+class RateLimitScheduler:
+    """
+    Общий для процесса планировщик запросов к одной группе моделей.
+    Перед отправкой каждый запрос ждёт, пока во всех корзинах (запросы, токены,
+    секунды аудио) наберётся его стоимость. Очереди ведутся по сессиям и
+    обслуживаются по кругу, поэтому большая задача одной сессии не блокирует остальные.
+    Работает в общем цикле событий (см. openai_client.get_event_loop).
+    """
+
+    def __init__(self, limits: Dict[str, Optional[float]]):
+        """
+        Args:
+            limits: Лимиты в минуту по измерениям {"requests", "tokens", "audio_seconds"}
+        """
+        self.buckets = {name: TokenBucket(limit) for name, limit in limits.items() if limit}
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def acquire(self, cost: Dict[str, float], session_id: Optional[str] = None) -> None:
+        """
+        Ожидает очереди на отправку запроса
+
+        Args:
+            cost: Оценка стоимости запроса по измерениям (запрос всегда стоит 1 в "requests")
+            session_id: Сессия-владелец запроса (по умолчанию current_session_id)
+        """
+        session_id = session_id or current_session_id.get()
+        cost = dict(cost, requests=1)
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session_id, deque()).append((cost, future))
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        """
+        Выдаёт разрешения на отправку: по одному запросу от каждой сессии по кругу.
+        Завершается, когда очереди пусты; acquire запускает его снова.
+        """
+        while self._queues:
+            session_id, queue = next(iter(self._queues.items()))
+            cost, future = queue[0]
+            if future.cancelled():
+                queue.popleft()
+            else:
+                wait = max(bucket.wait_time(cost.get(name, 0)) for name, bucket in self.buckets.items()) \
+                    if self.buckets else 0.0
+                if wait > 0:
+                    logger.debug(f"Ожидание лимита {wait:.2f} с (сессия {session_id})")
+                    await asyncio.sleep(wait)
+                    continue
+                for name, bucket in self.buckets.items():
+                    bucket.consume(cost.get(name, 0))
+                queue.popleft()
+                future.set_result(None)
+
+            # Следующей обслуживается другая сессия
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+        self._dispatcher = None
+
+    def update_from_headers(self, headers: Any) -> None:
+        """
+        Уточняет лимиты по заголовкам x-ratelimit-* ответа OpenAI
+
+        Args:
+            headers: Заголовки HTTP-ответа
+        """
+        for name in ("requests", "tokens"):
+            bucket = self.buckets.get(name)
+            if bucket is None:
+                continue
+            limit = _header_number(headers, f"x-ratelimit-limit-{name}")
+            remaining = _header_number(headers, f"x-ratelimit-remaining-{name}")
+            if limit or remaining is not None:
+                bucket.update(limit, remaining)
+
+def _header_number(headers: Any, name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    match = re.match(r"\s*(\d+(?:\.\d+)?)", str(value))
+    return float(match.group(1)) if match else None
+
+# Планировщики по группам моделей
+_schedulers: Dict[str, RateLimitScheduler] = {}
+
+def get_scheduler(model: str) -> RateLimitScheduler:
+    """
+    Возвращает общий планировщик для модели (для неизвестных моделей - группа "default")
+
+    Args:
+        model: Название модели
+
+    Returns:
+        RateLimitScheduler
+    """
+    group = model if model in DEFAULT_RATE_LIMITS else "default"
+    if group not in _schedulers:
+        _schedulers[group] = RateLimitScheduler(DEFAULT_RATE_LIMITS[group])
+    return _schedulers[group]
+
+# Кодировка tiktoken для модели (создаётся один раз на процесс)
+@lru_cache(maxsize=8)
+def get_encoding(model: str):
+    """
+    Возвращает кэшированную кодировку tiktoken для модели
+    (для неизвестных моделей - cl100k_base)
+
+    Args:
+        model: Название модели
+
+    Returns:
+        Объект кодировки tiktoken
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def estimate_chat_cost(messages: List[Dict[str, str]], model: str) -> Dict[str, float]:
+    """
+    Оценивает стоимость запроса к chat completions в токенах: входные токены
+    плюс ответ такого же объёма (перевод, форматирование, разбивка на разделы)
+
+    Args:
+        messages: Сообщения запроса
+        model: Модель
+
+    Returns:
+        Стоимость по измерениям {"tokens": ...}
+    """
+    encoding = get_encoding(model)
+    prompt_tokens = sum(len(encoding.encode_ordinary(message["content"])) + 4 for message in messages)
+    return {"tokens": prompt_tokens * 2}
@@ -0,0 +1,113 @@
+import re
+from typing import List, Tuple
+
+# Слово: непрерывная последовательность непробельных символов
+_TOKEN_PATTERN = re.compile(r"\S+")
+# Всё, кроме букв и цифр, при сравнении слов не учитывается
+_NON_WORD_PATTERN = re.compile(r"[\W_]+", re.UNICODE)
+
+# Минимальное количество совпавших слов, при котором совпадение считается перекрытием
+MIN_OVERLAP_TOKENS = 2
+# Сколько первых слов следующего фрагмента может быть искажено обрезкой звука
+MAX_SKIPPED_TOKENS = 3
+# Оценка сверху длины слова с пробелом (в символах) для выделения окна сравнения
+MAX_TOKEN_CHARS = 32
+
+# Разбиение текста на нормализованные слова
+def tokenize(text: str) -> Tuple[List[str], List[int]]:
+    """
+    Разбивает текст на слова, нормализованные для сравнения (нижний регистр,
+    без знаков препинания), и запоминает позиции слов в исходном тексте.
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        Кортеж из списка нормализованных слов и списка их начальных позиций в тексте
+    """
+    tokens = []
+    offsets = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        token = _NON_WORD_PATTERN.sub("", match.group().lower())
+        if token:
+            tokens.append(token)
+            offsets.append(match.start())
+    return tokens, offsets
+
+# Длина наибольшего префикса одной последовательности, совпадающего с суффиксом другой
+def longest_suffix_prefix(previous: List[str], following: List[str]) -> int:
+    """
+    Находит наибольшее k, при котором последние k слов previous совпадают с первыми
+    k словами following. Используется префикс-функция (Кнут - Моррис - Пратт)
+    для following, затем previous прогоняется через автомат: время O(len(previous) + len(following)).
+
+    Args:
+        previous: Слова конца предыдущего фрагмента
+        following: Слова начала следующего фрагмента
+
+    Returns:
+        Длина совпадения в словах
+    """
+    if not previous or not following:
+        return 0
+
+    # Префикс-функция: prefix[i] - длина наибольшего собственного префикса following[:i + 1],
+    # который одновременно является его суффиксом
+    prefix = [0] * len(following)
+    matched = 0
+    for i in range(1, len(following)):
+        while matched and following[i] != following[matched]:
+            matched = prefix[matched - 1]
+        if following[i] == following[matched]:
+            matched += 1
+        prefix[i] = matched
+
+    # Проход по previous: matched - длина совпадения префикса following с концом просмотренной части
+    matched = 0
+    for token in previous:
+        while matched and (matched == len(following) or token != following[matched]):
+            matched = prefix[matched - 1]
+        if token == following[matched]:
+            matched += 1
+    return matched
+
+# Удаление из следующего фрагмента текста, повторяющего конец предыдущего
+def trim_overlap(previous_text: str, following_text: str, overlap_tokens: int) -> str:
+    """
+    Убирает из начала following_text слова, которые уже есть в конце previous_text
+    (фрагменты транскрибировались с перекрытием звука). Первые слова следующего
+    фрагмента могут быть искажены обрезкой звука, поэтому до MAX_SKIPPED_TOKENS
+    из них разрешено пропустить (каждое пропущенное слово удлиняет требуемое
+    совпадение на одно слово). Сравнение ограничено окном в overlap_tokens слов,
+    поэтому время работы линейно по размеру перекрытия.
+
+    Args:
+        previous_text: Текст предыдущего фрагмента
+        following_text: Текст следующего фрагмента
+        overlap_tokens: Оценка сверху количества слов в перекрытии
+
+    Returns:
+        Текст следующего фрагмента без повтора (без изменений, если перекрытие не найдено)
+    """
+    window = max(overlap_tokens, MIN_OVERLAP_TOKENS)
+    # Разбираются только конец предыдущего и начало следующего текста
+    span_chars = (window + MAX_SKIPPED_TOKENS) * MAX_TOKEN_CHARS
+    previous_tail = tokenize(previous_text[-span_chars:])[0][-window:]
+    following_head = following_text[:span_chars]
+    following_tokens, following_offsets = tokenize(following_head)
+
+    best_end = 0
+    best_length = 0
+    for skipped in range(min(MAX_SKIPPED_TOKENS, len(following_tokens)) + 1):
+        length = longest_suffix_prefix(previous_tail, following_tokens[skipped:skipped + window])
+        # Каждое пропущенное слово повышает требование к длине совпадения,
+        # чтобы короткие общие фразы не принимались за перекрытие
+        if length >= MIN_OVERLAP_TOKENS + skipped and length > best_length:
+            best_length = length
+            best_end = skipped + length
+
+    if not best_length:
+        return following_text
+    if best_end < len(following_tokens):
+        return following_text[following_offsets[best_end]:]
+    return following_text[len(following_head):].lstrip()
@@ -0,0 +1,173 @@
+import os
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from openai_client import acall_with_retry, get_async_client, TRANSCRIPTION_TIMEOUT
+
+logger = logging.getLogger('transcription_backends')
+
+# Названия языков, которые Whisper возвращает в verbose_json, и их коды
+# (полный список языков Whisper; ISO 639-1, где он есть)
+WHISPER_LANGUAGE_CODES = {
+    "english": "en", "chinese": "zh", "german": "de", "spanish": "es", "russian": "ru", "korean": "ko",
+    "french": "fr", "japanese": "ja", "portuguese": "pt", "turkish": "tr", "polish": "pl", "catalan": "ca",
+    "dutch": "nl", "arabic": "ar", "swedish": "sv", "italian": "it", "indonesian": "id", "hindi": "hi",
+    "finnish": "fi", "vietnamese": "vi", "hebrew": "he", "ukrainian": "uk", "greek": "el", "malay": "ms",
+    "czech": "cs", "romanian": "ro", "danish": "da", "hungarian": "hu", "tamil": "ta", "norwegian": "no",
+    "thai": "th", "urdu": "ur", "croatian": "hr", "bulgarian": "bg", "lithuanian": "lt", "latin": "la",
+    "maori": "mi", "malayalam": "ml", "welsh": "cy", "slovak": "sk", "telugu": "te", "persian": "fa",
+    "latvian": "lv", "bengali": "bn", "serbian": "sr", "azerbaijani": "az", "slovenian": "sl",
+    "kannada": "kn", "estonian": "et", "macedonian": "mk", "breton": "br", "basque": "eu",
+    "icelandic": "is", "armenian": "hy", "nepali": "ne", "mongolian": "mn", "bosnian": "bs",
+    "kazakh": "kk", "albanian": "sq", "swahili": "sw", "galician": "gl", "marathi": "mr",
+    "punjabi": "pa", "sinhala": "si", "khmer": "km", "shona": "sn", "yoruba": "yo", "somali": "so",
+    "afrikaans": "af", "occitan": "oc", "georgian": "ka", "belarusian": "be", "tajik": "tg",
+    "sindhi": "sd", "gujarati": "gu", "amharic": "am", "yiddish": "yi", "lao": "lo", "uzbek": "uz",
+    "faroese": "fo", "haitian creole": "ht", "pashto": "ps", "turkmen": "tk", "nynorsk": "nn",
+    "maltese": "mt", "sanskrit": "sa", "luxembourgish": "lb", "myanmar": "my", "tibetan": "bo",
+    "tagalog": "tl", "malagasy": "mg", "assamese": "as", "tatar": "tt", "hawaiian": "haw",
+    "lingala": "ln", "hausa": "ha", "bashkir": "ba", "javanese": "jv", "sundanese": "su",
+    "cantonese": "yue",
+    # Другие названия тех же языков в Whisper
+    "burmese": "my", "valencian": "ca", "flemish": "nl", "haitian": "ht", "letzeburgesch": "lb",
+    "pushto": "ps", "panjabi": "pa", "moldavian": "ro", "moldovan": "ro", "sinhalese": "si",
+    "castilian": "es", "mandarin": "zh"
+}
+
+class TranscriptionSegment:
+    """
+    Отрезок транскрипции с отметками времени внутри фрагмента
+    """
+
+    def __init__(self, start: float, end: float, text: str):
+        """
+        Args:
+            start: Начало отрезка (в секундах от начала фрагмента)
+            end: Конец отрезка (в секундах от начала фрагмента)
+            text: Текст отрезка
+        """
+        self.start = start
+        self.end = end
+        self.text = text
+
+class ChunkTranscription:
+    """
+    Результат транскрибации одного аудио фрагмента
+    """
+
+    def __init__(self, text: str, language: Optional[str] = None,
+                 segments: Optional[List[TranscriptionSegment]] = None):
+        """
+        Args:
+            text: Текст фрагмента
+            language: Код языка (ISO 639-1), если бэкенд его определил, иначе None
+            segments: Отрезки с отметками времени, если бэкенд их возвращает
+        """
+        self.text = text
+        self.language = language
+        self.segments = segments or []
+
+class TranscriptionBackend(ABC):
+    """
+    Базовый класс бэкенда транскрибации. Бэкенд отвечает только за один фрагмент:
+    нарезка, кэш, журнал и сборка результата остаются в transcribe_audio_whisper.
+    """
+
+    # Идентификатор модели; входит в ключ кэша транскрипций
+    model = ""
+
+    @abstractmethod
+    async def transcribe_chunk(self, chunk_path: str, duration_seconds: float) -> ChunkTranscription:
+        """
+        Транскрибирует один аудио фрагмент
+
+        Args:
+            chunk_path: Путь к файлу фрагмента
+            duration_seconds: Длительность фрагмента (оценка стоимости для планировщика лимитов)
+
+        Returns:
+            ChunkTranscription
+        """
+
+class OpenAITranscriptionBackend(TranscriptionBackend):
+    """
+    Транскрибация через OpenAI Audio API (по умолчанию whisper-1).
+    Адрес API берётся из настроек клиента, поэтому тот же бэкенд работает
+    и с локальной заглушкой mock_openai_server (OPENAI_BASE_URL).
+    """
+
+    def __init__(self, model: str = "whisper-1", response_format: str = "json"):
+        """
+        Args:
+            model: Модель транскрибации
+            response_format: "json" (только текст) или "verbose_json" (язык и отрезки)
+        """
+        self.model = model
+        self.response_format = response_format
+
+    async def transcribe_chunk(self, chunk_path: str, duration_seconds: float) -> ChunkTranscription:
+        # Чтение файла вне цикла событий; при повторах отправляются те же байты
+        with open(chunk_path, "rb") as src_file:
+            audio_bytes = await asyncio.to_thread(src_file.read)
+
+        response = await acall_with_retry(
+            get_async_client().audio.transcriptions.with_raw_response.create,
+            call_site="transcribe_chunk",
+            timeout=TRANSCRIPTION_TIMEOUT,
+            cost={"audio_seconds": duration_seconds},
+            model=self.model,
+            response_format=self.response_format,
+            file=(os.path.basename(chunk_path), audio_bytes)
+        )
+        return ChunkTranscription(
+            text=response.text,
+            language=_language_code(getattr(response, "language", None)),
+            segments=[_segment(segment) for segment in (getattr(response, "segments", None) or [])]
+        )
+
+def _language_code(language: Optional[str]) -> Optional[str]:
+    # Неизвестное название не передаётся дальше как код: язык определяется по тексту (detect_language)
+    if not language:
+        return None
+    language = language.lower()
+    if language in WHISPER_LANGUAGE_CODES.values():
+        return language
+    code = WHISPER_LANGUAGE_CODES.get(language)
+    if code is None:
+        logger.warning(f"Неизвестный язык Whisper: {language}, язык будет определён по тексту")
+    return code
+
+def _segment(segment: Any) -> TranscriptionSegment:
+    if isinstance(segment, dict):
+        return TranscriptionSegment(segment["start"], segment["end"], segment["text"])
+    return TranscriptionSegment(segment.start, segment.end, segment.text)
+
+# Доступные бэкенды транскрибации
+TRANSCRIPTION_BACKENDS = {
+    "openai": OpenAITranscriptionBackend
+}
+
+# Экземпляры бэкендов по имени
+_backends: Dict[str, TranscriptionBackend] = {}
+
+def get_transcription_backend(name: Optional[str] = None) -> TranscriptionBackend:
+    """
+    Возвращает бэкенд транскрибации по имени
+
+    Args:
+        name: Имя из TRANSCRIPTION_BACKENDS (по умолчанию переменная окружения
+            TRANSCRIPTION_BACKEND или "openai")
+
+    Returns:
+        TranscriptionBackend
+    """
+    name = name or os.environ.get("TRANSCRIPTION_BACKEND", "openai")
+    if name not in TRANSCRIPTION_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд транскрибации: {name}. "
+                         f"Доступные: {', '.join(TRANSCRIPTION_BACKENDS)}")
+    if name not in _backends:
+        _backends[name] = TRANSCRIPTION_BACKENDS[name]()
+        logger.info(f"Бэкенд транскрибации: {name}")
+    return _backends[name]
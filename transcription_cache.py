@@ -0,0 +1,249 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import time
+import tempfile
+import threading
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger('transcription_cache')
+
+# Каталог кэша по умолчанию (можно переопределить переменной окружения)
+DEFAULT_CACHE_DIR = os.environ.get(
+    "TRANSCRIPTION_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "transcriptor_cache", "transcriptions")
+)
+# Максимальный размер кэша по умолчанию (в байтах)
+DEFAULT_CACHE_MAX_BYTES = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+
+class TranscriptionCache:
+    """
+    Дисковый кэш транскрипций, адресуемый по содержимому аудио файла.
+    Ключ - хэш содержимого файла и параметров нарезки/модели, поэтому повторная
+    загрузка той же записи под другим именем или из другого источника попадает в кэш.
+    При превышении лимита размера удаляются давно не использованные записи (LRU).
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        """
+        Инициализирует кэш
+
+        Args:
+            cache_dir: Каталог для хранения записей кэша
+            max_bytes: Максимальный суммарный размер записей (в байтах)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def hash_file(file_path: str, block_size: int = 1024 * 1024) -> str:
+        """
+        Вычисляет SHA-256 содержимого файла, читая его блоками
+
+        Args:
+            file_path: Путь к файлу
+            block_size: Размер блока чтения (в байтах)
+
+        Returns:
+            Шестнадцатеричная строка хэша
+        """
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def make_key(self, audio_path: str, params: Dict[str, Any]) -> str:
+        """
+        Формирует ключ кэша из содержимого файла и параметров транскрибации
+
+        Args:
+            audio_path: Путь к аудио файлу
+            params: Параметры, влияющие на результат (модель, профиль, нарезка)
+
+        Returns:
+            Ключ записи кэша
+        """
+        payload = json.dumps({"audio": self.hash_file(audio_path), "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Tuple[str, str, Optional[Dict[str, Any]]]]:
+        """
+        Возвращает сохранённую транскрипцию и отмечает запись как недавно использованную
+
+        Args:
+            key: Ключ записи
+
+        Returns:
+            Кортеж (текст, язык, карта смещений или None) или None, если записи нет
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Время модификации служит отметкой последнего использования для LRU
+            os.utime(entry_path, None)
+        except (OSError, ValueError):
+            return None
+        return entry["text"], entry["language"], entry.get("offsets")
+
+    def put(self, key: str, text: str, language: str, offsets: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Сохраняет транскрипцию в кэш и при необходимости вытесняет старые записи
+
+        Args:
+            key: Ключ записи
+            text: Текст транскрипции
+            language: Язык транскрипции
+            offsets: Карта смещений сжатой записи (режим удаления пауз), сохраняется вместе с текстом
+        """
+        entry_path = self._entry_path(key)
+        temp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"text": text, "language": language, "offsets": offsets}, f, ensure_ascii=False)
+        # Атомарная замена, чтобы параллельные сессии не прочитали неполную запись
+        os.replace(temp_path, entry_path)
+        self._evict()
+
+    def _evict(self) -> None:
+        """
+        Удаляет давно не использованные записи, пока кэш не уложится в лимит размера
+        """
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total_size -= size
+                    logger.info(f"Запись кэша удалена: {path}")
+                except OSError:
+                    continue
+
+# Каталог журналов незавершённых транскрибаций по умолчанию
+DEFAULT_JOURNAL_DIR = os.environ.get(
+    "TRANSCRIPTION_JOURNAL_DIR",
+    os.path.join(tempfile.gettempdir(), "transcriptor_cache", "journals")
+)
+# Срок хранения журнала прерванной задачи без новых записей (в секундах)
+DEFAULT_JOURNAL_TTL_SECONDS = int(os.environ.get("TRANSCRIPTION_JOURNAL_TTL_SECONDS", 7 * 24 * 60 * 60))
+
+class TranscriptionJournal:
+    """
+    Журнал одной задачи транскрибации. Каждый фрагмент сохраняется в отдельный
+    файл сразу после ответа API, поэтому при перезапуске той же задачи (тот же
+    ключ) повторно отправляются только недостающие фрагменты. Журналы задач,
+    которые не были перезапущены, удаляются по истечении срока хранения.
+    """
+
+    def __init__(self, job_key: str, journal_dir: str = DEFAULT_JOURNAL_DIR,
+                 ttl_seconds: int = DEFAULT_JOURNAL_TTL_SECONDS):
+        """
+        Инициализирует журнал задачи и удаляет устаревшие журналы других задач
+
+        Args:
+            job_key: Ключ задачи (см. TranscriptionCache.make_key)
+            journal_dir: Корневой каталог журналов
+            ttl_seconds: Срок хранения журнала без новых записей (в секундах)
+        """
+        self.job_dir = os.path.join(journal_dir, job_key)
+        self._expire(journal_dir, ttl_seconds, keep=self.job_dir)
+        os.makedirs(self.job_dir, exist_ok=True)
+
+    @staticmethod
+    def _expire(journal_dir: str, ttl_seconds: int, keep: str) -> None:
+        """
+        Удаляет журналы, в которые давно ничего не записывалось
+
+        Args:
+            journal_dir: Корневой каталог журналов
+            ttl_seconds: Срок хранения журнала без новых записей (в секундах)
+            keep: Каталог журнала текущей задачи (не удаляется)
+        """
+        try:
+            names = os.listdir(journal_dir)
+        except OSError:
+            return
+        deadline = time.time() - ttl_seconds
+        for name in names:
+            path = os.path.join(journal_dir, name)
+            # Запись фрагмента (os.replace) обновляет время модификации каталога задачи
+            try:
+                if path == keep or not os.path.isdir(path) or os.path.getmtime(path) >= deadline:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"Устаревший журнал удалён: {path}")
+
+    def _chunk_path(self, chunk_index: int) -> str:
+        return os.path.join(self.job_dir, f"chunk_{chunk_index}.json")
+
+    def load(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Загружает все сохранённые фрагменты задачи
+
+        Returns:
+            Словарь {номер фрагмента: {"text", "language", "start_ms", "end_ms"}}
+        """
+        entries = {}
+        for name in os.listdir(self.job_dir):
+            if not (name.startswith("chunk_") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.job_dir, name), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                entries[int(entry["index"])] = entry
+            except (OSError, ValueError, KeyError):
+                # Повреждённая запись - фрагмент будет транскрибирован заново
+                continue
+        return entries
+
+    def record(self, chunk_index: int, text: str, language: Optional[str], start_ms: int, end_ms: int) -> None:
+        """
+        Сохраняет транскрипцию фрагмента
+
+        Args:
+            chunk_index: Номер фрагмента
+            text: Текст фрагмента
+            language: Язык, который вернул API (или None)
+            start_ms: Начало фрагмента (в миллисекундах)
+            end_ms: Конец фрагмента (в миллисекундах)
+        """
+        chunk_path = self._chunk_path(chunk_index)
+        # Своё имя временного файла у каждого потока: параллельные сессии могут продолжать одну задачу
+        temp_path = f"{chunk_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "index": chunk_index,
+                "text": text,
+                "language": language,
+                "start_ms": start_ms,
+                "end_ms": end_ms
+            }, f, ensure_ascii=False)
+        os.replace(temp_path, chunk_path)
+
+    def clear(self) -> None:
+        """
+        Удаляет журнал после успешного завершения задачи
+        """
+        shutil.rmtree(self.job_dir, ignore_errors=True)
@@ -1,22 +1,35 @@
 import os
 import re
-import time
+import json
+import bisect
+import logging
 import shutil
+import asyncio
 import tempfile
 import textwrap
-import tiktoken
 import openai
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable
 import platform
 import subprocess
 
-import yt_dlp
 from pydub import AudioSegment
 import numpy as np
 from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import CharacterTextSplitter, MarkdownHeaderTextSplitter
+from langchain.text_splitter import MarkdownHeaderTextSplitter
 from langchain_community.vectorstores import FAISS
-from langdetect import detect
+
+from openai_client import (
+    call_with_retry, acall_with_retry, get_async_client, run_sync, iterate_sync
+)
+from rate_limiter import estimate_chat_cost, get_encoding
+from transcription_cache import TranscriptionCache, TranscriptionJournal
+from transcription_backends import TranscriptionBackend, get_transcription_backend
+from transcript_overlap import trim_overlap
+from language_detector import detect_language
+from llm_cache import LLMResponseCache
+from batch_client import BatchDeferred, batch_collector
+
+logger = logging.getLogger('utils')
 
 # Настройка пути к ffmpeg
 def setup_ffmpeg_path():
@@ -48,8 +61,162 @@ def setup_ffmpeg_path():
 # Вызываем настройку путей
 setup_ffmpeg_path()
 
+# Краткие сведения об аудио файле
+class AudioFileInfo:
+    """
+    Сведения об аудио файле, полученные через ffprobe без декодирования всего файла.
+    Повторяет атрибуты AudioSegment, которые используются в приложении.
+    """
+
+    def __init__(self, duration_seconds: float, frame_rate: int, channels: int):
+        """
+        Args:
+            duration_seconds: Продолжительность в секундах
+            frame_rate: Частота дискретизации (Гц)
+            channels: Количество каналов
+        """
+        self.duration_seconds = duration_seconds
+        self.frame_rate = frame_rate
+        self.channels = channels
+
+# Получение сведений об аудио файле через ffprobe
+def probe_audio(audio_file: str) -> AudioFileInfo:
+    """
+    Считывает продолжительность, частоту и количество каналов из заголовков файла.
+
+    Args:
+        audio_file: Путь к аудио (или видео) файлу
+
+    Returns:
+        AudioFileInfo с параметрами первой аудиодорожки
+    """
+    ffprobe_bin = os.environ.get("FFPROBE_BINARY", "ffprobe")
+    output = subprocess.check_output([
+        ffprobe_bin, "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "stream=sample_rate,channels:format=duration",
+        "-of", "json",
+        audio_file
+    ])
+    info = json.loads(output.decode("utf-8"))
+    stream = (info.get("streams") or [{}])[0]
+    return AudioFileInfo(
+        duration_seconds=float(info.get("format", {}).get("duration") or 0.0),
+        frame_rate=int(stream.get("sample_rate") or 0),
+        channels=int(stream.get("channels") or 0)
+    )
+
+# Лимит размера файла для Whisper API (почти 25 MB)
+WHISPER_MAX_FILE_SIZE = 26000000
+# Профили кодирования фрагментов для загрузки в Whisper API.
+# Whisper внутри работает с моно 16 кГц, поэтому речевые профили заранее
+# сводят звук в моно, понижают частоту и кодируют с низким постоянным битрейтом.
+UPLOAD_PROFILES = {
+    # Исходные каналы и частота, mp3 128 кбит/с (прежнее поведение)
+    "source": {
+        "format": "mp3", "extension": "mp3", "codec": "libmp3lame",
+        "bitrate_kbps": 128, "channels": None, "sample_rate": None
+    },
+    # Моно 16 кГц, mp3 32 кбит/с: совместимый речевой профиль
+    "speech_mp3": {
+        "format": "mp3", "extension": "mp3", "codec": "libmp3lame",
+        "bitrate_kbps": 32, "channels": 1, "sample_rate": 16000
+    },
+    # Моно 16 кГц, Opus 24 кбит/с в контейнере ogg: минимальный объём загрузки
+    "speech_opus": {
+        "format": "ogg", "extension": "ogg", "codec": "libopus",
+        "bitrate_kbps": 24, "channels": 1, "sample_rate": 16000
+    }
+}
+DEFAULT_UPLOAD_PROFILE = "speech_mp3"
+
+# Допустимый диапазон ускорения речи (один фильтр atempo без потери качества до 2.0)
+MIN_TEMPO = 1.0
+MAX_TEMPO = 2.0
+
+# Проверка коэффициента ускорения речи
+def validate_tempo(tempo: float) -> float:
+    """
+    Проверяет коэффициент ускорения речи
+
+    Args:
+        tempo: Коэффициент ускорения (1.0 - без ускорения)
+
+    Returns:
+        Коэффициент ускорения
+    """
+    if not MIN_TEMPO <= tempo <= MAX_TEMPO:
+        raise ValueError(f"Коэффициент ускорения должен быть от {MIN_TEMPO} до {MAX_TEMPO}, получено {tempo}")
+    return float(tempo)
+
+# Расчёт максимальной длительности фрагмента по битрейту и лимиту API
+def max_chunk_duration_ms(bitrate_kbps: int,
+                          size_limit: int = WHISPER_MAX_FILE_SIZE,
+                          safety_margin: float = 0.95) -> int:
+    """
+    Вычисляет, сколько миллисекунд звука помещается в лимит размера при
+    кодировании с постоянным битрейтом. Запас safety_margin покрывает заголовки
+    контейнера и выравнивание кадров, поэтому каждый фрагмент кодируется один раз.
+
+    Args:
+        bitrate_kbps: Битрейт кодирования (кбит/с)
+        size_limit: Лимит размера файла (в байтах)
+        safety_margin: Доля лимита, которую разрешено занять звуком
+
+    Returns:
+        Максимальная длительность фрагмента (в миллисекундах)
+    """
+    bytes_per_ms = bitrate_kbps * 1000 / 8 / 1000
+    return int(size_limit * safety_margin / bytes_per_ms)
+
+# Экспорт фрагмента аудио напрямую из исходного файла (ffmpeg)
+def export_audio_chunk(audio_path: str, chunk_path: str, start_ms: int, duration_ms: int,
+                       profile: str = DEFAULT_UPLOAD_PROFILE, tempo: float = 1.0) -> str:
+    """
+    Вырезает фрагмент из исходного файла с помощью ffmpeg и кодирует его по
+    профилю загрузки с постоянным битрейтом, чтобы размер файла был известен заранее.
+    ffmpeg перематывает файл к началу фрагмента и декодирует только его,
+    поэтому расход памяти не зависит от длины записи.
+    При tempo > 1 речь ускоряется фильтром atempo без изменения высоты тона,
+    и фрагмент получается в tempo раз короче и меньше.
+
+    Args:
+        audio_path: Путь к исходному аудио (или видео) файлу
+        chunk_path: Путь для сохранения фрагмента
+        start_ms: Начало фрагмента (в миллисекундах исходной записи)
+        duration_ms: Длительность фрагмента (в миллисекундах исходной записи)
+        profile: Название профиля из UPLOAD_PROFILES
+        tempo: Коэффициент ускорения речи (1.0 - без ускорения)
+
+    Returns:
+        Путь к сохранённому фрагменту
+    """
+    settings = UPLOAD_PROFILES[profile]
+    ffmpeg_bin = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+    command = [
+        ffmpeg_bin, "-v", "error", "-y",
+        "-ss", f"{start_ms / 1000:.3f}",
+        "-t", f"{duration_ms / 1000:.3f}",
+        "-i", audio_path,
+        "-vn"
+    ]
+    # Сведение в моно и понижение частоты дискретизации
+    if settings["channels"]:
+        command += ["-ac", str(settings["channels"])]
+    if settings["sample_rate"]:
+        command += ["-ar", str(settings["sample_rate"])]
+    if tempo != 1.0:
+        command += ["-af", f"atempo={validate_tempo(tempo):.3f}"]
+    command += ["-c:a", settings["codec"], "-b:a", f"{settings['bitrate_kbps']}k"]
+    # Opus по умолчанию кодирует с переменным битрейтом - отключаем для предсказуемого размера
+    if settings["codec"] == "libopus":
+        command += ["-vbr", "off"]
+    command += ["-f", settings["format"], chunk_path]
+    subprocess.run(command, check=True, capture_output=True)
+    return chunk_path
+
 # Информация об аудио файлe
-def audio_info(audio_file: str) -> AudioSegment:
+def audio_info(audio_file: str) -> AudioFileInfo:
     """
     Получает информацию об аудио файле.
 
@@ -57,104 +224,608 @@ def audio_info(audio_file: str) -> AudioSegment:
         audio_file: Путь к аудио файлу
 
     Returns:
-        AudioSegment объект
+        AudioFileInfo объект (продолжительность, частота, каналы)
     """
-    audio = AudioSegment.from_file(audio_file)
+    audio = probe_audio(audio_file)
     print(f'\nПродолжительность: {audio.duration_seconds / 60:.2f} мин.')
     print(f'Частота дискретизаци: {audio.frame_rate}')
     print(f'Количество каналов: {audio.channels}')
     return audio
 
-# Транскрибация аудио в текст (OpenAI - whisper)
-def transcribe_audio_whisper(audio_path: str,
-                             file_title: str,
-                             save_folder_path: str,
-                             max_duration: int = 10*60*1000) -> Tuple[str, str]:
+# Частота дискретизации PCM-потока для анализа пауз
+ENERGY_SAMPLE_RATE = 8000
+# Длительность одного кадра огибающей энергии (в миллисекундах)
+ENERGY_FRAME_MS = 20
+
+# Потоковое чтение моно PCM-кадров через ffmpeg
+def _iter_pcm_frames(audio_path: str, sample_rate: int, frame_ms: int, frames_per_block: int = 3000):
+    """
+    Декодирует файл в 16-битный моно PCM-поток заданной частоты и отдаёт его
+    блоками кадров. В памяти одновременно находится только один блок.
+
+    Args:
+        audio_path: Путь к аудио (или видео) файлу
+        sample_rate: Частота дискретизации PCM-потока (Гц)
+        frame_ms: Длительность кадра (в миллисекундах)
+        frames_per_block: Количество кадров в одном блоке
+
+    Yields:
+        Массив float32 формы (кадров в блоке, отсчётов в кадре)
+    """
+    ffmpeg_bin = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+    frame_len = sample_rate * frame_ms // 1000
+    block_bytes = frame_len * 2 * frames_per_block
+    process = subprocess.Popen([
+        ffmpeg_bin, "-v", "error",
+        "-i", audio_path,
+        "-vn", "-ac", "1", "-ar", str(sample_rate),
+        "-f", "s16le", "-"
+    ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    remainder = b""
+    try:
+        while True:
+            block = process.stdout.read(block_bytes)
+            if not block:
+                break
+            block = remainder + block
+            usable = len(block) - len(block) % (frame_len * 2)
+            remainder = block[usable:]
+            if usable:
+                yield np.frombuffer(block[:usable], dtype=np.int16).reshape(-1, frame_len).astype(np.float32)
+    finally:
+        process.stdout.close()
+        process.wait()
+
+# Огибающая кратковременной энергии аудио (numpy)
+def compute_energy_envelope(audio_path: str,
+                            sample_rate: int = ENERGY_SAMPLE_RATE,
+                            frame_ms: int = ENERGY_FRAME_MS) -> np.ndarray:
+    """
+    Вычисляет огибающую кратковременной энергии (в дБ) по прореженному моно PCM-потоку.
+    ffmpeg декодирует файл в 16-битный моно поток с низкой частотой, который
+    читается блоками, поэтому в памяти хранится только сама огибающая.
+
+    Args:
+        audio_path: Путь к аудио (или видео) файлу
+        sample_rate: Частота дискретизации PCM-потока (Гц)
+        frame_ms: Длительность кадра (в миллисекундах)
+
+    Returns:
+        Массив энергий кадров в дБ (один элемент на кадр)
+    """
+    # Среднеквадратичная энергия каждого кадра блока за одну векторную операцию
+    energies = [np.sqrt(np.mean(frames ** 2, axis=1))
+                for frames in _iter_pcm_frames(audio_path, sample_rate, frame_ms)]
+    if not energies:
+        return np.zeros(0, dtype=np.float32)
+    return 20 * np.log10(np.concatenate(energies) + 1.0)
+
+# Частота дискретизации и длительность кадра для поиска участков без речи
+VAD_SAMPLE_RATE = 16000
+VAD_FRAME_MS = 30
+
+# Поиск участков речи по энергии и частоте переходов через ноль (numpy)
+def detect_speech_spans(audio_path: str,
+                        min_silence_ms: int = 1500,
+                        padding_ms: int = 300,
+                        energy_margin_db: float = 12.0,
+                        noise_percentile: float = 10.0,
+                        zcr_threshold: float = 0.25) -> Tuple[List[Tuple[int, int]], int]:
+    """
+    Находит участки речи в 16 кГц моно потоке. Кадр считается речью, если его энергия
+    заметно выше уровня шума, либо энергия умеренная, а частота переходов через ноль
+    высокая (глухие согласные). Паузы короче min_silence_ms остаются внутри речи,
+    а каждый участок расширяется на padding_ms, чтобы не обрезать начала и концы слов.
+
+    Args:
+        audio_path: Путь к аудио (или видео) файлу
+        min_silence_ms: Минимальная длительность удаляемой паузы (в миллисекундах)
+        padding_ms: Запас вокруг участков речи (в миллисекундах)
+        energy_margin_db: Превышение над уровнем шума, при котором кадр считается речью (дБ)
+        noise_percentile: Перцентиль энергии, принимаемый за уровень шума
+        zcr_threshold: Доля переходов через ноль, характерная для глухих согласных
+
+    Returns:
+        Кортеж из списка участков речи (начало, конец) в миллисекундах и длительности записи
+    """
+    energies = []
+    crossings = []
+    for frames in _iter_pcm_frames(audio_path, VAD_SAMPLE_RATE, VAD_FRAME_MS):
+        energies.append(np.sqrt(np.mean(frames ** 2, axis=1)))
+        # Доля соседних отсчётов с разным знаком в каждом кадре
+        crossings.append(np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1))
+    if not energies:
+        return [], 0
+
+    energy_db = 20 * np.log10(np.concatenate(energies) + 1.0)
+    zcr = np.concatenate(crossings)
+    total_ms = len(energy_db) * VAD_FRAME_MS
+
+    noise_floor = np.percentile(energy_db, noise_percentile)
+    speech = (energy_db > noise_floor + energy_margin_db) | \
+             ((energy_db > noise_floor + energy_margin_db / 2) & (zcr > zcr_threshold))
+
+    # Границы непрерывных участков речи: индексы начала и конца (не включительно)
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) * VAD_FRAME_MS
+    ends = np.flatnonzero(edges == -1) * VAD_FRAME_MS
+
+    spans = []
+    for start, end in zip(starts, ends):
+        start = max(0, int(start) - padding_ms)
+        end = min(total_ms, int(end) + padding_ms)
+        # Короткие паузы не удаляем - склеиваем с предыдущим участком
+        if spans and start - spans[-1][1] < min_silence_ms:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((start, end))
+    return spans, total_ms
+
+# Построение карты смещений для сжатой записи
+def build_offset_map(speech_spans: List[Tuple[int, int]]) -> List[Tuple[int, int, int]]:
+    """
+    Строит карту соответствия времени сжатой записи (без пауз) исходному времени.
+
+    Args:
+        speech_spans: Участки речи (начало, конец) в миллисекундах исходной записи
+
+    Returns:
+        Список (начало в сжатой записи, начало в исходной записи, длительность) в миллисекундах
+    """
+    offset_map = []
+    compact_position = 0
+    for start, end in speech_spans:
+        offset_map.append((compact_position, start, end - start))
+        compact_position += end - start
+    return offset_map
+
+# Перевод времени сжатой записи во время исходной записи
+def map_to_original_time(offset_map: List[Tuple[int, int, int]], compact_ms: int) -> int:
+    """
+    Переводит отметку времени сжатой записи в отметку исходной записи.
+
+    Args:
+        offset_map: Карта из build_offset_map
+        compact_ms: Время в сжатой записи (в миллисекундах)
+
+    Returns:
+        Время в исходной записи (в миллисекундах)
+    """
+    if not offset_map:
+        return compact_ms
+    compact_starts = [entry[0] for entry in offset_map]
+    index = max(0, bisect.bisect_right(compact_starts, compact_ms) - 1)
+    compact_start, original_start, duration = offset_map[index]
+    return original_start + min(compact_ms - compact_start, duration)
+
+# Выражение выбора кадров, попадающих в участки речи
+def _span_select_expr(speech_spans: List[Tuple[int, int]]) -> str:
+    """
+    Строит для aselect сбалансированное дерево if() по отсортированным участкам.
+    ffmpeg вычисляет только выбранную ветку if(), поэтому на кадр приходится
+    около log2(N) сравнений вместо N слагаемых between(...)+...
+
+    Args:
+        speech_spans: Непересекающиеся участки речи (начало, конец) в миллисекундах, по возрастанию
+
+    Returns:
+        Выражение ffmpeg от времени кадра t
+    """
+    if len(speech_spans) == 1:
+        start, end = speech_spans[0]
+        return f"between(t,{start / 1000:.3f},{end / 1000:.3f})"
+    middle = len(speech_spans) // 2
+    return (f"if(lt(t,{speech_spans[middle][0] / 1000:.3f}),"
+            f"{_span_select_expr(speech_spans[:middle])},{_span_select_expr(speech_spans[middle:])})")
+
+# Удаление участков без речи из записи
+def compact_audio(audio_path: str, output_path: str, speech_spans: List[Tuple[int, int]]) -> str:
+    """
+    Склеивает участки речи в новый файл (16 кГц моно FLAC) одним проходом ffmpeg.
+    Фильтр передаётся через файл (-filter_script:a): при сотнях участков строка
+    фильтра превышает ограничение длины командной строки Windows.
+
+    Args:
+        audio_path: Путь к исходному аудио (или видео) файлу
+        output_path: Путь для сохранения сжатой записи (.flac)
+        speech_spans: Участки речи (начало, конец) в миллисекундах
+
+    Returns:
+        Путь к сжатой записи
+    """
+    ffmpeg_bin = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+    select = _span_select_expr(sorted(speech_spans))
+    script_path = os.path.join(os.path.dirname(os.path.abspath(output_path)), "compact_filter.txt")
+    with open(script_path, "w", encoding="utf-8") as f:
+        f.write(f"aselect='{select}',asetpts=N/SR/TB")
+    try:
+        subprocess.run([
+            ffmpeg_bin, "-v", "error", "-y",
+            "-i", audio_path,
+            "-vn", "-ac", "1", "-ar", str(VAD_SAMPLE_RATE),
+            "-filter_script:a", script_path,
+            "-c:a", "flac",
+            output_path
+        ], check=True, capture_output=True)
+    finally:
+        os.remove(script_path)
+    return output_path
+
+# Разбиение на отрезки фиксированной длины
+def _fixed_chunk_spans(total_ms: int, max_chunk_ms: int) -> List[Tuple[int, int]]:
+    """
+    Делит запись на отрезки одинаковой длины (последний может быть короче).
+
+    Args:
+        total_ms: Длительность записи (в миллисекундах)
+        max_chunk_ms: Длительность отрезка (в миллисекундах)
+
+    Returns:
+        Список отрезков (начало, конец) в миллисекундах
+    """
+    return [(start, min(start + max_chunk_ms, total_ms)) for start in range(0, total_ms, max_chunk_ms)]
+
+# Планирование границ фрагментов по паузам
+def plan_chunk_boundaries(energy_db: np.ndarray,
+                          total_ms: int,
+                          max_chunk_ms: int,
+                          tolerance_ms: int = 30*1000,
+                          frame_ms: int = ENERGY_FRAME_MS,
+                          smoothing_ms: int = 300,
+                          silence_percentile: float = 15.0) -> List[Tuple[int, int]]:
+    """
+    Выбирает границы фрагментов в паузах речи.
+    Каждая граница ищется в окне [max_chunk_ms - tolerance_ms, max_chunk_ms] от начала
+    фрагмента: берётся ближайшая к концу окна тишина, а если тишины в окне нет -
+    самый тихий участок. Так фрагменты остаются максимально длинными и не режут слова.
+
+    Args:
+        energy_db: Огибающая энергии из compute_energy_envelope
+        total_ms: Длительность записи (в миллисекундах)
+        max_chunk_ms: Максимальная длительность фрагмента (в миллисекундах)
+        tolerance_ms: Насколько раньше максимума можно сдвинуть границу (в миллисекундах)
+        frame_ms: Длительность кадра огибающей (в миллисекундах)
+        smoothing_ms: Окно сглаживания огибающей, чтобы искать паузы, а не отдельные тихие кадры
+        silence_percentile: Перцентиль энергии, ниже которого кадр считается тишиной
+
+    Returns:
+        Список отрезков (начало, конец) в миллисекундах
+    """
+    if len(energy_db) == 0 or total_ms <= max_chunk_ms:
+        return _fixed_chunk_spans(total_ms, max_chunk_ms)
+
+    # Сглаживаем огибающую скользящим средним
+    width = max(1, smoothing_ms // frame_ms)
+    smoothed = np.convolve(energy_db, np.ones(width, dtype=np.float32) / width, mode="same")
+    silence_threshold = np.percentile(smoothed, silence_percentile)
+
+    spans = []
+    start = 0
+    while total_ms - start > max_chunk_ms:
+        window_end = min(len(smoothed), (start + max_chunk_ms) // frame_ms)
+        window_start = max(start // frame_ms + 1, (start + max_chunk_ms - tolerance_ms) // frame_ms)
+        if window_start >= window_end:
+            split = start + max_chunk_ms
+        else:
+            window = smoothed[window_start:window_end]
+            silent = np.flatnonzero(window <= silence_threshold)
+            if len(silent):
+                # Ближайшая к концу окна пауза: режем посередине её последнего непрерывного участка
+                breaks = np.flatnonzero(np.diff(silent) > 1)
+                run_start = silent[breaks[-1] + 1] if len(breaks) else silent[0]
+                offset = (int(run_start) + int(silent[-1])) // 2
+            else:
+                # Тишины нет - режем в самом тихом месте окна
+                offset = int(np.argmin(window))
+            split = (window_start + offset) * frame_ms
+        spans.append((start, split))
+        start = split
+    spans.append((start, total_ms))
+    return spans
+
+# Общий для процесса кэш готовых транскрипций
+TRANSCRIPTION_CACHE = TranscriptionCache()
+
+# Максимальное количество фрагментов, одновременно отправляемых в Whisper API
+WHISPER_MAX_WORKERS = 4
+
+# Планирование отрезков для нарезки записи
+def _plan_chunk_spans(audio_path: str,
+                      total_duration: int,
+                      max_duration: int,
+                      split_on_silence: bool,
+                      silence_tolerance: int) -> List[Tuple[int, int]]:
+    """
+    Планирует отрезки фрагментов: по паузам речи или, если анализ не удался, фиксированно.
+
+    Args:
+        audio_path: Путь к аудио файлу
+        total_duration: Длительность записи (в миллисекундах)
+        max_duration: Максимальная длительность фрагмента (в миллисекундах)
+        split_on_silence: Искать границы фрагментов в паузах
+        silence_tolerance: Окно поиска паузы перед максимальной границей (в миллисекундах)
+
+    Returns:
+        Список отрезков (начало, конец) в миллисекундах
+    """
+    if split_on_silence:
+        try:
+            energy_db = compute_energy_envelope(audio_path)
+            return plan_chunk_boundaries(energy_db, total_duration, max_duration, silence_tolerance)
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            print(f"Не удалось найти паузы, используем фиксированную нарезку: {e}")
+    return _fixed_chunk_spans(total_duration, max_duration)
+
+# Сохранение текста транскрипции
+def _save_transcription(result_path: str, text: str) -> None:
+    with open(result_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+# Сохранение карты смещений
+def _save_offsets(offsets_path: str, offsets: Dict[str, Any]) -> None:
+    with open(offsets_path, "w", encoding="utf-8") as f:
+        json.dump(offsets, f)
+
+# Предварительный проход удаления пауз
+def _remove_silence_pass(audio_path: str, temp_dir: str) -> Tuple[str, int, Dict[str, Any]]:
+    """
+    Вырезает длинные паузы из записи и строит карту смещений.
+    Если речь не найдена, возвращается исходная запись и тождественная карта.
+
+    Args:
+        audio_path: Путь к аудио файлу
+        temp_dir: Папка для сжатой записи
+
+    Returns:
+        Кортеж из пути к записи для нарезки, её длительности (в миллисекундах)
+        и карты смещений {"source_duration_ms", "offsets"} для сохранения в JSON
+    """
+    speech_spans, total_ms = detect_speech_spans(audio_path)
+    if not speech_spans:
+        print("Речь не найдена, паузы не удаляются")
+        return audio_path, total_ms, {"source_duration_ms": total_ms, "offsets": build_offset_map([(0, total_ms)])}
+
+    compact_path = compact_audio(audio_path, os.path.join(temp_dir, "compact.flac"), speech_spans)
+    offset_map = build_offset_map(speech_spans)
+    compact_ms = sum(length for _, _, length in offset_map)
+
+    removed_share = 100 * (1 - compact_ms / total_ms) if total_ms else 0
+    print(f"Удалено пауз: {(total_ms - compact_ms) / 1000:.1f} с ({removed_share:.0f}% записи)")
+    return compact_path, compact_ms, {"source_duration_ms": total_ms, "offsets": offset_map}
+
+# Транскрибация аудио в текст (OpenAI - whisper), асинхронная версия
+async def transcribe_audio_whisper_async(audio_path: str,
+                                         file_title: str,
+                                         save_folder_path: str,
+                                         max_duration: Optional[int] = 10*60*1000,
+                                         max_workers: int = WHISPER_MAX_WORKERS,
+                                         split_on_silence: bool = True,
+                                         silence_tolerance: int = 30*1000,
+                                         upload_profile: str = DEFAULT_UPLOAD_PROFILE,
+                                         use_cache: bool = True,
+                                         resume: bool = True,
+                                         remove_silence: bool = False,
+                                         tempo: float = 1.0,
+                                         backend: Optional[TranscriptionBackend] = None,
+                                         overlap_ms: int = 0,
+                                         on_chunk: Optional[Callable[[str, Optional[str]], Any]] = None) -> Tuple[str, str]:
     """
     Транскрибация аудиофайла по частям с использованием OpenAI Whisper API.
 
+    Фрагменты вырезаются из исходного файла через ffmpeg по одному, поэтому
+    весь трек никогда не декодируется в память целиком.
+    Границы фрагментов по возможности выбираются в паузах речи (split_on_silence).
+    Готовые транскрипции кэшируются на диске по хэшу содержимого файла, а каждый
+    транскрибированный фрагмент сразу записывается в журнал задачи, поэтому
+    прерванная задача при повторном запуске продолжается с недостающих фрагментов.
+    Фрагменты отправляются в API параллельно (не более max_workers запросов
+    одновременно), а тексты собираются обратно в порядке фрагментов.
+    Блокирующие операции (ffprobe, ffmpeg, хэширование, кэш, журнал и запись файлов)
+    выполняются вне цикла событий.
+
     Args:
         audio_path: Путь к аудио файлу
         file_title: Название файла для сохранения результатов
         save_folder_path: Папка для сохранения результатов
-        max_duration: Максимальная длительность фрагмента (в миллисекундах)
+        max_duration: Максимальная длительность фрагмента (в миллисекундах); дополнительно
+            ограничивается длительностью, которая помещается в лимит размера API
+            (None - только этим лимитом)
+        max_workers: Количество одновременных запросов к Whisper API (1 - последовательно)
+        split_on_silence: Искать границы фрагментов в паузах вместо жёсткой нарезки
+        silence_tolerance: Окно поиска паузы перед максимальной границей (в миллисекундах)
+        upload_profile: Профиль кодирования фрагментов из UPLOAD_PROFILES
+        use_cache: Брать результат из кэша транскрипций (по хэшу содержимого файла) и сохранять в него
+        resume: Вести журнал фрагментов и при повторном запуске отправлять в API только недостающие
+        remove_silence: Вырезать длинные паузы перед нарезкой; соответствие времени сжатой
+            записи исходной сохраняется в {file_title}_offsets.json (и при взятии из кэша)
+        tempo: Ускорение речи перед загрузкой (от 1.0 до 2.0); меньше фрагментов, байтов
+            и оплачиваемых минут ценой небольшой потери точности
+        backend: Бэкенд транскрибации фрагментов (по умолчанию get_transcription_backend())
+        overlap_ms: Перекрытие соседних фрагментов (в миллисекундах исходной записи). Каждый
+            фрагмент начинается на overlap_ms раньше своей границы, а повтор текста на стыке
+            удаляется при сборке (transcript_overlap.trim_overlap). 0 - без перекрытия
+        on_chunk: Функция, которая получает текст каждого фрагмента и язык транскрибации
+            (определённый по первым фрагментам) в порядке фрагментов, как только фрагмент
+            и все предыдущие готовы. Вызывается в цикле событий и не должна блокировать его.
+            Транскрипция из кэша передаётся одним вызовом
 
     Returns:
         Кортеж из текста транскрипции и языка транскрибации
     """
     # Создание папки для сохранения результатов, если она ещё не существует
-    os.makedirs(save_folder_path, exist_ok=True)
-
-    # Загрузка аудиофайла
-    audio = AudioSegment.from_file(audio_path)
-
-    # Создание временной папки для хранения аудио фрагментов
-    temp_dir = tempfile.mkdtemp()
+    await asyncio.to_thread(os.makedirs, save_folder_path, exist_ok=True)
+
+    # Определение длительности аудиофайла без его загрузки в память
+    audio = await asyncio.to_thread(probe_audio, audio_path)
+    total_duration = int(audio.duration_seconds * 1000)
+
+    # Длительность фрагмента, гарантированно укладывающегося в лимит API.
+    # Ограничения относятся к загружаемому (ускоренному) звуку, поэтому
+    # в исходной записи фрагмент может быть в tempo раз длиннее.
+    tempo = validate_tempo(tempo)
+    backend = backend or get_transcription_backend()
+    profile_settings = UPLOAD_PROFILES[upload_profile]
+    size_limited_duration = max_chunk_duration_ms(profile_settings["bitrate_kbps"])
+    max_duration = size_limited_duration if max_duration is None else min(max_duration, size_limited_duration)
+    max_duration = int(max_duration * tempo)
+    # Перекрытие добавляется к фрагменту, поэтому граница планируется с запасом
+    if overlap_ms:
+        if overlap_ms >= max_duration // 2:
+            raise ValueError(f"Перекрытие {overlap_ms} мс слишком велико для фрагментов по {max_duration} мс")
+        max_duration -= overlap_ms
+
+    # Ключ задачи: содержимое файла и параметры нарезки
+    result_path = os.path.join(save_folder_path, f"{file_title}.txt")
+    offsets_path = os.path.join(save_folder_path, f"{file_title}_offsets.json")
+    job_key = None
+    if use_cache or resume:
+        job_key = await asyncio.to_thread(TRANSCRIPTION_CACHE.make_key, audio_path, {
+            "model": backend.model,
+            "upload_profile": upload_profile,
+            "max_duration": max_duration,
+            "split_on_silence": split_on_silence,
+            "silence_tolerance": silence_tolerance,
+            "remove_silence": remove_silence,
+            "tempo": tempo,
+            "overlap_ms": overlap_ms
+        })
+
+    # Поиск готовой транскрипции в кэше. В режиме удаления пауз запись без карты
+    # смещений (сохранённая до её появления в кэше) не используется
+    if use_cache:
+        cached = await asyncio.to_thread(TRANSCRIPTION_CACHE.get, job_key)
+        if cached is not None and (cached[2] is not None or not remove_silence):
+            result_text, detected_language, offsets = cached
+            await asyncio.to_thread(_save_transcription, result_path, result_text)
+            if remove_silence:
+                await asyncio.to_thread(_save_offsets, offsets_path, offsets)
+            print(f"Транскрипция взята из кэша и сохранена в {result_path}")
+            if on_chunk:
+                on_chunk(result_text, detected_language)
+            return result_text, detected_language
+
+    # Журнал уже транскрибированных фрагментов этой задачи
+    journal = await asyncio.to_thread(TranscriptionJournal, job_key) if resume else None
+    journal_entries = await asyncio.to_thread(journal.load) if journal else {}
+
+    # Ограничение количества одновременных запросов к Whisper API
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    # Транскрибация фрагмента с немедленной записью результата в журнал
+    async def transcribe_and_record(chunk_index: int, chunk_path: str, start_ms: int, end_ms: int,
+                                    export_start_ms: int):
+        async with semaphore:
+            result = await backend.transcribe_chunk(chunk_path, (end_ms - export_start_ms) / 1000 / tempo)
+        if journal:
+            await asyncio.to_thread(journal.record, chunk_index, result.text, result.language, start_ms, end_ms)
+        return result.text, result.language
 
     # Инициализация переменных для обработки аудио фрагментов
-    current_start_time = 0  # Текущее время начала фрагмента
-    chunk_index = 1         # Индекс текущего фрагмента
     transcriptions = []     # Список для хранения всех транскрибаций
     detected_language = None
-
-    # Обработка аудиофайла частями
-    while current_start_time < len(audio):
-        # Выделение фрагмента из аудиофайла
-        chunk = audio[current_start_time:current_start_time + max_duration]
-        # Формирование имени и пути файла фрагмента
-        chunk_name = f"chunk_{chunk_index}.mp3"
-        chunk_path = os.path.join(temp_dir, chunk_name)
-        # Экспорт фрагмента
-        chunk.export(chunk_path, format="mp3")
-
-        # Проверка размера файла фрагмента на соответствие лимиту API
-        if os.path.getsize(chunk_path) > 26000000:  # почти 25 MB
-            print(f"Фрагмент {chunk_index} превышает максимальный размер для API. Пробуем уменьшить...")
-            max_duration = int(max_duration * 0.8)  # Уменьшение длительности фрагмента
-            os.remove(chunk_path)  # Удаление фрагмента, превышающего лимит
-            continue
-
-        # Открытие файла фрагмента для чтения в двоичном режиме
-        with open(chunk_path, "rb") as src_file:
-            print(f"Транскрибация {chunk_name}...")
+    offsets = None          # Карта смещений сжатой записи (режим удаления пауз)
+    results = []            # Задача запроса к API или готовый результат из журнала, в порядке фрагментов
+    collected = 0           # Количество уже собранных результатов
+    # Оценка сверху количества слов в перекрытии (быстрая речь - до 4 слов в секунду)
+    overlap_tokens = int(overlap_ms / 1000 * tempo * 4) + 1
+
+    # Сбор результатов строго в порядке фрагментов; без wait собираются только уже готовые
+    async def collect(wait: bool):
+        nonlocal collected, detected_language
+        while collected < len(results):
+            result = results[collected]
+            if isinstance(result, asyncio.Task) and not wait and not result.done():
+                return
             try:
-                # Запрос на транскрибацию фрагмента с использованием модели Whisper
-                transcript_response = openai.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=src_file
-                )
-
-                # Добавление результата транскрибации в список транскрипций
-                transcriptions.append(transcript_response.text)
-
-                # Пытаемся определить язык от API, если он доступен
-                response_language = getattr(transcript_response, 'language', None)
-
-                # Сохраняем язык транскрибации только от первого фрагмента для стабильности
-                if detected_language is None:
-                    # Если API не вернул язык или он не определен, пробуем определить самостоятельно
-                    if not response_language or response_language == "unknown":
-                        # Пробуем определить язык самостоятельно из текста транскрибации
-                        text_language = detect_language(transcript_response.text)
-                        detected_language = text_language
-                    else:
-                        detected_language = response_language
-
-                    print(f"Определен язык: {detected_language}")
-
-            except openai.BadRequestError as e:
+                text, response_language = await result if isinstance(result, asyncio.Task) else result
+            except Exception as e:
+                # Без фрагмента транскрипция была бы молча обрезана - прерываем задачу.
+                # Готовые фрагменты остаются в журнале и не будут отправлены повторно.
                 print(f"Произошла ошибка: {e}")
-                break
+                raise
+            collected += 1
+
+            # Удаление повтора на стыке с предыдущим фрагментом (режим перекрытия)
+            if overlap_ms and transcriptions:
+                text = trim_overlap(transcriptions[-1], text, overlap_tokens)
+                if not text:
+                    continue
+
+            # Добавление результата транскрибации в список транскрипций
+            transcriptions.append(text)
+
+            # Сохраняем язык транскрибации только от первого фрагмента для стабильности
+            if detected_language is None:
+                # Если API не вернул язык или он не определен, пробуем определить самостоятельно
+                if not response_language or response_language == "unknown":
+                    # Пробуем определить язык самостоятельно из текста транскрибации
+                    detected_language = detect_language(text)
+                else:
+                    detected_language = response_language
+
+                print(f"Определен язык: {detected_language}")
 
-        # Переход к следующему фрагменту
-        current_start_time += max_duration
-        chunk_index += 1
+            # Готовый фрагмент сразу передаётся следующим стадиям обработки
+            if on_chunk:
+                on_chunk(text, detected_language)
+
+    # Создание временной папки для хранения аудио фрагментов
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # Предварительное удаление пауз: дальше нарезается сжатая запись
+        source_path = audio_path
+        if remove_silence:
+            source_path, total_duration, offsets = await asyncio.to_thread(
+                _remove_silence_pass, audio_path, temp_dir)
+            await asyncio.to_thread(_save_offsets, offsets_path, offsets)
+
+        # Планирование границ фрагментов
+        chunk_spans = await asyncio.to_thread(
+            _plan_chunk_spans, source_path, total_duration, max_duration, split_on_silence, silence_tolerance)
+        print(f"Запланировано фрагментов: {len(chunk_spans)}")
+
+        # Нарезка аудиофайла на фрагменты; каждый готовый фрагмент сразу уходит в API
+        for chunk_index, (start_ms, end_ms) in enumerate(chunk_spans, start=1):
+            # Фрагмент уже транскрибирован при прошлом запуске
+            entry = journal_entries.get(chunk_index)
+            if entry and (entry["start_ms"], entry["end_ms"]) == (start_ms, end_ms):
+                results.append((entry["text"], entry["language"]))
+                continue
+
+            # Формирование имени и пути файла фрагмента
+            chunk_name = f"chunk_{chunk_index}.{profile_settings['extension']}"
+            chunk_path = os.path.join(temp_dir, chunk_name)
+            # Экспорт фрагмента напрямую из исходного файла (размер известен заранее);
+            # в режиме перекрытия фрагмент захватывает конец предыдущего
+            export_start_ms = max(0, start_ms - overlap_ms)
+            await asyncio.to_thread(
+                export_audio_chunk, source_path, chunk_path, export_start_ms, end_ms - export_start_ms,
+                upload_profile, tempo)
+
+            print(f"Транскрибация {chunk_name}...")
+            results.append(asyncio.create_task(
+                transcribe_and_record(chunk_index, chunk_path, start_ms, end_ms, export_start_ms)))
+            # Уже готовые фрагменты собираются, не дожидаясь окончания нарезки
+            await collect(wait=False)
+
+        restored = sum(1 for result in results if not isinstance(result, asyncio.Task))
+        if restored:
+            print(f"Восстановлено из журнала фрагментов: {restored} из {len(chunk_spans)}")
+
+        await collect(wait=True)
+    finally:
+        # Отменяем незавершённые запросы (при ошибке) и дожидаемся их остановки
+        pending = [result for result in results if isinstance(result, asyncio.Task) and not result.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        # Удаляем временную папку и все файлы в ней, в том числе при ошибке
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
     # Сохранение всех транскрибаций в один текстовый файл
     result_text = "\n".join(transcriptions)
-    result_path = os.path.join(save_folder_path, f"{file_title}.txt")
-    with open(result_path, "w", encoding="utf-8") as f:
-        f.write(result_text)
+    await asyncio.to_thread(_save_transcription, result_path, result_text)
     print(f"Транскрипция сохранена в {result_path}")
 
     # Если язык не был определен, делаем финальную попытку
@@ -162,10 +833,38 @@ def transcribe_audio_whisper(audio_path: str,
         detected_language = detect_language(result_text)
         print(f"Язык определен из полного текста: {detected_language}")
 
-    # Удаляем временную папку и все файлы в ней
-    shutil.rmtree(temp_dir)
+    # Транскрипция полная: сохраняем её в кэш, журнал больше не нужен
+    if use_cache:
+        await asyncio.to_thread(TRANSCRIPTION_CACHE.put, job_key, result_text, detected_language, offsets)
+    if journal:
+        await asyncio.to_thread(journal.clear)
+
     return result_text, detected_language
 
+# Транскрибация аудио в текст (OpenAI - whisper)
+def transcribe_audio_whisper(audio_path: str,
+                             file_title: str,
+                             save_folder_path: str,
+                             max_duration: Optional[int] = 10*60*1000,
+                             max_workers: int = WHISPER_MAX_WORKERS,
+                             split_on_silence: bool = True,
+                             silence_tolerance: int = 30*1000,
+                             upload_profile: str = DEFAULT_UPLOAD_PROFILE,
+                             use_cache: bool = True,
+                             resume: bool = True,
+                             remove_silence: bool = False,
+                             tempo: float = 1.0,
+                             backend: Optional[TranscriptionBackend] = None,
+                             overlap_ms: int = 0,
+                             on_chunk: Optional[Callable[[str, Optional[str]], Any]] = None) -> Tuple[str, str]:
+    """
+    Синхронная обёртка над transcribe_audio_whisper_async (аргументы и результат те же).
+    """
+    return run_sync(transcribe_audio_whisper_async(
+        audio_path, file_title, save_folder_path, max_duration, max_workers,
+        split_on_silence, silence_tolerance, upload_profile, use_cache, resume, remove_silence, tempo, backend, overlap_ms,
+        on_chunk))
+
 # Функция для форматирования текста по абзацам
 def format_text(text: str, width: int = 120) -> str:
     """
@@ -201,44 +900,70 @@ def num_tokens_from_string(string: str, model: str = 'gpt-4o-mini') -> int:
     Returns:
         Количество токенов
     """
-    # Получаем имя кодировки для указанной модели
-    try:
-        encoding_name = tiktoken.encoding_for_model(model).name
-        # Получаем объект кодировки на основе имени кодировки
-        encoding = tiktoken.get_encoding(encoding_name)
-        # Кодируем строку и вычисляем количество токенов
-        num_tokens = len(encoding.encode(string)) + 10
-    except KeyError:
-        # Если модель не найдена, используем cl100k_base
-        encoding = tiktoken.get_encoding("cl100k_base")
-        num_tokens = len(encoding.encode(string)) + 10
-    # Возвращаем количество токенов
-    return num_tokens
-
-# (CharacterTextSplitter) Формируем чанки из текста по количеству символов
-def split_text(text: str,
-               chunk_size: int = 30000,
-               chunk_overlap: int = 1000) -> List[str]:
-    """
-    Разделяет текст на фрагменты (чанки) заданного размера.
+    # Кодировка модели создаётся один раз на процесс (для неизвестных моделей - cl100k_base)
+    encoding = get_encoding(model)
+    # Кодируем строку и вычисляем количество токенов
+    return len(encoding.encode_ordinary(string)) + 10
+
+# Бюджет токенов одного чанка для перевода и разбивки на разделы: ответ модели
+# сопоставим с входом по объёму и должен уложиться в лимит вывода (16k у gpt-4o-mini)
+TEXT_CHUNK_MAX_TOKENS = 10000
+
+# Граница предложения: после знака конца предложения (и закрывающих кавычек/скобок) перед пробелом
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…»"\)])(?=\s)')
+# Граница слова для предложений, которые не помещаются в бюджет целиком
+_WORD_BOUNDARY = re.compile(r'(?=\s)')
+
+# Формируем чанки из текста по количеству токенов с разрезами по границам предложений
+def split_text_by_tokens(text: str,
+                         max_tokens: int = TEXT_CHUNK_MAX_TOKENS,
+                         model: str = 'gpt-4o-mini') -> List[str]:
+    """
+    Разделяет текст на чанки не длиннее max_tokens токенов модели, разрезая только
+    по границам предложений (слишком длинное предложение - по границам слов).
+    Чанки не перекрываются, поэтому при переводе ни один фрагмент не переводится дважды.
+    Каждое предложение кодируется один раз, поэтому время работы линейно по длине текста.
+    Пробелы относятся к началу следующего предложения, как и в токенизаторе,
+    поэтому сумма токенов предложений совпадает с количеством токенов чанка.
 
     Args:
         text: Исходный текст
-        chunk_size: Максимальный размер чанка в символах
-        chunk_overlap: Количество символов перекрытия между чанками
+        max_tokens: Максимальный размер чанка в токенах
+        model: Модель, для которой считаются токены
 
     Returns:
         Список текстовых фрагментов
     """
-    # Удалить пустые строки и лишние пробелы
-    text = re.sub(r'\s+', ' ', text).strip()
-    # Создаем экземпляр CharacterTextSplitter с заданными парамаетрами
-    splitter = CharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separator=" "
-    )
-    return splitter.split_text(text)  # список текстовых чанков
+    encoding = get_encoding(model)
+
+    # Разбиение на части по границам; части длиннее бюджета разбиваются по словам
+    def pieces_with_tokens(fragment: str, boundary: re.Pattern) -> List[Tuple[str, int]]:
+        parts = [part for part in boundary.split(fragment) if part]
+        result = []
+        for part, tokens in zip(parts, encoding.encode_ordinary_batch(parts)):
+            if len(tokens) <= max_tokens:
+                result.append((part, len(tokens)))
+            elif boundary is _SENTENCE_BOUNDARY:
+                result.extend(pieces_with_tokens(part, _WORD_BOUNDARY))
+            else:
+                # Одно «слово» длиннее бюджета (например, длинная ссылка) - режем по токенам
+                result.extend((encoding.decode(tokens[i:i + max_tokens]), len(tokens[i:i + max_tokens]))
+                              for i in range(0, len(tokens), max_tokens))
+        return result
+
+    chunks = []
+    current_parts = []
+    current_tokens = 0
+    for part, tokens in pieces_with_tokens(text, _SENTENCE_BOUNDARY):
+        if current_parts and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current_parts).strip())
+            current_parts = []
+            current_tokens = 0
+        current_parts.append(part)
+        current_tokens += tokens
+    if current_parts:
+        chunks.append("".join(current_parts).strip())
+    return [chunk for chunk in chunks if chunk]
 
 # (MarkdownHeaderTextSplitter) Формируем чанки в формат LangChain Document из текста с Markdown разметкой
 def split_markdown_text(markdown_text: str, strip_headers: bool = False):
@@ -266,8 +991,82 @@ def split_markdown_text(markdown_text: str, strip_headers: bool = False):
     # Разбиваем текст на чанки в формат LangChain Document
     return markdown_splitter.split_text(markdown_text)
 
-# Функция получения ответа от модели
-def generate_answer(system: str, user: str, text: str, temp: float = 0.3, model: str = 'gpt-4o-mini') -> str:
+# Ответ модели обрезан по лимиту вывода
+class TruncatedCompletionError(Exception):
+    """
+    Ответ модели обрезан по лимиту вывода (finish_reason == "length")
+    """
+
+# Кэш ответов модели (общий для процесса)
+LLM_CACHE = LLMResponseCache()
+
+# Запрос к chat completions через кэш ответов
+async def _chat_completion_async(call_site: str, model: str, messages: List[Dict[str, str]], temperature: float,
+                                 require_complete: bool = False, refresh: bool = False) -> str:
+    """
+    Выполняет запрос к chat completions. Ответ на тот же запрос (модель, температура,
+    сообщения) берётся из кэша LLM_CACHE; обрезанные по лимиту вывода ответы не кэшируются.
+    Кэш не используется, если установлен llm_cache_bypass или LLM_CACHE_DISABLED=1.
+    Если установлен batch_collector, запрос не отправляется сразу, а собирается в пакет
+    Batch API (batch_client.run_batched).
+
+    Args:
+        call_site: Имя места вызова для статистики повторов
+        model: Модель
+        messages: Сообщения запроса
+        temperature: Температура генерации
+        require_complete: Вызывать TruncatedCompletionError, если ответ обрезан по лимиту вывода
+        refresh: Не читать ответ из кэша (повторный запрос), новый ответ заменяет сохранённый
+
+    Returns:
+        Текст ответа модели
+    """
+    use_cache = LLM_CACHE.enabled()
+    if use_cache:
+        cache_key = LLM_CACHE.make_key(model, temperature, messages)
+    if use_cache and not refresh:
+        cached = await asyncio.to_thread(LLM_CACHE.get, cache_key)
+        if cached is not None:
+            return cached
+
+    collector = batch_collector.get()
+    if collector is not None:
+        # Ответ из выполненного пакета или BatchDeferred, если запрос ещё не отправлялся
+        content, finish_reason = collector.resolve(
+            LLM_CACHE.make_key(model, temperature, messages),
+            {"model": model, "messages": messages, "temperature": temperature})
+    else:
+        completion = await acall_with_retry(
+            get_async_client().chat.completions.with_raw_response.create,
+            call_site=call_site,
+            cost=estimate_chat_cost(messages, model),
+            model=model,
+            messages=messages,
+            temperature=temperature
+        )
+        content, finish_reason = completion.choices[0].message.content, completion.choices[0].finish_reason
+    if require_complete and finish_reason == "length":
+        raise TruncatedCompletionError(call_site)
+    if use_cache and finish_reason != "length" and content is not None:
+        await asyncio.to_thread(LLM_CACHE.put, cache_key, content)
+    return content
+
+# Количество попыток для повторов мимо кэша
+def _refresh_attempts(max_attempts: int) -> int:
+    """
+    Повтор с refresh=True в режиме Batch API получил бы тот же собранный ответ
+    (ключ запроса не меняется), поэтому при установленном batch_collector попытка одна.
+
+    Args:
+        max_attempts: Количество попыток при обычных запросах
+
+    Returns:
+        Количество попыток для текущего режима
+    """
+    return 1 if batch_collector.get() is not None else max_attempts
+
+# Функция получения ответа от модели, асинхронная версия
+async def generate_answer_async(system: str, user: str, text: str, temp: float = 0.3, model: str = 'gpt-4o-mini') -> str:
     """
     Получает ответ от модели OpenAI.
 
@@ -281,41 +1080,402 @@ def generate_answer(system: str, user: str, text: str, temp: float = 0.3, model:
     Returns:
         Ответ от модели
     """
-    messages = [
+    return await _chat_completion_async("generate_answer", model, _answer_messages(system, user, text), temp)
+
+# Функция получения ответа от модели
+def generate_answer(system: str, user: str, text: str, temp: float = 0.3, model: str = 'gpt-4o-mini') -> str:
+    """
+    Синхронная обёртка над generate_answer_async (аргументы и результат те же).
+    """
+    return run_sync(generate_answer_async(system, user, text, temp, model))
+
+# Сообщения запроса generate_answer
+def _answer_messages(system: str, user: str, text: str) -> List[Dict[str, str]]:
+    return [
         {'role': 'system', 'content': system},
         {'role': 'user', 'content': user + '\n' + text}
     ]
-    completion = openai.chat.completions.create(
+
+# Итоговый текст потокового ответа
+class FinalText:
+    """
+    Последний элемент потока *_stream_async: итоговый текст результата.
+    Он может отличаться от склеенных фрагментов потока (например, если обрезанный
+    перевод был выполнен повторно), и именно его следует сохранять.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+
+# Синхронный поток фрагментов ответа
+class TextStream:
+    """
+    Итератор фрагментов текста по мере их генерации моделью (для st.write_stream).
+    После завершения итерации итоговый текст доступен в атрибуте text.
+    """
+
+    def __init__(self, chunks):
+        """
+        Args:
+            chunks: Итератор фрагментов (строки и завершающий FinalText)
+        """
+        self._chunks = chunks
+        self.text: Optional[str] = None
+
+    def __iter__(self):
+        parts = []
+        for chunk in self._chunks:
+            if isinstance(chunk, FinalText):
+                self.text = chunk.text
+                continue
+            parts.append(chunk)
+            yield chunk
+        if self.text is None:
+            self.text = "".join(parts)
+
+# Потоковый запрос к chat completions через кэш ответов
+async def _stream_chat_async(call_site: str, model: str, messages: List[Dict[str, str]], temperature: float,
+                             emit: Callable[[str], None]) -> Tuple[str, Optional[str]]:
+    """
+    Выполняет запрос к chat completions с stream=True и передаёт фрагменты ответа
+    в emit по мере поступления. Ответ из кэша LLM_CACHE передаётся целиком;
+    полный (не обрезанный по лимиту вывода) ответ сохраняется в кэш.
+
+    Args:
+        call_site: Имя места вызова для статистики повторов
+        model: Модель
+        messages: Сообщения запроса
+        temperature: Температура генерации
+        emit: Функция, получающая очередной фрагмент текста
+
+    Returns:
+        Кортеж из полного текста ответа и finish_reason
+    """
+    use_cache = LLM_CACHE.enabled()
+    if use_cache:
+        cache_key = LLM_CACHE.make_key(model, temperature, messages)
+        cached = await asyncio.to_thread(LLM_CACHE.get, cache_key)
+        if cached is not None:
+            emit(cached)
+            return cached, "stop"
+
+    # В режиме сбора пакета ответ выдаётся целиком, как из кэша
+    collector = batch_collector.get()
+    if collector is not None:
+        text, finish_reason = collector.resolve(
+            LLM_CACHE.make_key(model, temperature, messages),
+            {"model": model, "messages": messages, "temperature": temperature})
+        text = text or ""
+        emit(text)
+        if use_cache and finish_reason != "length":
+            await asyncio.to_thread(LLM_CACHE.put, cache_key, text)
+        return text, finish_reason
+
+    # Повторы при временных ошибках покрывают открытие потока; обрыв посреди потока
+    # передаётся вызывающему коду
+    stream = await acall_with_retry(
+        get_async_client().chat.completions.with_raw_response.create,
+        call_site=call_site,
+        cost=estimate_chat_cost(messages, model),
         model=model,
         messages=messages,
-        temperature=temp
+        temperature=temperature,
+        stream=True
     )
-    return completion.choices[0].message.content
+    parts = []
+    finish_reason = None
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.delta is not None and choice.delta.content:
+            parts.append(choice.delta.content)
+            emit(choice.delta.content)
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+    text = "".join(parts)
+    if use_cache and finish_reason != "length":
+        await asyncio.to_thread(LLM_CACHE.put, cache_key, text)
+    return text, finish_reason
+
+# Параллельные потоковые запросы с выдачей фрагментов в исходном порядке
+async def _stream_ordered(producers: List[Callable[[Callable[[str], None]], Awaitable[str]]],
+                          max_concurrency: int, separator: str = ""):
+    """
+    Запускает потоковые запросы параллельно (не более max_concurrency одновременно)
+    и выдаёт их фрагменты по порядку: фрагменты первого запроса - сразу по мере
+    генерации, следующих - из буфера, как только закончится предыдущий.
+
+    Args:
+        producers: Асинхронные функции; получают emit и возвращают итоговый текст своей части
+        max_concurrency: Максимальное количество одновременных запросов
+        separator: Разделитель частей
+
+    Yields:
+        Фрагменты текста, последним - FinalText с частями, склеенными через separator
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    queues = [asyncio.Queue() for _ in producers]
+    done = object()
+
+    async def run(producer, queue):
+        async with semaphore:
+            try:
+                return await producer(queue.put_nowait)
+            finally:
+                queue.put_nowait(done)
+
+    tasks = [asyncio.create_task(run(producer, queue)) for producer, queue in zip(producers, queues)]
+    try:
+        finals = []
+        for index, (task, queue) in enumerate(zip(tasks, queues)):
+            if index and separator:
+                yield separator
+            while (chunk := await queue.get()) is not done:
+                yield chunk
+            finals.append(await task)
+        yield FinalText(separator.join(finals))
+    finally:
+        # Отменяем незавершённые запросы (потребитель остановился или ошибка) и дожидаемся их остановки
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+# Получение ответа от модели по мере генерации, асинхронная версия
+async def generate_answer_stream_async(system: str, user: str, text: str, temp: float = 0.3, model: str = 'gpt-4o-mini'):
+    """
+    Потоковый вариант generate_answer_async: выдаёт фрагменты ответа по мере генерации.
+
+    Args:
+        system: Системное сообщение
+        user: Пользовательское сообщение
+        text: Текст для анализа
+        temp: Температура генерации
+        model: Модель для использования
+
+    Yields:
+        Фрагменты ответа, последним - FinalText с полным ответом
+    """
+    async def produce(emit):
+        answer, _ = await _stream_chat_async("generate_answer", model, _answer_messages(system, user, text), temp, emit)
+        return answer
+
+    async for chunk in _stream_ordered([produce], 1):
+        yield chunk
+
+# Получение ответа от модели по мере генерации
+def generate_answer_stream(system: str, user: str, text: str, temp: float = 0.3, model: str = 'gpt-4o-mini') -> TextStream:
+    """
+    Синхронная обёртка над generate_answer_stream_async. Полный ответ после
+    завершения итерации - в атрибуте text.
+    """
+    return TextStream(iterate_sync(generate_answer_stream_async(system, user, text, temp, model)))
+
+# Количество одновременных запросов к chat completions в рамках одной задачи
+# (общий лимит запросов и токенов соблюдает планировщик rate_limiter)
+CHAT_MAX_CONCURRENCY = 8
+# Количество попыток обработки одного чанка (поверх повторов при временных ошибках API)
+CHUNK_MAX_ATTEMPTS = 2
 
-# Обработка текстовых чанков по очереди
-def process_text_chunks(text_chunks: List[str], system: str, user: str) -> str:
+# Параллельная обработка элементов с сохранением порядка
+async def _map_ordered(func: Callable[[Any], Awaitable[Any]], items: List[Any], max_concurrency: int) -> List[Any]:
+    """
+    Применяет асинхронную функцию к элементам, выполняя не более max_concurrency
+    вызовов одновременно, и возвращает результаты в порядке элементов.
+    Ошибка передаётся вызывающему коду после завершения всех вызовов, чтобы
+    в фоне не оставалось запросов (и в режиме пакета собирались все запросы стадии).
+
+    Args:
+        func: Асинхронная функция одного элемента
+        items: Элементы
+        max_concurrency: Максимальное количество одновременных вызовов
+
+    Returns:
+        Список результатов в порядке элементов
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    results = await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+class ChunkProcessingError(Exception):
+    """
+    Текстовые чанки не обработаны моделью после всех попыток
+    """
+
+    def __init__(self, chunk_numbers: List[int], reason: str):
+        """
+        Args:
+            chunk_numbers: Номера необработанных чанков (с 1)
+            reason: Последняя ошибка
+        """
+        self.chunk_numbers = chunk_numbers
+        self.reason = reason
+        super().__init__(f"Не обработаны чанки {', '.join(map(str, chunk_numbers))}: {reason}")
+
+# Обработка одного текстового чанка с повторами
+async def _process_text_chunk_async(index: int, chunk: str, system: str, user: str, max_attempts: int,
+                                    model: str = 'gpt-4o-mini', temp: float = 0.3) -> str:
+    """
+    Обрабатывает чанк моделью; при ошибке повторяет обработку.
+
+    Args:
+        index: Номер чанка (для сообщений)
+        chunk: Текст чанка
+        system: Системное сообщение
+        user: Пользовательское сообщение
+        max_attempts: Количество попыток
+        model: Модель
+        temp: Температура генерации
+
+    Returns:
+        Ответ модели
+
+    Raises:
+        ChunkProcessingError: Все попытки не удались
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return await generate_answer_async(system, user, chunk, temp, model)
+        except BatchDeferred:
+            raise
+        except Exception as e:
+            logger.warning(f"Чанк {index}: попытка {attempt} из {max_attempts} не удалась: {e}")
+            error = e
+    raise ChunkProcessingError([index], str(error))
+
+# Параллельная обработка текстовых чанков, асинхронная версия
+async def process_text_chunks_async(text_chunks: List[str], system: str, user: str,
+                                    max_concurrency: int = CHAT_MAX_CONCURRENCY,
+                                    max_attempts: int = CHUNK_MAX_ATTEMPTS,
+                                    model: str = 'gpt-4o-mini', temp: float = 0.3) -> str:
     """
     Обрабатывает список текстовых чанков с помощью модели.
+    Чанки отправляются параллельно (не более max_concurrency запросов одновременно),
+    ответы собираются в исходном порядке. Чанк с ошибкой обрабатывается повторно;
+    если после всех попыток не обработан хотя бы один чанк, после завершения остальных
+    вызывается ChunkProcessingError с номерами всех необработанных чанков, чтобы
+    необработанный текст не попал в результат незаметно.
 
     Args:
         text_chunks: Список текстовых чанков
         system: Системное сообщение
         user: Пользовательское сообщение
+        max_concurrency: Количество одновременных запросов (1 - последовательно)
+        max_attempts: Количество попыток обработки одного чанка
+        model: Модель
+        temp: Температура генерации
 
     Returns:
         Обработанный текст
+
+    Raises:
+        ChunkProcessingError: Не обработаны некоторые чанки
     """
-    processed_text = ''
-    for chunk in text_chunks:
-        # Получение ответа от модели для каждого чанка
-        answer = generate_answer(system, user, chunk)
-        processed_text += f'{answer}\n\n'  # Добавляем ответ в результат
-    return processed_text
+    # Ответ чанка или ошибка (ошибки собираются, чтобы сообщить обо всех необработанных чанках)
+    async def process(item):
+        try:
+            return await _process_text_chunk_async(item[0], item[1], system, user, max_attempts, model, temp), None
+        except ChunkProcessingError as e:
+            return None, e
+
+    results = await _map_ordered(process, list(enumerate(text_chunks, start=1)), max_concurrency)
+    failed = [error for _, error in results if error is not None]
+    if failed:
+        chunk_numbers = [number for error in failed for number in error.chunk_numbers]
+        logger.error(f"Не обработаны чанки {chunk_numbers} из {len(text_chunks)}")
+        raise ChunkProcessingError(chunk_numbers, failed[-1].reason)
+    return "".join(f"{answer}\n\n" for answer, _ in results)
+
+# Обработка текстовых чанков
+def process_text_chunks(text_chunks: List[str], system: str, user: str,
+                        max_concurrency: int = CHAT_MAX_CONCURRENCY,
+                        max_attempts: int = CHUNK_MAX_ATTEMPTS,
+                        model: str = 'gpt-4o-mini', temp: float = 0.3) -> str:
+    """
+    Синхронная обёртка над process_text_chunks_async (аргументы и результат те же).
+    """
+    return run_sync(process_text_chunks_async(text_chunks, system, user, max_concurrency, max_attempts, model, temp))
 
-# Обработка каждого чанка (документа) для формирования методички
-def process_documents(save_folder_path: str, documents, system: str, user: str, original_filename: str = "transcript", target_language: str = "русский") -> str:
+# Потоковая обработка одного текстового чанка с повторами
+async def _process_text_chunk_stream_async(index: int, chunk: str, system: str, user: str, max_attempts: int,
+                                           emit: Callable[[str], None],
+                                           model: str = 'gpt-4o-mini', temp: float = 0.3) -> str:
+    """
+    Потоковый вариант _process_text_chunk_async: фрагменты ответа передаются в emit.
+    О неудачной попытке сообщается в потоке, уже выведенный текст этой попытки
+    в итоговый результат не попадает.
+
+    Returns:
+        Ответ модели (с завершающим переводом строки)
+
+    Raises:
+        ChunkProcessingError: Все попытки не удались
+    """
+    messages = _answer_messages(system, user, chunk)
+    for attempt in range(1, max_attempts + 1):
+        try:
+            answer, _ = await _stream_chat_async("generate_answer", model, messages, temp, emit)
+            emit("\n\n")
+            return f"{answer}\n\n"
+        except BatchDeferred:
+            raise
+        except Exception as e:
+            logger.warning(f"Чанк {index}: попытка {attempt} из {max_attempts} не удалась: {e}")
+            emit(f"\n\n[Чанк {index}: ошибка обработки, попытка {attempt} из {max_attempts}]\n\n")
+            error = e
+    raise ChunkProcessingError([index], str(error))
+
+# Параллельная обработка текстовых чанков по мере генерации, асинхронная версия
+async def process_text_chunks_stream_async(text_chunks: List[str], system: str, user: str,
+                                           max_concurrency: int = CHAT_MAX_CONCURRENCY,
+                                           max_attempts: int = CHUNK_MAX_ATTEMPTS,
+                                           model: str = 'gpt-4o-mini', temp: float = 0.3):
+    """
+    Потоковый вариант process_text_chunks_async: чанки обрабатываются параллельно,
+    ответы выдаются по мере генерации в исходном порядке чанков. Если чанк не
+    обработан после всех попыток, поток прерывается ChunkProcessingError.
+
+    Yields:
+        Фрагменты текста, последним - FinalText с тем же текстом, что вернула бы process_text_chunks_async
+    """
+    producers = [
+        lambda emit, index=index, chunk=chunk: _process_text_chunk_stream_async(
+            index, chunk, system, user, max_attempts, emit, model, temp)
+        for index, chunk in enumerate(text_chunks, start=1)
+    ]
+    async for chunk in _stream_ordered(producers, max_concurrency):
+        yield chunk
+
+# Обработка текстовых чанков по мере генерации
+def process_text_chunks_stream(text_chunks: List[str], system: str, user: str,
+                               max_concurrency: int = CHAT_MAX_CONCURRENCY,
+                               max_attempts: int = CHUNK_MAX_ATTEMPTS,
+                               model: str = 'gpt-4o-mini', temp: float = 0.3) -> TextStream:
+    """
+    Синхронная обёртка над process_text_chunks_stream_async. Итоговый текст после
+    завершения итерации - в атрибуте text.
+    """
+    return TextStream(iterate_sync(
+        process_text_chunks_stream_async(text_chunks, system, user, max_concurrency, max_attempts, model, temp)))
+
+# Обработка каждого чанка (документа) для формирования методички, асинхронная версия
+async def process_documents_async(save_folder_path: str, documents, system: str, user: str, original_filename: str = "transcript", target_language: str = "русский",
+                                  max_concurrency: int = CHAT_MAX_CONCURRENCY,
+                                  model: str = 'gpt-4o-mini', temp: float = 0.3) -> str:
     """
     Обрабатывает список документов и формирует методичку.
+    Разделы независимы, поэтому отправляются параллельно (не более max_concurrency
+    запросов одновременно, общий лимит соблюдает планировщик), а ответы
+    собираются в порядке разделов.
 
     Args:
         save_folder_path: Путь для сохранения результатов
@@ -324,34 +1484,426 @@ def process_documents(save_folder_path: str, documents, system: str, user: str,
         user: Пользовательское сообщение
         original_filename: Имя оригинального файла для формирования уникального имени
         target_language: Целевой язык для конспекта (русский, казахский, английский)
+        max_concurrency: Количество одновременных запросов (1 - последовательно)
+        model: Модель
+        temp: Температура генерации
 
     Returns:
         Текст методички
     """
-    processed_text_for_handbook = ""  # Строка для конкатенации обработанного текста
+    enhanced_system, enhanced_user = _handbook_prompts(system, user, target_language)
+
+    # Получаем ответы от модели для всех документов параллельно, в порядке документов
+    answers = await _map_ordered(
+        lambda document: generate_answer_async(enhanced_system, enhanced_user, document.page_content, temp, model),
+        list(documents),
+        max_concurrency
+    )
+    # Собираем обработанный текст одной операцией
+    processed_text_for_handbook = "".join(f"{answer}\n\n" for answer in answers)
+
+    _save_summary_draft(save_folder_path, original_filename, processed_text_for_handbook)
+    return processed_text_for_handbook
 
+# Системное и пользовательское сообщения для разделов методички
+def _handbook_prompts(system: str, user: str, target_language: str) -> Tuple[str, str]:
     # Получаем стандартную языковую инструкцию
     language_instruction = get_language_instruction(target_language)
 
-    # Для каждого документа обрабатываем отдельно с явным указанием языка
-    for document in documents:
-        # Усиливаем систему инструкцией языка для каждого отдельного документа
-        enhanced_system = f"{system}\n\nЭТО КРАЙНЕ ВАЖНО: {language_instruction}\nВесь текст, ВКЛЮЧАЯ ЗАГОЛОВКИ, должен быть только на {target_language} языке!"
-
-        # Усиливаем запрос инструкцией языка
-        enhanced_user = f"{user}\n\nВАЖНО: Весь текст должен быть ТОЛЬКО на {target_language} языке! Заголовки и всё содержание должны быть на {target_language}!"
+    # Усиливаем систему инструкцией языка для каждого отдельного документа
+    enhanced_system = f"{system}\n\nЭТО КРАЙНЕ ВАЖНО: {language_instruction}\nВесь текст, ВКЛЮЧАЯ ЗАГОЛОВКИ, должен быть только на {target_language} языке!"
 
-        # Получаем ответ от модели для каждого документа
-        answer = generate_answer(enhanced_system, enhanced_user, document.page_content)
-        # Добавляем обработанный текст в общую строку
-        processed_text_for_handbook += f"{answer}\n\n"
+    # Усиливаем запрос инструкцией языка
+    enhanced_user = f"{user}\n\nВАЖНО: Весь текст должен быть ТОЛЬКО на {target_language} языке! Заголовки и всё содержание должны быть на {target_language}!"
+    return enhanced_system, enhanced_user
 
+# Сохранение черновика методички
+def _save_summary_draft(save_folder_path: str, original_filename: str, text: str) -> None:
     # Записываем полученный текст во временный файл с уникальным именем
     result_path = os.path.join(save_folder_path, f'{original_filename}_summary_draft.txt')
     with open(result_path, 'w', encoding='utf-8') as f:
-        f.write(processed_text_for_handbook)
+        f.write(text)
 
-    return processed_text_for_handbook
+# Обработка каждого чанка (документа) для формирования методички
+def process_documents(save_folder_path: str, documents, system: str, user: str, original_filename: str = "transcript", target_language: str = "русский",
+                      max_concurrency: int = CHAT_MAX_CONCURRENCY,
+                      model: str = 'gpt-4o-mini', temp: float = 0.3) -> str:
+    """
+    Синхронная обёртка над process_documents_async (аргументы и результат те же).
+    """
+    return run_sync(process_documents_async(
+        save_folder_path, documents, system, user, original_filename, target_language, max_concurrency,
+        model, temp))
+
+# Формирование методички по мере генерации, асинхронная версия
+async def process_documents_stream_async(save_folder_path: str, documents, system: str, user: str,
+                                         original_filename: str = "transcript", target_language: str = "русский",
+                                         max_concurrency: int = CHAT_MAX_CONCURRENCY,
+                                         model: str = 'gpt-4o-mini', temp: float = 0.3):
+    """
+    Потоковый вариант process_documents_async: разделы обрабатываются параллельно,
+    текст выдаётся по мере генерации в порядке разделов. Черновик сохраняется
+    в тот же файл, что и у process_documents_async, после завершения всех разделов.
+
+    Yields:
+        Фрагменты текста, последним - FinalText с полным текстом методички
+    """
+    enhanced_system, enhanced_user = _handbook_prompts(system, user, target_language)
+
+    async def produce(document, emit):
+        messages = _answer_messages(enhanced_system, enhanced_user, document.page_content)
+        answer, _ = await _stream_chat_async("generate_answer", model, messages, temp, emit)
+        emit("\n\n")
+        return f"{answer}\n\n"
+
+    producers = [lambda emit, document=document: produce(document, emit) for document in documents]
+    async for chunk in _stream_ordered(producers, max_concurrency):
+        if isinstance(chunk, FinalText):
+            await asyncio.to_thread(_save_summary_draft, save_folder_path, original_filename, chunk.text)
+        yield chunk
+
+# Формирование методички по мере генерации
+def process_documents_stream(save_folder_path: str, documents, system: str, user: str,
+                             original_filename: str = "transcript", target_language: str = "русский",
+                             max_concurrency: int = CHAT_MAX_CONCURRENCY,
+                             model: str = 'gpt-4o-mini', temp: float = 0.3) -> TextStream:
+    """
+    Синхронная обёртка над process_documents_stream_async. Текст методички после
+    завершения итерации - в атрибуте text.
+    """
+    return TextStream(iterate_sync(process_documents_stream_async(
+        save_folder_path, documents, system, user, original_filename, target_language, max_concurrency,
+        model, temp)))
+
+# Бюджет итогового конспекта в токенах: длиннее конспект сворачивается по уровням
+HANDBOOK_MAX_TOKENS = 4000
+# Тексты длиннее этого (в токенах) конспектируются иерархически (summarize_documents_tree)
+HANDBOOK_TREE_MIN_TOKENS = 16000
+# Во сколько раз не более сжимается текст за один уровень свёртки
+SUMMARY_REDUCE_FACTOR = 4
+# Максимальное количество уровней свёртки
+SUMMARY_MAX_LEVELS = 4
+# Минимальный бюджет ответа одной свёртки (в токенах)
+SUMMARY_MIN_TOKENS = 300
+# Примерное количество слов на токен (длина ответа задаётся в промпте в словах)
+SUMMARY_WORDS_PER_TOKEN = 0.5
+
+# Группировка последовательных элементов по бюджету токенов
+def _group_by_tokens(tokens: List[int], max_tokens: int) -> List[List[int]]:
+    """
+    Объединяет подряд идущие элементы в группы не длиннее max_tokens токенов
+    (элемент длиннее бюджета образует отдельную группу)
+
+    Args:
+        tokens: Количество токенов каждого элемента
+        max_tokens: Бюджет группы
+
+    Returns:
+        Список групп (индексов элементов)
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+    for index, count in enumerate(tokens):
+        if current and current_tokens + count > max_tokens:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(index)
+        current_tokens += count
+    if current:
+        groups.append(current)
+    return groups
+
+# Системное и пользовательское сообщения свёртки конспектов
+def _reduce_prompts(target_language: str, words: int) -> Tuple[str, str]:
+    language_instruction = get_language_instruction(target_language)
+    system = f"""Ты гений копирайтинга. Ты получаешь несколько последовательных разделов конспекта одного материала.
+Объедини их в один сжатый конспект: сохрани ключевые факты, определения, цифры и выводы, убери повторы и второстепенные детали.
+ОЧЕНЬ ВАЖНО: {language_instruction}"""
+    user = f"""Сожми данные разделы конспекта в единый конспект длиной не более {words} слов. Сохрани порядок изложения,
+объедини близкие по смыслу разделы и не придумывай ничего от себя. Ответ нужен в формате:
+## Название раздела, и далее сжатое содержание. Используй маркдаун-разметку для выделения важных моментов.
+Весь ответ должен быть на {target_language} языке. Разделы конспекта:"""
+    return system, user
+
+# Иерархическая свёртка конспектов до бюджета токенов, асинхронная версия
+async def reduce_summaries_async(summaries: List[str], target_language: str = "русский",
+                                 max_output_tokens: int = HANDBOOK_MAX_TOKENS,
+                                 reduce_input_tokens: int = TEXT_CHUNK_MAX_TOKENS,
+                                 max_concurrency: int = CHAT_MAX_CONCURRENCY) -> str:
+    """
+    Сворачивает конспекты частей текста в конспект не длиннее max_output_tokens
+    (reduce-шаг map-reduce). На каждом уровне подряд идущие конспекты объединяются
+    в группы не длиннее reduce_input_tokens, группы сжимаются параллельно. Уровень
+    сжимает текст не более чем в SUMMARY_REDUCE_FACTOR раз и не ниже итогового
+    бюджета, поэтому глубина дерева - логарифм отношения длины конспектов к бюджету.
+    Если конспекты уже укладываются в бюджет, запросов не выполняется.
+
+    Args:
+        summaries: Конспекты частей в порядке текста
+        target_language: Целевой язык конспекта
+        max_output_tokens: Бюджет итогового конспекта (в токенах)
+        reduce_input_tokens: Бюджет входа одной свёртки (в токенах)
+        max_concurrency: Количество одновременных запросов
+
+    Returns:
+        Итоговый конспект
+    """
+    level = [summary.strip() for summary in summaries if summary and summary.strip()]
+    tokens = [num_tokens_from_string(summary) for summary in level]
+
+    for depth in range(1, SUMMARY_MAX_LEVELS + 1):
+        total = sum(tokens)
+        if total <= max_output_tokens:
+            break
+        level_budget = max(max_output_tokens, total // SUMMARY_REDUCE_FACTOR)
+        groups = _group_by_tokens(tokens, reduce_input_tokens)
+        print(f"Свёртка конспекта, уровень {depth}: {len(level)} частей, {total} токенов -> "
+              f"{len(groups)} частей, бюджет {level_budget} токенов")
+
+        # Бюджет группы пропорционален её доле в тексте уровня
+        async def reduce_group(group: List[int]) -> str:
+            group_budget = max(SUMMARY_MIN_TOKENS, level_budget * sum(tokens[i] for i in group) // total)
+            system, user = _reduce_prompts(target_language, int(group_budget * SUMMARY_WORDS_PER_TOKEN))
+            return await generate_answer_async(system, user, "\n\n".join(level[i] for i in group))
+
+        answers = await _map_ordered(reduce_group, groups, max_concurrency)
+        reduced = [answer.strip() for answer in answers if answer and answer.strip()]
+        reduced_tokens = [num_tokens_from_string(summary) for summary in reduced]
+        # Уровень, который не сократил текст, отбрасывается, чтобы не зацикливаться
+        if sum(reduced_tokens) >= total:
+            print(f"Внимание: свёртка не сократила конспект ({sum(reduced_tokens)} токенов), свёртка остановлена")
+            break
+        level, tokens = reduced, reduced_tokens
+    else:
+        if sum(tokens) > max_output_tokens:
+            print(f"Внимание: после {SUMMARY_MAX_LEVELS} уровней конспект длиннее бюджета: {sum(tokens)} токенов")
+
+    return "".join(f"{summary}\n\n" for summary in level)
+
+# Иерархическая свёртка конспектов до бюджета токенов
+def reduce_summaries(summaries: List[str], target_language: str = "русский",
+                     max_output_tokens: int = HANDBOOK_MAX_TOKENS,
+                     reduce_input_tokens: int = TEXT_CHUNK_MAX_TOKENS,
+                     max_concurrency: int = CHAT_MAX_CONCURRENCY) -> str:
+    """
+    Синхронная обёртка над reduce_summaries_async (аргументы и результат те же).
+    """
+    return run_sync(reduce_summaries_async(
+        summaries, target_language, max_output_tokens, reduce_input_tokens, max_concurrency))
+
+# Формирование методички по дереву map-reduce, асинхронная версия
+async def summarize_documents_tree_async(save_folder_path: str, documents, system: str, user: str,
+                                         original_filename: str = "transcript", target_language: str = "русский",
+                                         max_output_tokens: int = HANDBOOK_MAX_TOKENS,
+                                         max_concurrency: int = CHAT_MAX_CONCURRENCY) -> str:
+    """
+    Формирует методичку ограниченного размера для длинного текста. Листья дерева -
+    конспекты разделов (те же запросы, что и в process_documents_async; раздел
+    длиннее TEXT_CHUNK_MAX_TOKENS делится на части) - выполняются параллельно,
+    затем конспекты сворачиваются по уровням до max_output_tokens (reduce_summaries_async).
+    Черновик сохраняется в тот же файл, что и у process_documents_async.
+
+    Args:
+        save_folder_path: Путь для сохранения черновика
+        documents: Список документов (разделов)
+        system: Системное сообщение конспекта раздела
+        user: Пользовательское сообщение конспекта раздела
+        original_filename: Имя оригинального файла для формирования уникального имени
+        target_language: Целевой язык конспекта
+        max_output_tokens: Бюджет итоговой методички (в токенах)
+        max_concurrency: Количество одновременных запросов
+
+    Returns:
+        Текст методички
+    """
+    enhanced_system, enhanced_user = _handbook_prompts(system, user, target_language)
+
+    leaves = []
+    for document in documents:
+        if num_tokens_from_string(document.page_content) > TEXT_CHUNK_MAX_TOKENS:
+            leaves.extend(split_text_by_tokens(document.page_content))
+        else:
+            leaves.append(document.page_content)
+    summaries = await _map_ordered(
+        lambda leaf: generate_answer_async(enhanced_system, enhanced_user, leaf),
+        leaves,
+        max_concurrency
+    )
+    handbook = await reduce_summaries_async(summaries, target_language, max_output_tokens,
+                                            max_concurrency=max_concurrency)
+
+    await asyncio.to_thread(_save_summary_draft, save_folder_path, original_filename, handbook)
+    return handbook
+
+# Формирование методички по дереву map-reduce
+def summarize_documents_tree(save_folder_path: str, documents, system: str, user: str,
+                             original_filename: str = "transcript", target_language: str = "русский",
+                             max_output_tokens: int = HANDBOOK_MAX_TOKENS,
+                             max_concurrency: int = CHAT_MAX_CONCURRENCY) -> str:
+    """
+    Синхронная обёртка над summarize_documents_tree_async (аргументы и результат те же).
+    """
+    return run_sync(summarize_documents_tree_async(
+        save_folder_path, documents, system, user, original_filename, target_language,
+        max_output_tokens, max_concurrency))
+
+# Максимальная длина единицы разбивки на разделы (предложения) в токенах
+SECTION_UNIT_MAX_TOKENS = 200
+# Количество попыток получить корректную структуру разделов для части текста
+SECTION_MAX_ATTEMPTS = 2
+
+# Разбиение текста на пронумерованные единицы для поиска разделов
+def _section_units(text: str, model: str = 'gpt-4o-mini') -> List[str]:
+    """
+    Делит текст на предложения (слишком длинные, например в транскрипции без знаков
+    препинания, - по словам). Пробелы относятся к началу следующего предложения,
+    поэтому склейка единиц в точности восстанавливает текст.
+
+    Args:
+        text: Исходный текст
+        model: Модель, для которой считаются токены
+
+    Returns:
+        Список единиц текста
+    """
+    encoding = get_encoding(model)
+    parts = [part for part in _SENTENCE_BOUNDARY.split(text) if part]
+    units = []
+    for part, tokens in zip(parts, encoding.encode_ordinary_batch(parts)):
+        if not part.strip() and units:
+            units[-1] += part
+        elif len(tokens) <= SECTION_UNIT_MAX_TOKENS:
+            units.append(part)
+        else:
+            words = [word for word in _WORD_BOUNDARY.split(part) if word]
+            current = ""
+            current_tokens = 0
+            for word, word_tokens in zip(words, encoding.encode_ordinary_batch(words)):
+                if current and current_tokens + len(word_tokens) > SECTION_UNIT_MAX_TOKENS:
+                    units.append(current)
+                    current = ""
+                    current_tokens = 0
+                current += word
+                current_tokens += len(word_tokens)
+            if current:
+                units.append(current)
+    return units
+
+# Системное и пользовательское сообщения поиска границ разделов
+def _section_prompts(target_language: str) -> Tuple[str, str]:
+    language_instruction = get_language_instruction(target_language)
+    system = f"""Ты гений текста и редактуры. Ты получаешь текст, разбитый на пронумерованные предложения.
+Распознай смысловые разделы текста и дай каждому разделу короткое название по смыслу. {language_instruction}
+Текст не переписывай: нужны только названия разделов и номера предложений, с которых они начинаются."""
+    user = """Верни только JSON без пояснений в формате:
+{"sections": [{"title": "Название раздела", "start": номер первого предложения раздела}]}
+Перечисли разделы по порядку, первый раздел начинается с первого предложения текста. Текст:"""
+    return system, user
+
+# Разбор ответа с границами разделов
+def _parse_section_starts(answer: str, first: int, last: int) -> List[Tuple[int, str]]:
+    """
+    Извлекает из ответа модели начала разделов: номера предложений в пределах
+    [first, last] с непустыми названиями
+
+    Args:
+        answer: Ответ модели (JSON, возможно, в блоке кода)
+        first: Номер первого предложения части текста
+        last: Номер последнего предложения части текста
+
+    Returns:
+        Отсортированный список (номер предложения, название); пустой, если ответ некорректен
+    """
+    match = re.search(r"\{.*\}", answer or "", re.S)
+    if not match:
+        return []
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return []
+    sections = data.get("sections") if isinstance(data, dict) else None
+    if not isinstance(sections, list):
+        return []
+    starts = {}
+    for section in sections:
+        if not isinstance(section, dict):
+            continue
+        try:
+            start = int(section.get("start"))
+        except (TypeError, ValueError):
+            continue
+        # Название - одна строка без символов разметки заголовков
+        title = " ".join(str(section.get("title") or "").replace("#", " ").split())
+        if first <= start <= last and title and start not in starts:
+            starts[start] = title
+    return sorted(starts.items())
+
+# Разбивка текста на разделы по границам, найденным моделью, асинхронная версия
+async def section_text_async(text: str, target_language: str = "русский", model: str = 'gpt-4o-mini',
+                             max_tokens: int = TEXT_CHUNK_MAX_TOKENS,
+                             max_concurrency: int = CHAT_MAX_CONCURRENCY) -> str:
+    """
+    Разбивает текст на разделы с заголовками "## Название". Модель получает
+    пронумерованные предложения и возвращает только названия разделов и номера
+    предложений, с которых они начинаются; Markdown собирается локально из исходного
+    текста. Поэтому ответ на порядки короче текста, а текст не может быть потерян
+    или изменён моделью. Длинный текст делится на части по max_tokens (нумерация
+    общая), части обрабатываются параллельно; если часть начинается не с нового
+    раздела, её начало продолжает раздел предыдущей части.
+
+    Args:
+        text: Исходный текст
+        target_language: Язык названий разделов
+        model: Модель
+        max_tokens: Бюджет пронумерованного текста одного запроса (в токенах)
+        max_concurrency: Количество одновременных запросов
+
+    Returns:
+        Текст в формате Markdown для split_markdown_text
+    """
+    units = _section_units(text, model)
+    if not units:
+        return ""
+    lines = [f"[{number}] {' '.join(unit.split())}" for number, unit in enumerate(units, start=1)]
+    groups = _group_by_tokens([len(tokens) for tokens in get_encoding(model).encode_ordinary_batch(lines)],
+                              max_tokens)
+    system, user = _section_prompts(target_language)
+
+    # Начала разделов в одной части текста
+    async def find_starts(group: List[int]) -> List[Tuple[int, str]]:
+        first, last = group[0] + 1, group[-1] + 1
+        messages = _answer_messages(system, user, "\n".join(lines[index] for index in group))
+        max_attempts = _refresh_attempts(SECTION_MAX_ATTEMPTS)
+        for attempt in range(1, max_attempts + 1):
+            answer = await _chat_completion_async("section_text", model, messages, 0.3, refresh=attempt > 1)
+            starts = _parse_section_starts(answer, first, last)
+            if starts:
+                return starts
+            print(f"Предложения {first}-{last}: некорректная структура разделов, "
+                  f"попытка {attempt} из {max_attempts}")
+        # Часть остаётся одним разделом, названным по началу текста
+        print(f"Внимание: предложения {first}-{last} оставлены одним разделом")
+        return [(first, " ".join(units[first - 1].replace("#", " ").split()[:8]))]
+
+    starts = [start for part in await _map_ordered(find_starts, groups, max_concurrency) for start in part]
+    # Предложения перед первым найденным разделом относятся к нему
+    starts[0] = (1, starts[0][1])
+    print(f"Текст разбит на разделы: {len(starts)} (предложений: {len(units)})")
+
+    ends = [start for start, _ in starts[1:]] + [len(units) + 1]
+    return "".join(f"## {title}\n\n{''.join(units[start - 1:end - 1]).strip()}\n\n"
+                   for (start, title), end in zip(starts, ends))
+
+# Разбивка текста на разделы по границам, найденным моделью
+def section_text(text: str, target_language: str = "русский", model: str = 'gpt-4o-mini',
+                 max_tokens: int = TEXT_CHUNK_MAX_TOKENS,
+                 max_concurrency: int = CHAT_MAX_CONCURRENCY) -> str:
+    """
+    Синхронная обёртка над section_text_async (аргументы и результат те же).
+    """
+    return run_sync(section_text_async(text, target_language, model, max_tokens, max_concurrency))
 
 # Вспомогательная функция для получения языковой инструкции
 def get_language_instruction(target_language: str) -> str:
@@ -461,7 +2013,9 @@ def generate_db_answer(query: str, db_index, k: int = 3, verbose: bool = True, m
         {"role": "user", "content": f'Вопрос пользователя: {query}'}
     ]
 
-    response = openai.chat.completions.create(
+    response = call_with_retry(
+        openai.chat.completions.create,
+        call_site="generate_db_answer",
         model=model,
         messages=messages,
         temperature=temp
@@ -641,7 +2195,7 @@ def markdown_to_docx(markdown_text: str, file_path: str) -> None:
     doc.save(file_path)
     print(f"Документ с форматированием Streamlit сохранен: {file_path}")
 
-def format_transcription_paragraphs(text: str, model: str = 'gpt-4o-mini') -> str:
+async def format_transcription_paragraphs_async(text: str, model: str = 'gpt-4o-mini') -> str:
     """
     Форматирует транскрибацию на абзацы с помощью ChatGPT, не изменяя сам текст.
     Args:
@@ -650,7 +2204,18 @@ def format_transcription_paragraphs(text: str, model: str = 'gpt-4o-mini') -> st
     Returns:
         Текст с разбивкой на абзацы
     """
-    import openai
+    messages = _paragraph_messages(text)
+    response = await _chat_completion_async("format_transcription_paragraphs", model, messages, 0.1)
+    return response.strip()
+
+def format_transcription_paragraphs(text: str, model: str = 'gpt-4o-mini') -> str:
+    """
+    Синхронная обёртка над format_transcription_paragraphs_async (аргументы и результат те же).
+    """
+    return run_sync(format_transcription_paragraphs_async(text, model))
+
+# Сообщения запроса разбивки на абзацы
+def _paragraph_messages(text: str) -> List[Dict[str, str]]:
     system = (
         "Ты профессиональный редактор. Тебе дан текст транскрибации, в котором нет абзацев. "
         "Разбей его на абзацы так, чтобы текст выглядел читабельно и удобно для восприятия. "
@@ -660,98 +2225,193 @@ def format_transcription_paragraphs(text: str, model: str = 'gpt-4o-mini') -> st
         "Разбей этот текст на абзацы, чтобы он выглядел как связный, аккуратно оформленный текст. "
         "Не меняй и не сокращай сам текст, только оформи абзацы. Текст:\n" + text
     )
-    response = openai.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user}
-        ],
-        temperature=0.1
-    )
-    return response.choices[0].message.content.strip()
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user}
+    ]
 
-def translate_text_gpt(text: str, target_language: str, model: str = 'gpt-4o-mini') -> str:
+# Разбивка транскрибации на абзацы по мере генерации, асинхронная версия
+async def format_transcription_paragraphs_stream_async(text: str, model: str = 'gpt-4o-mini'):
     """
-    Переводит текст на целевой язык с помощью GPT-4o-mini.
-    Args:
-        text: Исходный текст
-        target_language: Язык перевода ("русский", "казахский", "английский")
-        model: Модель OpenAI для перевода
-    Returns:
-        Переведённый текст
+    Потоковый вариант format_transcription_paragraphs_async.
+
+    Yields:
+        Фрагменты текста, последним - FinalText с тем же текстом, что вернула бы format_transcription_paragraphs_async
     """
+    async def produce(emit):
+        response, _ = await _stream_chat_async(
+            "format_transcription_paragraphs", model, _paragraph_messages(text), 0.1, emit)
+        return response.strip()
+
+    async for chunk in _stream_ordered([produce], 1):
+        yield chunk
+
+def format_transcription_paragraphs_stream(text: str, model: str = 'gpt-4o-mini') -> TextStream:
+    """
+    Синхронная обёртка над format_transcription_paragraphs_stream_async. Итоговый
+    текст после завершения итерации - в атрибуте text.
+    """
+    return TextStream(iterate_sync(format_transcription_paragraphs_stream_async(text, model)))
+
+# Минимальное отношение длины перевода к длине исходного фрагмента (в символах);
+# более короткий перевод считается обрезанным и запрашивается повторно
+TRANSLATION_MIN_LENGTH_RATIO = 0.5
+# Количество попыток перевода одного фрагмента
+TRANSLATION_MAX_ATTEMPTS = 3
+
+# Название языка перевода для промпта
+def _translation_language(target_language: str) -> str:
     language_map = {
         "русский": "Russian",
         "казахский": "Kazakh",
         "английский": "English"
     }
-    lang = language_map.get(target_language.lower(), target_language)
+    return language_map.get(target_language.lower(), target_language)
+
+# Сообщения запроса перевода фрагмента
+def _translation_messages(piece: str, lang: str) -> List[Dict[str, str]]:
     system = f"Ты профессиональный переводчик. Переведи текст на {lang}. Сохрани структуру и смысл. Не добавляй ничего от себя."
-    user = f"Переведи на {lang}:\n{text}"
-    response = openai.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user}
-        ],
-        temperature=0.1
-    )
-    return response.choices[0].message.content.strip()
+    user = f"Переведи на {lang}:\n{piece}"
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user}
+    ]
 
-def detect_language(text: str) -> str:
+# Разбиение текста для перевода на фрагменты по бюджету токенов
+def _translation_pieces(text: str, model: str, max_tokens: int) -> List[str]:
+    # Короткий текст переводится одним запросом, как и раньше
+    if num_tokens_from_string(text, model) <= max_tokens:
+        return [text]
+    pieces = split_text_by_tokens(text, max_tokens, model)
+    print(f"Текст для перевода разбит на {len(pieces)} частей")
+    return pieces
+
+# Перевод одного фрагмента с проверкой полноты ответа
+async def _translate_piece_async(piece: str, lang: str, model: str, max_tokens: int, refresh: bool = False) -> str:
     """
-    Определяет язык текста с большей точностью, используя несколько методов.
-    Поддерживает все языки, включая корейский, японский, китайский и другие.
+    Переводит фрагмент, не превышающий бюджет токенов. Если ответ обрезан по лимиту
+    вывода, фрагмент делится пополам и переводится по частям; если перевод
+    подозрительно короче исходного текста - запрашивается заново (мимо кэша).
 
     Args:
-        text: Текст для анализа
+        piece: Исходный фрагмент
+        lang: Язык перевода (название для промпта)
+        model: Модель OpenAI для перевода
+        max_tokens: Бюджет токенов фрагмента
+        refresh: Не читать ответ из кэша и на первой попытке (в кэше уже неполный перевод)
 
     Returns:
-        Код языка ("ru", "en", "kk", "ko" и др.)
+        Переведённый фрагмент
     """
-    from langdetect import detect, LangDetectException
+    messages = _translation_messages(piece, lang)
+    translated = None
+    max_attempts = _refresh_attempts(TRANSLATION_MAX_ATTEMPTS)
+    for attempt in range(1, max_attempts + 1):
+        try:
+            translated = (await _chat_completion_async(
+                "translate_text_gpt", model, messages, 0.1, require_complete=True,
+                refresh=refresh or attempt > 1)).strip()
+        except TruncatedCompletionError:
+            # Перевод не поместился в лимит вывода - переводим фрагмент половинами
+            halves = split_text_by_tokens(piece, max(1, max_tokens // 2), model)
+            if len(halves) > 1:
+                print(f"Перевод фрагмента обрезан, фрагмент разделён на {len(halves)} части")
+                parts = await asyncio.gather(
+                    *(_translate_piece_async(half, lang, model, max_tokens // 2) for half in halves))
+                return "\n\n".join(parts)
+            print(f"Перевод фрагмента обрезан (попытка {attempt} из {max_attempts})")
+            continue
 
-    # Проверка на пустой текст
-    if not text or text.strip() == "":
-        return "unknown"
+        if len(translated) >= len(piece) * TRANSLATION_MIN_LENGTH_RATIO:
+            return translated
+        print(f"Перевод фрагмента подозрительно короткий ({len(translated)} из {len(piece)} символов), "
+              f"попытка {attempt} из {max_attempts}")
 
-    # Использовать первые 1000 символов для более точного определения
-    sample_text = text[:1000] if len(text) > 1000 else text
+    if translated is None:
+        raise TruncatedCompletionError("translate_text_gpt")
+    print("Внимание: перевод фрагмента может быть неполным")
+    return translated
 
-    try:
-        # Пробуем определить язык с помощью langdetect
-        lang_code = detect(sample_text)
-
-        # Проверяем язык на некоторые известные проблемы определения
-        if lang_code == "ru" and any(eng_word in sample_text.lower() for eng_word in [
-            "the", "and", "you", "is", "are", "this", "that", "what", "where", "when", "how",
-            "fibonacci", "trend", "level", "market", "usd", "uptrend", "continue", "profit"]):
-            # Если обнаружены очевидные английские слова, но язык определился как русский
-            return "en"
-
-        # Определение корейского языка (проверка на наличие корейских символов)
-        if any('\uAC00' <= c <= '\uD7A3' for c in sample_text):
-            return "ko"
-
-        # Определение японского языка (проверка на наличие японских символов)
-        if any('\u3040' <= c <= '\u30FF' for c in sample_text):
-            return "ja"
-
-        # Другие корректировки при необходимости
-        if lang_code == "mk" and any(rus_word in sample_text.lower() for rus_word in [
-            "это", "привет", "спасибо", "пожалуйста", "да", "нет", "говорить", "русский"]):
-            # Македонский иногда путается с русским
-            return "ru"
-
-        return lang_code
-    except LangDetectException:
-        # В случае ошибки проверяем наличие символов определенных языков
-        if any('\uAC00' <= c <= '\uD7A3' for c in sample_text):  # Корейский
-            return "ko"
-        elif any('\u3040' <= c <= '\u30FF' for c in sample_text):  # Японский
-            return "ja"
-        elif any('\u4E00' <= c <= '\u9FFF' for c in sample_text):  # Китайский
-            return "zh"
-
-        # Если не удалось определить, возвращаем unknown
-        return "unknown"
+async def translate_text_gpt_async(text: str, target_language: str, model: str = 'gpt-4o-mini',
+                                   max_tokens: int = TEXT_CHUNK_MAX_TOKENS,
+                                   max_concurrency: int = CHAT_MAX_CONCURRENCY) -> str:
+    """
+    Переводит текст на целевой язык с помощью GPT-4o-mini.
+    Длинный текст делится по бюджету токенов на фрагменты по границам предложений,
+    фрагменты переводятся параллельно и собираются в исходном порядке.
+    Каждый перевод проверяется на обрезку (finish_reason и длина относительно исходника).
+    Args:
+        text: Исходный текст
+        target_language: Язык перевода ("русский", "казахский", "английский")
+        model: Модель OpenAI для перевода
+        max_tokens: Бюджет токенов одного фрагмента
+        max_concurrency: Количество одновременных запросов (1 - последовательно)
+    Returns:
+        Переведённый текст
+    """
+    lang = _translation_language(target_language)
+    pieces = _translation_pieces(text, model, max_tokens)
+    translations = await _map_ordered(
+        lambda piece: _translate_piece_async(piece, lang, model, max_tokens), pieces, max_concurrency)
+    return "\n\n".join(translations)
+
+def translate_text_gpt(text: str, target_language: str, model: str = 'gpt-4o-mini',
+                       max_tokens: int = TEXT_CHUNK_MAX_TOKENS,
+                       max_concurrency: int = CHAT_MAX_CONCURRENCY) -> str:
+    """
+    Синхронная обёртка над translate_text_gpt_async (аргументы и результат те же).
+    """
+    return run_sync(translate_text_gpt_async(text, target_language, model, max_tokens, max_concurrency))
+
+# Потоковый перевод одного фрагмента с проверкой полноты ответа
+async def _translate_piece_stream_async(piece: str, lang: str, model: str, max_tokens: int,
+                                        emit: Callable[[str], None]) -> str:
+    """
+    Переводит фрагмент, передавая перевод в emit по мере генерации. Если ответ
+    обрезан по лимиту вывода или подозрительно короткий, фрагмент переводится
+    заново через _translate_piece_async мимо кэша (короткий ответ уже сохранён в кэш
+    при потоковом запросе), а исправленный перевод выводится после пометки
+    и попадает в итоговый результат.
+
+    Returns:
+        Переведённый фрагмент
+    """
+    translated, finish_reason = await _stream_chat_async(
+        "translate_text_gpt", model, _translation_messages(piece, lang), 0.1, emit)
+    translated = translated.strip()
+    if finish_reason != "length" and len(translated) >= len(piece) * TRANSLATION_MIN_LENGTH_RATIO:
+        return translated
+    print("Потоковый перевод фрагмента неполон, фрагмент переводится повторно")
+    emit("\n\n[Перевод фрагмента неполон, исправленный перевод:]\n\n")
+    translated = await _translate_piece_async(piece, lang, model, max_tokens, refresh=True)
+    emit(translated)
+    return translated
+
+# Перевод текста по мере генерации, асинхронная версия
+async def translate_text_gpt_stream_async(text: str, target_language: str, model: str = 'gpt-4o-mini',
+                                          max_tokens: int = TEXT_CHUNK_MAX_TOKENS,
+                                          max_concurrency: int = CHAT_MAX_CONCURRENCY):
+    """
+    Потоковый вариант translate_text_gpt_async: фрагменты переводятся параллельно,
+    перевод выдаётся по мере генерации в исходном порядке фрагментов.
+
+    Yields:
+        Фрагменты перевода, последним - FinalText с итоговым переводом
+    """
+    lang = _translation_language(target_language)
+    producers = [
+        lambda emit, piece=piece: _translate_piece_stream_async(piece, lang, model, max_tokens, emit)
+        for piece in _translation_pieces(text, model, max_tokens)
+    ]
+    async for chunk in _stream_ordered(producers, max_concurrency, "\n\n"):
+        yield chunk
+
+def translate_text_gpt_stream(text: str, target_language: str, model: str = 'gpt-4o-mini',
+                              max_tokens: int = TEXT_CHUNK_MAX_TOKENS,
+                              max_concurrency: int = CHAT_MAX_CONCURRENCY) -> TextStream:
+    """
+    Синхронная обёртка над translate_text_gpt_stream_async. Итоговый перевод после
+    завершения итерации - в атрибуте text.
+    """
+    return TextStream(iterate_sync(
+        translate_text_gpt_stream_async(text, target_language, model, max_tokens, max_concurrency)))